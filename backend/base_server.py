@@ -1,17 +1,43 @@
 import os
 import shutil
 import logging
-from sd_utils import (Results, Region, calc_iou, merge_images,
-                      extract_images_from_video, merge_boxes_in_results,
-                      compute_area_of_frame, calc_area)
+import threading
+from contextlib import nullcontext
+from sd_utils import (Results, Region, calc_iou, merge_frames, crop_regions,
+                      decode_video_frames, merge_boxes_in_results,
+                      FrameCoverage, calc_area)
 from backend.object_detector import Detector
-from backend.image_processing import (perform_server_cleanup, reset_server_state, perform_detection, extract_images)
+from backend.inference_scheduler import InferenceScheduler
+from backend.image_processing import (perform_server_cleanup, reset_server_state, perform_detection, extract_images,
+                                      detect_in_batches)
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 import cv2 as cv
+class ClientSession:
+    # Progress of one client through the remote low/high query protocol. The
+    # state of a batch is kept from its low query until its high query, so a
+    # client can have several batches in flight; the lock guards only this
+    # bookkeeping and different batches run inference concurrently
+    def __init__(self, config):
+        self.config = config
+        # Clients send the frame count in their YAML config
+        nframes = config.get('nframes')
+        self.nframes = int(nframes) if nframes is not None else None
+        self.curr_fid = 0
+        self.last_start_fid = None
+        # start fid -> (regions requested by the low query, decoded low frames)
+        self.pending_batches = {}
+        self.lock = threading.Lock()
+
+
 class BaseServer:
-    def __init__(self, config, nframes=None):
+    def __init__(self, config, nframes=None, detector=None, query_slots=None):
         self.clients = {}
         self.clients[config['client_id']]=config
+        self.sessions = {config['client_id']: ClientSession(config)}
+        # Bounds the number of queries running inference at the same time,
+        # a semaphore passed in is shared with the servers of other videos
+        self.query_slots = query_slots if query_slots is not None else \
+            threading.BoundedSemaphore(config.get('max_concurrent_queries', 2))
         self.relevant_classes = config['relevant_classes']
         self.config = config
         self.logger = logging.getLogger("server")
@@ -20,16 +46,21 @@ class BaseServer:
 
         self.model_type = config['model_type']
         model_config = config['model']
-        self.detector = Detector(model_config)
+        # Either a Detector of its own or an InferenceScheduler shared with
+        # the servers of other videos
+        self.detector = detector if detector is not None else Detector(model_config)
 
         self.curr_fid = 0
         self.nframes = nframes
         self.last_requested_regions = None
+        # Decoded frames of the last low phase batch, keyed by fid
+        self.low_frames = {}
         self.logger.info(f"Server started")
 
     def add_client(self, config):
-        if config['client_id'] not in self.clients:
-            self.clients[config['client_id']] = config
+        # A client that initializes again starts over from the first frame
+        self.clients[config['client_id']] = config
+        self.sessions[config['client_id']] = ClientSession(config)
     def reset_state(self, nframes,client_id ):
         reset_server_state(nframes,client_id)
 
@@ -37,50 +68,75 @@ class BaseServer:
         perform_server_cleanup(client_id)
 
     def perform_detection(self, images_direc, resolution, fnames=None,
-                          images=None):
-        final_results = Results()
-        rpn_regions = Results()
-
-        if fnames is None:
+                          images=None, with_rpn=True):
+        if fnames is None and images is not None:
+            fnames = [self._get_image_path("", fid) for fid in sorted(images)]
+        elif fnames is None:
             fnames = sorted(os.listdir(images_direc))
         self.logger.info(f"Running inference on {len(fnames)} frames")
-        for fname in fnames:
-            if "jpg" not in fname:
-                continue
-            fid = int(fname.split(".")[0])
-            image = None
-            if images and fid in images:
-                image = images[fid]
-            else:
-                image_path = os.path.join(images_direc, fname)
-                image = cv.imread(image_path)
-            image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-
-            detection_results, rpn_results = (
-                self.detector.infer(image))
-            frame_with_no_results = True
-            for label, conf, (x, y, w, h) in detection_results:
-                if (self.config.min_object_size and
-                        w * h < self.config.min_object_size) or w * h == 0.0:
-                    continue
-                r = Region(fid, x, y, w, h, conf, label,
-                           resolution, origin="mpeg")
-                final_results.append(r)
-                frame_with_no_results = False
-            for label, conf, (x, y, w, h) in rpn_results:
-                r = Region(fid, x, y, w, h, conf, label,
-                           resolution, origin="generic")
-                rpn_regions.append(r)
-                frame_with_no_results = False
-            self.logger.debug(
-                f"Got {len(final_results)} results "
-                f"and {len(rpn_regions)} for {fname}")
-
-            if frame_with_no_results:
-                final_results.append(
-                    Region(fid, 0, 0, 0, 0, 0.1, "no obj", resolution))
-
-        return final_results, rpn_regions
+        fnames = [fname for fname in fnames if "jpg" in fname]
+        return detect_in_batches(images_direc, resolution, fnames, images,
+                                 self.detector, self.config, self.logger,
+                                 with_rpn)
+
+    def perform_region_detection(self, frames, req_regions, resolution):
+        # Runs the detector on the requested regions only, each crop being a
+        # separate input, and maps detections back to frame coordinates
+        final_results = Results()
+        crops = crop_regions(frames, req_regions)
+        batch_size = self.config.get('detection_batch_size', 8)
+        for start in range(0, len(crops), batch_size):
+            batch = crops[start:start + batch_size]
+            batch_results = self.detector.infer_batch(
+                [cv.cvtColor(crop, cv.COLOR_BGR2RGB) for _, crop, _ in batch],
+                with_rpn=False)
+            for (fid, _, (cx, cy, cw, ch)), (detection_results, _) in zip(
+                    batch, batch_results):
+                for label, conf, (x, y, w, h) in detection_results:
+                    x, y, w, h = cx + x * cw, cy + y * ch, w * cw, h * ch
+                    if (self.config.min_object_size and
+                            w * h < self.config.min_object_size) or w * h == 0.0:
+                        continue
+                    final_results.append(Region(fid, x, y, w, h, conf, label,
+                                                resolution, origin="mpeg"))
+        self.logger.info(f"Ran inference on {len(crops)} regions "
+                         f"of {len(frames)} frames")
+        return final_results
+
+    def _high_query_detections(self, high_frames, low_images_direc,
+                               req_regions, low_frames=None):
+        if self.config.get('high_query_mode', 'frame') == 'crops':
+            return self.perform_region_detection(
+                high_frames, req_regions, self.config.high_resolution)
+
+        low_frames = {fid: self._get_low_frame(low_images_direc, fid, low_frames)
+                      for fid in high_frames}
+        merged_images = merge_frames(high_frames, low_frames, req_regions)
+        results, _ = self.perform_detection(None, self.config.high_resolution, images=merged_images,
+                                            with_rpn=False)
+        return results
+
+    def _client_context(self, client_id):
+        if isinstance(self.detector, InferenceScheduler):
+            return self.detector.client(client_id)
+        return nullcontext()
+
+    def _get_image_path(self, images_direc, frame_id):
+        return os.path.join(images_direc,f"{str(frame_id).zfill(8)}.jpg")
+
+    def _decode_low_frames(self, images_direc, req_regions):
+        encoded_video = os.path.join(images_direc, "temp.mp4")
+        if not os.path.isfile(encoded_video):
+            return {}
+        return decode_video_frames(encoded_video, req_regions)
+
+    def _get_low_frame(self, images_direc, frame_id, low_frames=None):
+        # Frames decoded by the low phase, falling back to images on disk
+        if low_frames is None:
+            low_frames = self.low_frames
+        if frame_id in low_frames:
+            return low_frames[frame_id]
+        return cv.imread(self._get_image_path(images_direc, frame_id))
 
     def get_regions_to_query(self, rpn_regions, detections):
         req_regions = Results()
@@ -108,7 +164,7 @@ class BaseServer:
                 base_req_regions.append(
                     Region(fid, 0, 0, 1, 1, 1.0, 2,
                            self.config.high_resolution))
-            extract_images_from_video(images_direc, base_req_regions)
+            self.low_frames = self._decode_low_frames(images_direc, base_req_regions)
 
         batch_results = Results()
 
@@ -138,22 +194,16 @@ class BaseServer:
         regions_to_query = self.get_regions_to_query(rpn_regions, detections)
 
         return detections, regions_to_query
-    def simulate_high_query(self, vid_name, low_images_direc, req_regions):
-        images_direc = f"{vid_name}-cropped"
-        extract_images_from_video(images_direc, req_regions)
-
-        if not os.path.isdir(images_direc):
-            self.logger.error("Images directory was not found but the second iteration was called anyway")
-            return Results()
-        image_extension=get_image_extension(low_images_direc)
-        fnames = sorted([f for f in os.listdir(images_direc) if image_extension in f])
-        merged_images_direc = os.path.join(images_direc, "merged")
-        os.makedirs(merged_images_direc, exist_ok=True)
-        for img in fnames:
-            shutil.copy(os.path.join(images_direc, img), merged_images_direc)
-
-        merged_images = merge_images(merged_images_direc, low_images_direc, req_regions)
-        results, _ = self.perform_detection(merged_images_direc, self.config.high_resolution, fnames, merged_images)
+    def simulate_high_query(self, vid_name, low_images_direc, req_regions,
+                            encoded_video=None, low_frames=None):
+        if encoded_video is None:
+            encoded_video = os.path.join(f"{vid_name}-cropped", "temp.mp4")
+            if not os.path.isfile(encoded_video):
+                self.logger.error("Images directory was not found but the second iteration was called anyway")
+                return Results()
+        high_frames = decode_video_frames(encoded_video, req_regions)
+        results = self._high_query_detections(high_frames, low_images_direc,
+                                              req_regions, low_frames)
 
         results_with_detections_only = Results()
         for r in results.regions:
@@ -162,48 +212,49 @@ class BaseServer:
             results_with_detections_only.add_single_result(r, self.config.intersection_threshold)
 
         high_only_results = Results()
-        area_dict = {}
+        coverage_dict = {}
         for r in results_with_detections_only.regions:
             if r.fid in req_regions.regions_dict:
-                frame_regions = req_regions.regions_dict[r.fid]
-                regions_area = 0
-                if r.fid in area_dict:
-                    regions_area = area_dict[r.fid]
-                else:
-                    regions_area = compute_area_of_frame(frame_regions)
-                    area_dict[r.fid] = regions_area
-                regions_with_result = frame_regions + [r]
-                total_area = compute_area_of_frame(regions_with_result)
-                extra_area = total_area - regions_area
+                if r.fid not in coverage_dict:
+                    coverage_dict[r.fid] = FrameCoverage(req_regions.regions_dict[r.fid])
+                extra_area = coverage_dict[r.fid].extra_area(r)
                 if extra_area < 0.05 * calc_area(r):
                     r.origin = "high-res"
                     high_only_results.append(r)
 
-        shutil.rmtree(merged_images_direc)
         return results_with_detections_only
 
-    def perform_low_query(self, vid_data,client_id):
-        extract_images(vid_data,client_id)
-
-        start_fid = self.curr_fid
-        end_fid = min(self.curr_fid + self.clients[client_id].batch_size, len(self.nframes))
-        self.logger.info(f"Processing frames from {start_fid} to {end_fid}")
+    def perform_low_query(self, vid_data,client_id, start_fid=None):
+        # Without start_fid the batch follows the previous one of the client
+        session = self.sessions[client_id]
+        config = session.config
+        with session.lock:
+            if start_fid is None:
+                start_fid = session.curr_fid
+            end_fid = min(start_fid + config.batch_size, session.nframes)
+            session.curr_fid = max(session.curr_fid, end_fid)
+        self.logger.info(f"Processing frames from {start_fid} to {end_fid} for {client_id}")
         req_regions = Results()
         for fid in range(start_fid, end_fid):
-            req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.clients[client_id].low_resolution))
-        extract_images_from_video(f"server_temp_{client_id}", req_regions)
-        fnames = [f for f in os.listdir(f"server_temp_{client_id}") if "jpg" in f]
+            req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, config.low_resolution))
+        # Decoding starts while a streamed upload is still arriving
+        low_frames = decode_video_frames(vid_data, req_regions)
 
-        results, rpn = self.perform_detection(f"server_temp_{client_id}", self.clients[client_id].low_resolution, fnames)
+        with self.query_slots, self._client_context(client_id):
+            results, rpn = self.perform_detection(f"server_temp_{client_id}", config.low_resolution,
+                                                  images=low_frames)
         batch_results = Results()
-        batch_results.combine_results(results, self.clients[client_id].intersection_threshold)
+        batch_results.combine_results(results, config.intersection_threshold)
         batch_results = merge_boxes_in_results(batch_results.regions_dict, 0.3, 0.3)
-        batch_results.combine_results(rpn, self.clients[client_id].intersection_threshold)
+        batch_results.combine_results(rpn, config.intersection_threshold)
 
-        detections, regions_to_query = self.simulate_low_query(start_fid, end_fid, f"server_temp_{client_id}", batch_results.regions_dict, False, self.clients[client_id].rpn_enlarge_ratio, False)
+        detections, regions_to_query = self.simulate_low_query(start_fid, end_fid, f"server_temp_{client_id}", batch_results.regions_dict, False, config.rpn_enlarge_ratio, False)
 
-        self.last_requested_regions = regions_to_query
-        self.curr_fid = end_fid
+        with session.lock:
+            session.last_start_fid = start_fid
+            # Clients only send a high query for batches with requested regions
+            if len(regions_to_query) > 0:
+                session.pending_batches[start_fid] = (regions_to_query, low_frames)
 
         detections_list = []
         for r in detections.regions:
@@ -217,21 +268,25 @@ class BaseServer:
             "req_regions": req_regions_list
         }
 
-    def perform_high_query(self, file_data,client_id):
+    def perform_high_query(self, file_data,client_id, start_fid=None):
+        session = self.sessions[client_id]
         low_images_direc = f"server_temp_{client_id}"
-        cropped_images_direc = f"server_temp_{client_id}-cropped"
 
-        with open(os.path.join(cropped_images_direc, "temp.mp4"), "wb") as f:
-            f.write(file_data.read())
+        with session.lock:
+            if start_fid is None:
+                start_fid = session.last_start_fid
+            req_regions, low_frames = session.pending_batches.pop(start_fid, (Results(), {}))
 
-        results = self.simulate_high_query(low_images_direc, low_images_direc, self.last_requested_regions)
+        with self.query_slots, self._client_context(client_id):
+            results = self.simulate_high_query(low_images_direc, low_images_direc,
+                                               req_regions, file_data, low_frames)
+        self.perform_server_cleanup(client_id)
 
         results_list = []
         for r in results.regions:
             results_list.append([r.fid, r.x, r.y, r.w, r.h, r.conf, r.label])
 
-        self.perform_server_cleanup()
         return {
             "results": results_list,
             "req_region": []
-        }
\ No newline at end of file
+        }
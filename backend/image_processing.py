@@ -3,55 +3,63 @@ import shutil
 import cv2 as cv
 from sd_utils import (Results, extract_images_from_video, Region)
 from streamduet_utils import list_frames,get_images_length,get_image_extension
-def perform_server_cleanup():
-    for f in os.listdir("server_temp"):
-        os.remove(os.path.join("server_temp", f))
-    for f in os.listdir("server_temp-cropped"):
-        os.remove(os.path.join("server_temp-cropped", f))
+def perform_server_cleanup(client_id):
+    for direc in (f"server_temp_{client_id}", f"server_temp_{client_id}-cropped"):
+        if not os.path.isdir(direc):
+            continue
+        for f in os.listdir(direc):
+            os.remove(os.path.join(direc, f))
 
-def reset_server_state(nframes):
-    for f in os.listdir("server_temp"):
-        os.remove(os.path.join("server_temp", f))
-    for f in os.listdir("server_temp-cropped"):
-        os.remove(os.path.join("server_temp-cropped", f))
+def reset_server_state(nframes, client_id):
+    perform_server_cleanup(client_id)
 
-def perform_detection(images_direc, resolution, fnames, images, detector, config, logger):
-    final_results = Results()
-    rpn_regions = Results()
+def perform_detection(images_direc, resolution, fnames, images, detector, config, logger, with_rpn=True):
     image_extension=get_image_extension(images_direc)
     if fnames is None:
         fnames = sorted(os.listdir(images_direc))
     logger.info(f"Running inference on {len(fnames)} frames")
-    for fname in fnames:
-        if image_extension not in fname:
-            continue
-        fid = int(fname.split(".")[0])
-        if fid in images:
-            image = images[fid]
-        else:
-            image_path = os.path.join(images_direc, fname)
-            image = cv.imread(image_path)
-        image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+    fnames = [fname for fname in fnames if image_extension in fname]
+    return detect_in_batches(images_direc, resolution, fnames, images, detector, config, logger, with_rpn)
+
+def detect_in_batches(images_direc, resolution, fnames, images, detector, config, logger, with_rpn=True):
+    # Feeds the frames to the detector detection_batch_size at a time; frames
+    # missing from images are read from images_direc as their batch comes up
+    final_results = Results()
+    rpn_regions = Results()
+    batch_size = config.get('detection_batch_size', 8)
+    for start in range(0, len(fnames), batch_size):
+        batch_fids = []
+        batch_images = []
+        for fname in fnames[start:start + batch_size]:
+            fid = int(fname.split(".")[0])
+            if images and fid in images:
+                image = images[fid]
+            else:
+                image_path = os.path.join(images_direc, fname)
+                image = cv.imread(image_path)
+            batch_fids.append(fid)
+            batch_images.append(cv.cvtColor(image, cv.COLOR_BGR2RGB))
 
-        detection_results, rpn_results = detector.infer(image)
-        frame_with_no_results = True
-        for label, conf, (x, y, w, h) in detection_results:
-            if (config.min_object_size and w * h < config.min_object_size) or w * h == 0.0:
-                continue
-            r = Region(fid, x, y, w, h, conf, label, resolution, origin="mpeg")
-            final_results.append(r)
-            frame_with_no_results = False
-        for label, conf, (x, y, w, h) in rpn_results:
-            r = Region(fid, x, y, w, h, conf, label, resolution, origin="generic")
-            rpn_regions.append(r)
-            frame_with_no_results = False
-        logger.debug(f"Got {len(final_results)} results and {len(rpn_regions)} for {fname}")
+        batch_results = detector.infer_batch(batch_images, with_rpn)
+        for fid, (detection_results, rpn_results) in zip(batch_fids, batch_results):
+            frame_with_no_results = True
+            for label, conf, (x, y, w, h) in detection_results:
+                if (config.min_object_size and w * h < config.min_object_size) or w * h == 0.0:
+                    continue
+                r = Region(fid, x, y, w, h, conf, label, resolution, origin="mpeg")
+                final_results.append(r)
+                frame_with_no_results = False
+            for label, conf, (x, y, w, h) in rpn_results:
+                r = Region(fid, x, y, w, h, conf, label, resolution, origin="generic")
+                rpn_regions.append(r)
+                frame_with_no_results = False
+            logger.debug(f"Got {len(final_results)} results and {len(rpn_regions)} for {fid}")
 
-        if frame_with_no_results:
-            final_results.append(Region(fid, 0, 0, 0, 0, 0.1, "no obj", resolution))
+            if frame_with_no_results:
+                final_results.append(Region(fid, 0, 0, 0, 0, 0.1, "no obj", resolution))
 
     return final_results, rpn_regions
 
-def extract_images(vid_data):
-    with open(os.path.join("server_temp", "temp.mp4"), "wb") as f:
+def extract_images(vid_data, client_id):
+    with open(os.path.join(f"server_temp_{client_id}", "temp.mp4"), "wb") as f:
         f.write(vid_data.read())
\ No newline at end of file
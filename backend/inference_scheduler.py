@@ -0,0 +1,113 @@
+import time
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+# Shares one detector between the servers of all clients. infer_batch has the
+# signature of Detector.infer_batch so a scheduler can stand in for the
+# detector of a server: frames submitted by concurrent queries are grouped
+# into batches of up to max_batch_size frames, waiting at most max_wait
+# seconds for a batch to fill, run once and handed back to each caller
+class InferenceScheduler:
+    def __init__(self, detector, max_batch_size=8, max_wait=0.01):
+        self.logger = logging.getLogger("inference_scheduler")
+        handler = logging.NullHandler()
+        self.logger.addHandler(handler)
+
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = []
+        self.cond = threading.Condition()
+        self.local = threading.local()
+        self.queue_depth = defaultdict(int)
+        self.batches = 0
+        self.frames = 0
+        self.running = True
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    @contextmanager
+    def client(self, client_id):
+        # Frames submitted from this thread are accounted to client_id
+        previous = getattr(self.local, "client_id", None)
+        self.local.client_id = client_id
+        try:
+            yield self
+        finally:
+            self.local.client_id = previous
+
+    def infer_batch(self, images, with_rpn=True):
+        client_id = getattr(self.local, "client_id", None)
+        futures = []
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Inference scheduler was shut down")
+            for image in images:
+                future = Future()
+                self.queue.append((client_id, image, with_rpn, future))
+                futures.append(future)
+            self.queue_depth[client_id] += len(images)
+            self.cond.notify()
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        with self.cond:
+            while self.running and not self.queue:
+                self.cond.wait()
+            if not self.queue:
+                return []
+            deadline = time.time() + self.max_wait
+            while len(self.queue) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.running:
+                    break
+                self.cond.wait(remaining)
+
+            # Frames that need RPN output can only share a call with each other
+            with_rpn = self.queue[0][2]
+            batch = [e for e in self.queue if e[2] == with_rpn][:self.max_batch_size]
+            taken = set(map(id, batch))
+            self.queue = [e for e in self.queue if id(e) not in taken]
+            for client_id, _, _, _ in batch:
+                self.queue_depth[client_id] -= 1
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                results = self.detector.infer_batch(
+                    [image for _, image, _, _ in batch], batch[0][2])
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, _, future), result in zip(batch, results):
+                future.set_result(result)
+            with self.cond:
+                self.batches += 1
+                self.frames += len(batch)
+            self.logger.debug(f"Ran a batch of {len(batch)} frames")
+
+    def metrics(self):
+        with self.cond:
+            return {
+                "queue_depth": {str(k): v for k, v in self.queue_depth.items()},
+                "batches": self.batches,
+                "frames": self.frames,
+                "batch_fill": (self.frames / (self.batches * self.max_batch_size)
+                               if self.batches else 0.0)
+            }
+
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.worker.join()
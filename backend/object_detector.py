@@ -20,26 +20,30 @@ class Detector:
 
         self.logger.info(f"{model_type} model loaded")
 
-    def infer(self, image):
-
-        results, results_rpn = self.model.infer(image)
-        height, width = image.shape[:2]
-
-        normalized_detections = []
-        normalized_rpn = []
-
-        for class_label, conf, (x, y, w, h) in results:
+    def _normalize(self, detections, width, height):
+        normalized = []
+        for class_label, conf, (x, y, w, h) in detections:
             x /= width
             w /= width
             y /= height
             h /= height
-            normalized_detections.append((class_label, conf, (x, y, w, h)))
+            normalized.append((class_label, conf, (x, y, w, h)))
+        return normalized
 
-        for class_label, conf, (x, y, w, h) in results_rpn:
-            x /= width
-            w /= width
-            y /= height
-            h /= height
-            normalized_rpn.append((class_label, conf, (x, y, w, h)))
+    def infer(self, image):
+
+        results, results_rpn = self.model.infer(image)
+        height, width = image.shape[:2]
 
-        return normalized_detections, normalized_rpn
\ No newline at end of file
+        return (self._normalize(results, width, height),
+                self._normalize(results_rpn, width, height))
+
+    def infer_batch(self, images, with_rpn=True):
+        # One (detections, rpn) pair per image, in input order
+        batch_results = self.model.infer_batch(images, with_rpn)
+        outputs = []
+        for image, (results, results_rpn) in zip(images, batch_results):
+            height, width = image.shape[:2]
+            outputs.append((self._normalize(results, width, height),
+                            self._normalize(results_rpn, width, height)))
+        return outputs
@@ -4,16 +4,21 @@ import threading
 
 
 
-from flask import Flask, request, jsonify
-from sd_utils import ServerConfig,remove_before_first_underscore
+from flask import Flask, Response, request, jsonify, abort
+from sd_utils import ServerConfig,remove_before_first_underscore,pack_region_lists,REGIONS_MIMETYPE,DecodingError
 # import json
 import yaml
 from backend.server import *
+from backend.inference_scheduler import InferenceScheduler
 from munch import Munch
 app = Flask(__name__)
 servers = {}
 clients = {}
 lock = threading.Lock()
+# One detector behind a batching scheduler, shared by the servers of all videos
+scheduler = None
+# Bounds the queries running inference at the same time over all servers
+query_slots = None
 def construct_munch(loader, node):
     # 构造一个 Munch 对象
     data = loader.construct_mapping(node)
@@ -29,17 +34,23 @@ def initialize_server():
     args = yaml.safe_load(request.data)
     client_id = args["client_id"]
     server_id = remove_before_first_underscore(args['video_name'])
-    if client_id not in clients:
-        clients[client_id]=(args,server_id)
-        os.makedirs(f"server_temp_{client_id}", exist_ok=True)
-        os.makedirs(f"server_temp_{client_id}-cropped", exist_ok=True)
-    global servers
+    global servers, scheduler, query_slots
     with lock:
+        if client_id not in clients:
+            os.makedirs(f"server_temp_{client_id}", exist_ok=True)
+            os.makedirs(f"server_temp_{client_id}-cropped", exist_ok=True)
+        clients[client_id]=(args,server_id)
         if server_id not in servers:
             logging.basicConfig(
                 format="%(name)s -- %(levelname)s -- %(lineno)s -- %(message)s",
                 level="INFO")
-            servers[server_id] = Server(args, args["nframes"])
+            if scheduler is None:
+                scheduler = InferenceScheduler(Detector(args['model']),
+                                               args.get('detection_batch_size', 8),
+                                               args.get('batch_deadline', 0.01))
+                query_slots = threading.BoundedSemaphore(
+                    args.get('max_concurrent_queries', 2))
+            servers[server_id] = Server(args, args["nframes"], scheduler, query_slots)
             # os.makedirs(f"server_temp_{client_id}", exist_ok=True)
             # os.makedirs(f"server_temp_{client_id}-cropped", exist_ok=True)
             return jsonify({"status": "New Init", "client_id": client_id, "server_id": server_id})
@@ -48,19 +59,47 @@ def initialize_server():
             # servers[server_id].reset_state(int(args["nframes"]), client_id)
             return jsonify({"status": "Reset", "client_id": client_id, "server_id": server_id})
 
-@app.route("/low/<client_id>", methods=["POST"])
-def low_query(client_id):
-    file_data = request.files["media"]
+@app.errorhandler(DecodingError)
+def decoding_failed(e):
+    # A corrupt upload fails its own query only
+    return jsonify({"error": str(e)}), 400
+
+@app.route("/metrics")
+def metrics():
+    if scheduler is None:
+        return jsonify({})
+    return jsonify(scheduler.metrics())
+
+def get_server(client_id):
+    if client_id not in clients:
+        abort(404, f"Client {client_id} was not initialized")
     args, server_id = clients[client_id]
-    results = servers[server_id].perform_low_query(file_data,client_id)
+    return servers[server_id]
+
+def get_upload():
+    # A raw (possibly chunked) request body is decoded as it arrives when
+    # the WSGI server passes the body through unbuffered, as threaded Flask
+    # does; multipart uploads are still accepted
+    if request.mimetype == "multipart/form-data":
+        return request.files["media"]
+    return request.stream
+
+def make_response(results):
+    if request.accept_mimetypes.best == REGIONS_MIMETYPE:
+        return Response(pack_region_lists(results), mimetype=REGIONS_MIMETYPE)
     return jsonify(results)
 
+@app.route("/low/<client_id>", methods=["POST"])
+def low_query(client_id):
+    results = get_server(client_id).perform_low_query(get_upload(),client_id,
+                                                      request.args.get("start_fid", type=int))
+    return make_response(results)
+
 @app.route("/high/<client_id>", methods=["POST"])
 def high_query(client_id):
-    file_data = request.files["media"]
-    args, server_id = clients[client_id]
-    results = servers[server_id].perform_high_query(file_data,client_id)
-    return jsonify(results)
+    results = get_server(client_id).perform_high_query(get_upload(),client_id,
+                                                       request.args.get("start_fid", type=int))
+    return make_response(results)
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -2,22 +2,22 @@ import os
 import shutil
 import logging
 import cv2
-from sd_utils import (Results, Region, calc_iou, merge_images,
-                      extract_images_from_video, merge_boxes_in_results,
-                      compute_area_of_frame, calc_area)
+from sd_utils import (Results, Region, calc_iou,
+                      decode_video_frames, merge_boxes_in_results,
+                      FrameCoverage, calc_area)
 from backend.object_detector import Detector
 from backend.image_processing import (perform_server_cleanup, reset_server_state, perform_detection, extract_images)
 from backend.base_server import BaseServer
 from backend.inferenc_cache import InferenceCache
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 class Server(BaseServer):
-    def __init__(self, config, nframes=None):
-        super().__init__(config, nframes)
+    def __init__(self, config, nframes=None, detector=None, query_slots=None):
+        super().__init__(config, nframes, detector, query_slots)
 
 
 class CacheServer(BaseServer):
-    def __init__(self, config, nframes=None):
-        super().__init__(config, nframes)
+    def __init__(self, config, nframes=None, detector=None, query_slots=None):
+        super().__init__(config, nframes, detector, query_slots)
         self.cache = InferenceCache(config['time_window'], config['cache_dir'], config['cache_conf_threshold'])
 
     def save_high_conf_results(self, video_name, frame_id, results, frame_image):
@@ -33,22 +33,19 @@ class CacheServer(BaseServer):
                     result.conf = best_result.conf
 
     def perform_low_query(self, vid_data):
-        extract_images(vid_data)
-
         start_fid = self.curr_fid
         end_fid = min(self.curr_fid + self.config.batch_size, self.nframes)
         self.logger.info(f"Processing frames from {start_fid} to {end_fid}")
         req_regions = Results()
         for fid in range(start_fid, end_fid):
             req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.config.low_resolution))
-        extract_images_from_video(f"server_temp_{self.client_id}", req_regions)
-        fnames = [f for f in os.listdir(f"server_temp_{self.client_id}") if "jpg" in f]
+        self.low_frames = decode_video_frames(vid_data.read(), req_regions)
 
-        results, rpn = self.perform_detection(f"server_temp_{self.client_id}", self.config.low_resolution, fnames)
+        results, rpn = self.perform_detection(f"server_temp_{self.client_id}", self.config.low_resolution,
+                                              images=self.low_frames)
 
-        # Read frame image
-        frame_image_path = os.path.join(f"server_temp_{self.client_id}", fnames[0])
-        frame_image = cv2.imread(frame_image_path)
+        # First frame of the batch
+        frame_image = self.low_frames[min(self.low_frames)]
 
         # Match with cache
         self.match_with_cache(vid_data['video_name'], results.regions, frame_image)
@@ -85,7 +82,7 @@ class CacheServer(BaseServer):
                 base_req_regions.append(
                     Region(fid, 0, 0, 1, 1, 1.0, 2,
                            self.config.high_resolution))
-            extract_images_from_video(images_direc, base_req_regions)
+            self.low_frames = self._decode_low_frames(images_direc, base_req_regions)
 
         batch_results = Results()
 
@@ -102,7 +99,7 @@ class CacheServer(BaseServer):
 
         detections = Results()
         rpn_regions = Results()
-        frame_images = {fid: cv2.imread(self._get_image_path(images_direc, fid)) for fid in range(start_fid, end_fid)}
+        frame_images = {fid: self._get_low_frame(images_direc, fid) for fid in range(start_fid, end_fid)}
 
         # Divide RPN results into detections and RPN regions
         for single_result in batch_results.regions:
@@ -130,24 +127,16 @@ class CacheServer(BaseServer):
 
         return detections, regions_to_query
 
-    def simulate_high_query(self, vid_name, low_images_direc, req_regions):
-        images_direc = f"{vid_name}-cropped"
-        extract_images_from_video(images_direc, req_regions)
-
-        if not os.path.isdir(images_direc):
-            self.logger.error("Images directory was not found but the second iteration was called anyway")
-            return Results()
-
-        image_extension = get_image_extension(low_images_direc)
-        fnames = sorted([f for f in os.listdir(images_direc) if image_extension in f])
-        merged_images_direc = os.path.join(images_direc, "merged")
-        os.makedirs(merged_images_direc, exist_ok=True)
-        for img in fnames:
-            shutil.copy(os.path.join(images_direc, img), merged_images_direc)
-
-
-        merged_images = merge_images(merged_images_direc, low_images_direc, req_regions)
-        results, _ = self.perform_detection(merged_images_direc, self.config.high_resolution, fnames, merged_images)
+    def simulate_high_query(self, vid_name, low_images_direc, req_regions,
+                            encoded_video=None, low_frames=None):
+        if encoded_video is None:
+            encoded_video = os.path.join(f"{vid_name}-cropped", "temp.mp4")
+            if not os.path.isfile(encoded_video):
+                self.logger.error("Images directory was not found but the second iteration was called anyway")
+                return Results()
+        high_frames = decode_video_frames(encoded_video, req_regions)
+        results = self._high_query_detections(high_frames, low_images_direc,
+                                              req_regions, low_frames)
 
         results_with_detections_only = Results()
         for r in results.regions:
@@ -156,20 +145,14 @@ class CacheServer(BaseServer):
             results_with_detections_only.add_single_result(r, self.config.intersection_threshold)
 
         high_only_results = Results()
-        area_dict = {}
-        frame_images = {r.fid: cv2.imread(self._get_image_path(low_images_direc, r.fid)) for r in req_regions.regions}
+        coverage_dict = {}
+        frame_images = {r.fid: self._get_low_frame(low_images_direc, r.fid, low_frames)
+                        for r in req_regions.regions}
 
         for r in results_with_detections_only.regions:
-            frame_regions = req_regions.regions_dict[r.fid]
-            regions_area = 0
-            if r.fid in area_dict:
-                regions_area = area_dict[r.fid]
-            else:
-                regions_area = compute_area_of_frame(frame_regions)
-                area_dict[r.fid] = regions_area
-            regions_with_result = frame_regions + [r]
-            total_area = compute_area_of_frame(regions_with_result)
-            extra_area = total_area - regions_area
+            if r.fid not in coverage_dict:
+                coverage_dict[r.fid] = FrameCoverage(req_regions.regions_dict[r.fid])
+            extra_area = coverage_dict[r.fid].extra_area(r)
             if extra_area < 0.05 * calc_area(r):
                 r.origin = "high-res"
                 high_only_results.append(r)
@@ -186,7 +169,4 @@ class CacheServer(BaseServer):
                     high_only_results.add_single_result(best_result, self.config.intersection_threshold)
                     self.cache.add_results(vid_name, r.fid, [best_result], frame_image)
 
-        shutil.rmtree(merged_images_direc)
-        return high_only_results
-    def _get_image_path(self, images_direc, frame_id):
-        return os.path.join(images_direc,f"{str(frame_id).zfill(8)}.jpg")
\ No newline at end of file
+        return high_only_results
\ No newline at end of file
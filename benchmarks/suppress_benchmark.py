@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sd_utils import Results, ColumnarResults, Region, calc_iou
+
+
+def legacy_suppress(results, threshold=0.5):
+    regions = list(results.regions)
+    new_regions_list = []
+    while len(regions) > 0:
+        max_conf_obj = max(regions, key=lambda e: e.conf)
+        new_regions_list.append(max_conf_obj)
+        regions.remove(max_conf_obj)
+        regions = [r for r in regions
+                   if r.fid != max_conf_obj.fid or calc_iou(r, max_conf_obj) <= threshold]
+    new_regions_list.sort(key=lambda e: e.fid)
+    return new_regions_list
+
+
+def make_results(n_regions, n_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    fids = rng.integers(0, n_frames, n_regions)
+    xy = rng.random((n_regions, 2)) * 0.9
+    wh = rng.random((n_regions, 2)) * 0.1 + 0.01
+    confs = rng.random(n_regions)
+    results = Results()
+    for fid, (x, y), (w, h), conf in zip(fids, xy, wh, confs):
+        results.append(Region(fid, x, y, w, h, conf, "car", 1.0))
+    return results
+
+
+def timed(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=100000)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--legacy-regions", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = make_results(args.regions, args.frames)
+    columnar = ColumnarResults.from_results(results)
+    t_results = timed(lambda: results.suppress(args.threshold))
+    t_columnar = timed(lambda: columnar.suppress(args.threshold))
+    print(f"Results.suppress on {args.regions} regions / {args.frames} frames: "
+          f"{t_results:.3f}s, {len(results)} kept")
+    print(f"ColumnarResults.suppress on {args.regions} regions: "
+          f"{t_columnar:.3f}s, {len(columnar)} kept")
+
+    small = make_results(args.legacy_regions, max(args.legacy_regions // 100, 1))
+    expected = [(r.fid, r.x, r.y) for r in legacy_suppress(small, args.threshold)]
+    t_legacy = timed(lambda: legacy_suppress(small, args.threshold))
+    t_new = timed(lambda: small.suppress(args.threshold))
+    assert expected == [(r.fid, r.x, r.y) for r in small.regions]
+    print(f"{args.legacy_regions} regions: legacy {t_legacy:.3f}s, "
+          f"batched {t_new:.3f}s")
@@ -1,8 +1,10 @@
 import os
 import json
+import asyncio
 import logging
 import requests
-from sd_utils import Results, Region
+import httpx
+from sd_utils import Results, Region, unpack_region_lists, REGIONS_MIMETYPE
 import yaml
 
 class Client:
@@ -14,6 +16,9 @@ class Client:
             self.session = requests.Session()
 
             self.proxies = {"http": None, "https": None}
+            # Created on first use, inside the event loop that runs the queries
+            self.async_session = None
+            self.inflight = None
         else:
             self.server = server_handle
 
@@ -37,14 +42,63 @@ class Client:
             self.logger.fatal("Could not initialize server")
             exit()
 
-    def get_first_phase_results(self, vid_name):
-        encoded_vid_path = os.path.join(
-            vid_name + "-base-phase-cropped", "temp.mp4")
-        video_to_send = {"media": open(encoded_vid_path, "rb")}
+    def _parse_response(self, response):
+        if response.headers.get("Content-Type", "").startswith(REGIONS_MIMETYPE):
+            return unpack_region_lists(response.content)
+        return json.loads(response.text)
+
+    def post_video(self, url, encoded_vid_path):
+        # Streams the video as a chunked body so the server can decode it as
+        # it arrives, and asks for packed rather than JSON region lists
+        def chunks():
+            with open(encoded_vid_path, "rb") as video:
+                for chunk in iter(lambda: video.read(1 << 16), b""):
+                    yield chunk
         response = self.session.post(
-            f"http://{self.hname}/low/{self.client_id}", files=video_to_send,proxies=self.proxies)
-        response_json = json.loads(response.text)
+            url, data=chunks(), proxies=self.proxies,
+            headers={"Content-Type": "video/mp4",
+                     "Accept": f"{REGIONS_MIMETYPE}, application/json;q=0.5"})
+        response.raise_for_status()
+        return self._parse_response(response)
+
+    async def post_video_async(self, phase, start_fid, video):
+        # Pooled keep-alive connections with a bound on in-flight queries.
+        # Queries name their batch, so retrying one after a connection error
+        # or a server error cannot skip or repeat frames on the server
+        if self.async_session is None:
+            max_inflight = self.config.get('max_inflight_requests', 4)
+            self.async_session = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_inflight,
+                                    max_keepalive_connections=max_inflight),
+                timeout=None, trust_env=False)
+            self.inflight = asyncio.Semaphore(max_inflight)
+        retries = self.config.get('request_retries', 3)
+        backoff = self.config.get('retry_backoff', 0.5)
+
+        async with self.inflight:
+            for attempt in range(retries + 1):
+                try:
+                    response = await self.async_session.post(
+                        f"http://{self.hname}/{phase}/{self.client_id}",
+                        content=video, params={"start_fid": start_fid},
+                        headers={"Content-Type": "video/mp4",
+                                 "Accept": f"{REGIONS_MIMETYPE}, application/json;q=0.5"})
+                    if response.status_code < 500 or attempt == retries:
+                        response.raise_for_status()
+                        break
+                except httpx.TransportError:
+                    if attempt == retries:
+                        raise
+                self.logger.warning(f"Retrying {phase} query of batch {start_fid}")
+                await asyncio.sleep(backoff * 2 ** attempt)
+        return self._parse_response(response)
 
+    async def close_async(self):
+        if self.async_session is not None:
+            await self.async_session.aclose()
+            self.async_session = None
+
+    def _first_phase_results(self, response_json):
         results = Results()
         for region in response_json["results"]:
             results.append(Region.convert_from_server_response(
@@ -56,16 +110,44 @@ class Client:
 
         return results, rpn
 
-    def get_second_phase_results(self, vid_name):
-        encoded_vid_path = os.path.join(vid_name + "-cropped", "temp.mp4")
-        video_to_send = {"media": open(encoded_vid_path, "rb")}
-        response = self.session.post(
-            f"http://{self.hname}/high/{self.client_id}", files=video_to_send,proxies=self.proxies)
-        response_json = json.loads(response.text)
-
+    def _second_phase_results(self, response_json):
         results = Results()
         for region in response_json["results"]:
             results.append(Region.convert_from_server_response(
                 region, self.config.high_resolution, "high-res"))
 
         return results
+
+    def get_first_phase_results(self, vid_name):
+        encoded_vid_path = os.path.join(
+            vid_name + "-base-phase-cropped", "temp.mp4")
+        response_json = self.post_video(
+            f"http://{self.hname}/low/{self.client_id}", encoded_vid_path)
+        return self._first_phase_results(response_json)
+
+    def get_second_phase_results(self, vid_name):
+        encoded_vid_path = os.path.join(vid_name + "-cropped", "temp.mp4")
+        response_json = self.post_video(
+            f"http://{self.hname}/high/{self.client_id}", encoded_vid_path)
+        return self._second_phase_results(response_json)
+
+    # The async queries read the encoded video before returning, so the
+    # next batch can be encoded while a query is still in flight
+
+    def get_first_phase_results_async(self, vid_name, start_fid):
+        with open(os.path.join(vid_name + "-base-phase-cropped", "temp.mp4"), "rb") as video:
+            encoded_video = video.read()
+
+        async def query():
+            response_json = await self.post_video_async("low", start_fid, encoded_video)
+            return self._first_phase_results(response_json)
+        return query()
+
+    def get_second_phase_results_async(self, vid_name, start_fid):
+        with open(os.path.join(vid_name + "-cropped", "temp.mp4"), "rb") as video:
+            encoded_video = video.read()
+
+        async def query():
+            response_json = await self.post_video_async("high", start_fid, encoded_video)
+            return self._second_phase_results(response_json)
+        return query()
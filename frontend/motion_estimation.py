@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+
+
+# Motion estimation backends of the RoI cache. Dense backends give a per-pixel
+# flow field (used for box propagation, moving blocks and frame warping);
+# sparse backends only track boxes and fall back to CPU Farneback for the
+# callers that need a dense field.
+class FarnebackMotion:
+    dense = True
+
+    def __init__(self, threads=None):
+        # OpenCV parallelizes Farneback over its own thread pool
+        if threads:
+            cv2.setNumThreads(threads)
+
+    def dense_flow(self, src_gray, dst_gray):
+        return cv2.calcOpticalFlowFarneback(src_gray, dst_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+
+
+class CudaFarnebackMotion(FarnebackMotion):
+    def __init__(self, threads=None):
+        super().__init__(threads)
+        self.farneback = cv2.cuda_FarnebackOpticalFlow.create(
+            3, 0.5, False, 15, 3, 5, 1.2, 0)
+
+    def dense_flow(self, src_gray, dst_gray):
+        gpu_src_gray = cv2.cuda_GpuMat()
+        gpu_src_gray.upload(src_gray)
+        gpu_dst_gray = cv2.cuda_GpuMat()
+        gpu_dst_gray.upload(dst_gray)
+        gpu_flow = self.farneback.calc(gpu_src_gray, gpu_dst_gray, None)
+        return gpu_flow.download()
+
+
+class DISMotion(FarnebackMotion):
+    def __init__(self, threads=None):
+        super().__init__(threads)
+        self.dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_FAST)
+
+    def dense_flow(self, src_gray, dst_gray):
+        return self.dis.calc(src_gray, dst_gray, None)
+
+
+class SparseLKMotion(FarnebackMotion):
+    # Pyramidal Lucas-Kanade on the corners and centre of each box; a box
+    # moves by the median displacement of its successfully tracked points
+    dense = False
+
+    def box_motion(self, src_gray, dst_gray, boxes):
+        # boxes is an (n, 4) array of pixel x_min, y_min, x_max, y_max
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if len(boxes) == 0:
+            return np.zeros((0, 2), dtype=np.float32)
+        x0, y0, x1, y1 = boxes.T
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        points = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                           np.stack([x0, y1], 1), np.stack([x1, y1], 1),
+                           np.stack([cx, cy], 1)], axis=1)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            src_gray, dst_gray, points.reshape(-1, 1, 2), None,
+            winSize=(15, 15), maxLevel=3)
+        displacement = (next_points - points.reshape(-1, 1, 2)).reshape(-1, 5, 2)
+        tracked = status.reshape(-1, 5).astype(bool)
+        displacement[~tracked] = np.nan
+        # Boxes with no tracked point are left in place
+        displacement[~tracked.any(axis=1)] = 0
+        return np.nanmedian(displacement, axis=1).astype(np.float32)
+
+
+MOTION_BACKENDS = {
+    "farneback": FarnebackMotion,
+    "cuda": CudaFarnebackMotion,
+    "dis": DISMotion,
+    "lk": SparseLKMotion,
+}
+
+
+def cuda_available():
+    return hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+
+
+def get_motion_estimator(backend="auto", threads=None):
+    # "auto" uses CUDA when a device is available and CPU Farneback otherwise
+    if backend == "auto":
+        backend = "cuda" if cuda_available() else "farneback"
+    if backend not in MOTION_BACKENDS:
+        raise ValueError(f"Unknown motion backend: {backend}")
+    return MOTION_BACKENDS[backend](threads)
@@ -3,13 +3,18 @@ import pandas as pd
 
 import os
 import cv2
+import threading
 import numpy as np
-from sd_utils import Results, Region
+from collections import OrderedDict
+from sd_utils import Results, ColumnarResults, Region
+from frontend.motion_estimation import get_motion_estimator
 
 from concurrent.futures import ThreadPoolExecutor
 class RoICache:
-    def __init__(self, time_window, conf_threshold, relevant_classes, residual_threshold, lowres_threshold):
+    def __init__(self, time_window, conf_threshold, relevant_classes, residual_threshold, lowres_threshold,
+                 frame_store=None, motion_backend="auto", motion_threads=None, analysis_scale=1.0):
         self.time_window = time_window
+        self.frame_store = frame_store
         self.conf_threshold = conf_threshold
         self.relevant_classes = relevant_classes
         self.residual_threshold = residual_threshold
@@ -17,10 +22,96 @@ class RoICache:
         self.sift = cv2.SIFT_create()
 
         self.memory_cache = {}
+        # (src fid, dst fid, resolution) -> dense flow at the analysis scale,
+        # least recently used first. Enough for the flows from every cached
+        # frame to the frame being processed plus the one between the last
+        # two cached frames
+        self.flow_cache = OrderedDict()
+        self.flow_cache_size = time_window + 2
+        self.flow_hits = 0
+        self.box_tables_key = None
+        self.box_tables = None
+        self.flow_misses = 0
+        self.motion = get_motion_estimator(motion_backend, motion_threads)
+        # Flow and box statistics are computed on frames downscaled by
+        # analysis_scale; the downscaled grayscale frames are cached per frame
+        self.analysis_scale = analysis_scale
+        self.gray_cache = OrderedDict()
+        self.gray_cache_size = 2 * time_window + 4
+        self.gray_cache_lock = threading.Lock()
 
     def _current_time(self):
         return time.time()
 
+    def _read_image(self, image_path):
+        if self.frame_store is not None:
+            return self.frame_store.read(image_path)
+        return cv2.imread(image_path)
+
+    def _analysis_gray(self, frame_key, image):
+        # Grayscale frame at the analysis scale. frame_key (a fid or a path)
+        # identifies the frame for caching, None disables it
+        if self.analysis_scale == 1:
+            return self.ensure_grayscale(image)
+        key = (frame_key, image.shape[:2])
+        with self.gray_cache_lock:
+            if frame_key is not None and key in self.gray_cache:
+                self.gray_cache.move_to_end(key)
+                return self.gray_cache[key]
+
+        height, width = image.shape[:2]
+        gray = cv2.resize(self.ensure_grayscale(image),
+                          (max(1, round(width * self.analysis_scale)),
+                           max(1, round(height * self.analysis_scale))),
+                          interpolation=cv2.INTER_AREA)
+        if frame_key is not None:
+            with self.gray_cache_lock:
+                self.gray_cache[key] = gray
+                if len(self.gray_cache) > self.gray_cache_size:
+                    self.gray_cache.popitem(last=False)
+        return gray
+
+    def _analysis_flow(self, src_key, src_image, dst_key, dst_image):
+        # Dense flow at the analysis scale, in analysis scale pixels
+        if src_image.shape[:2] != dst_image.shape[:2]:
+            raise ValueError("Previous frame and current frame have different sizes.")
+        return self.motion.dense_flow(self._analysis_gray(src_key, src_image),
+                                      self._analysis_gray(dst_key, dst_image))
+
+    def _full_resolution_flow(self, flow, shape):
+        # Analysis scale flow resized to a frame of the given shape, in the
+        # pixels of that frame
+        height, width = shape[:2]
+        flow_height, flow_width = flow.shape[:2]
+        if (flow_height, flow_width) == (height, width):
+            return flow
+        flow = cv2.resize(flow, (width, height), interpolation=cv2.INTER_LINEAR)
+        flow[..., 0] *= width / flow_width
+        flow[..., 1] *= height / flow_height
+        return flow
+
+    def _frame_flow(self, src_fid, src_image, dst_fid, dst_image):
+        # Dense flow from src to dst at the analysis scale, computed once per
+        # frame pair and resolution. Frames without a fid are not cached
+        key = (src_fid, dst_fid, dst_image.shape[:2])
+        if src_fid is not None and key in self.flow_cache:
+            self.flow_cache.move_to_end(key)
+            self.flow_hits += 1
+            return self.flow_cache[key]
+        self.flow_misses += 1
+
+        flow = self._analysis_flow(src_fid, src_image, dst_fid, dst_image)
+
+        if src_fid is not None and dst_fid is not None:
+            self.flow_cache[key] = flow
+            if len(self.flow_cache) > self.flow_cache_size:
+                self.flow_cache.popitem(last=False)
+        return flow
+
+    def flow_stats(self):
+        return {"hits": self.flow_hits, "misses": self.flow_misses,
+                "size": len(self.flow_cache)}
+
     def add_results(self, frame_id, results, frame_image):
 
         if frame_id not in self.memory_cache:
@@ -66,7 +157,8 @@ class RoICache:
 
 
 
-                predicted_bboxes = self.predict_bounding_boxes(data['image'], current_frame_image, results,current_frame_id)
+                predicted_bboxes = self.predict_bounding_boxes(data['image'], current_frame_image, results,current_frame_id,
+                                                               prev_frame_id=frame_id)
                 predicted_bboxes.suppress()
 
                 self._categorize_predicted_bboxes(predicted_bboxes, category,current_frame_results, roi_regions, background_regions,current_frame_id)
@@ -87,84 +179,91 @@ class RoICache:
                 else:
                     roi_regions.add_single_result(self._expand_bbox(predicted_bbox), self.conf_threshold)
 
-    def predict_bounding_boxes(self, prev_frame, current_frame_image, results, current_frame_id, threshold=30,
-                               expand_pixels=10):
-
-        gpu_prev_frame = cv2.cuda_GpuMat()
-        gpu_prev_frame.upload(prev_frame)
-
-        gpu_current_frame = cv2.cuda_GpuMat()
-        gpu_current_frame.upload(current_frame_image)
-
-
-        gpu_prev_frame_gray = cv2.cuda.cvtColor(gpu_prev_frame, cv2.COLOR_BGR2GRAY)
-        gpu_current_frame_gray = cv2.cuda.cvtColor(gpu_current_frame, cv2.COLOR_BGR2GRAY)
-
+    def _box_tables(self, prev_frame_id, prev_frame_gray, current_frame_id, current_frame_gray, flow=None):
+        # Summed-area tables of the residual and, with a dense flow, of
+        # flow x/y and residual-weighted flow x/y. Kept for the last frame
+        # pair, which is shared by all result categories of a cached frame
+        key = (prev_frame_id, current_frame_id, current_frame_gray.shape[:2], flow is not None)
+        if prev_frame_id is not None and key == self.box_tables_key:
+            return self.box_tables
+
+        residual = cv2.absdiff(current_frame_gray, prev_frame_gray).astype(np.float32)
+        channels = [residual]
+        if flow is not None:
+            channels += [flow[..., 0], flow[..., 1], residual * flow[..., 0], residual * flow[..., 1]]
+        tables = np.dstack([cv2.integral(channel, sdepth=cv2.CV_32F) for channel in channels])
+
+        self.box_tables_key = key if prev_frame_id is not None else None
+        self.box_tables = tables
+        return tables
+
+    def _box_means(self, tables, boxes):
+        # Means of every table channel over each (x_min, y_min, x_max, y_max)
+        # pixel box, four lookups per box; empty boxes get zeros
+        height, width = tables.shape[0] - 1, tables.shape[1] - 1
+        x0 = np.clip(boxes[:, 0], 0, width)
+        y0 = np.clip(boxes[:, 1], 0, height)
+        x1 = np.maximum(np.clip(boxes[:, 2], 0, width), x0)
+        y1 = np.maximum(np.clip(boxes[:, 3], 0, height), y0)
+        sums = tables[y1, x1] - tables[y0, x1] - tables[y1, x0] + tables[y0, x0]
+        area = ((x1 - x0) * (y1 - y0)).astype(np.float64)[:, None]
+        return np.divide(sums, area, out=np.zeros_like(sums), where=area > 0)
 
-        if gpu_prev_frame_gray.size() != gpu_current_frame_gray.size():
-
-            raise ValueError("Previous frame and current frame have different sizes.")
-
-
-        gpu_flow = cv2.cuda.calcOpticalFlowFarneback(
-            gpu_prev_frame_gray, gpu_current_frame_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0
-        )
-
-
-        flow = gpu_flow.download()
-
-        height, width = gpu_prev_frame_gray.rows, gpu_prev_frame_gray.cols
+    def predict_bounding_boxes(self, prev_frame, current_frame_image, results, current_frame_id, threshold=30,
+                               expand_pixels=10, prev_frame_id=None):
 
+        height, width = prev_frame.shape[:2]
         predicted_bboxes = Results()
-
-        for bbox in results.regions:
-            x_min = int(bbox.x * width)
-            y_min = int(bbox.y * height)
-            x_max = int((bbox.x + bbox.w) * width)
-            y_max = int((bbox.y + bbox.h) * height)
-
-
-            flow_x = np.mean(flow[y_min:y_max, x_min:x_max, 0])
-            flow_y = np.mean(flow[y_min:y_max, x_min:x_max, 1])
-
-
-            new_x = bbox.x + flow_x / width
-            new_y = bbox.y + flow_y / height
-
-
-            gpu_residual_block = cv2.cuda.abs(
-                gpu_current_frame_gray[y_min:y_max, x_min:x_max] - gpu_prev_frame_gray[y_min:y_max, x_min:x_max])
-
-
-            residual_block = gpu_residual_block.download()
-
-            mean_residual = np.mean(residual_block)
-
-            if mean_residual > threshold:
-
-                gpu_residual_x = cv2.cuda.mean(gpu_residual_block * flow[y_min:y_max, x_min:x_max, 0])
-                gpu_residual_y = cv2.cuda.mean(gpu_residual_block * flow[y_min:y_max, x_min:x_max, 1])
-
-
-                residual_x = gpu_residual_x.download()
-                residual_y = gpu_residual_y.download()
-
-                new_x += residual_x / width
-                new_y += residual_y / height
-
-
-            x_min_new = max(int(new_x * width) - expand_pixels, 0)
-            y_min_new = max(int(new_y * height) - expand_pixels, 0)
-            x_max_new = min(int((new_x + bbox.w) * width) + expand_pixels, width)
-            y_max_new = min(int((new_y + bbox.h) * height) + expand_pixels, height)
-
-
+        regions = results.regions
+        if len(regions) == 0:
+            return predicted_bboxes
+
+        # Box statistics come from the frames at the analysis scale, boxes
+        # are mapped to it and the motion back to full resolution pixels
+        prev_frame_gray = self._analysis_gray(prev_frame_id, prev_frame)
+        current_frame_gray = self._analysis_gray(current_frame_id, current_frame_image)
+        scale_x = current_frame_gray.shape[1] / width
+        scale_y = current_frame_gray.shape[0] / height
+
+        # All boxes are propagated at once
+        coords = np.array([(bbox.x, bbox.y, bbox.w, bbox.h) for bbox in regions], dtype=np.float64)
+        x, y, w, h = coords.T
+        boxes = np.stack([(x * width).astype(int), (y * height).astype(int),
+                          ((x + w) * width).astype(int), ((y + h) * height).astype(int)], axis=1)
+        analysis_boxes = boxes * np.array([scale_x, scale_y, scale_x, scale_y])
+
+        if self.motion.dense:
+            flow = self._frame_flow(prev_frame_id, prev_frame, current_frame_id, current_frame_image)
+            tables = self._box_tables(prev_frame_id, prev_frame_gray, current_frame_id, current_frame_gray, flow)
+            mean_residual, flow_x, flow_y, residual_x, residual_y = self._box_means(
+                tables, analysis_boxes.astype(int)).T
+        else:
+            tables = self._box_tables(prev_frame_id, prev_frame_gray, current_frame_id, current_frame_gray)
+            mean_residual = self._box_means(tables, analysis_boxes.astype(int))[:, 0]
+            flow_x, flow_y = self.motion.box_motion(prev_frame_gray, current_frame_gray, analysis_boxes).T
+            residual_x = mean_residual * flow_x
+            residual_y = mean_residual * flow_y
+        flow_x, residual_x = flow_x / scale_x, residual_x / scale_x
+        flow_y, residual_y = flow_y / scale_y, residual_y / scale_y
+
+        new_x = x + flow_x / width
+        new_y = y + flow_y / height
+        large_residual = mean_residual > threshold
+        new_x = np.where(large_residual, new_x + residual_x / width, new_x)
+        new_y = np.where(large_residual, new_y + residual_y / height, new_y)
+
+        x_min_new = np.maximum((new_x * width).astype(int) - expand_pixels, 0)
+        y_min_new = np.maximum((new_y * height).astype(int) - expand_pixels, 0)
+        x_max_new = np.minimum(((new_x + w) * width).astype(int) + expand_pixels, width)
+        y_max_new = np.minimum(((new_y + h) * height).astype(int) + expand_pixels, height)
+
+        for idx, bbox in enumerate(regions):
             new_bbox = Region(
                 current_frame_id,
-                x=x_min_new / width,
-                y=y_min_new / height,
-                w=(x_max_new - x_min_new) / width,
-                h=(y_max_new - y_min_new) / height,
+                x=x_min_new[idx] / width,
+                y=y_min_new[idx] / height,
+                w=(x_max_new[idx] - x_min_new[idx]) / width,
+                h=(y_max_new[idx] - y_min_new[idx]) / height,
                 conf=bbox.conf,
                 label=bbox.label,
                 resolution=bbox.resolution,
@@ -189,45 +288,6 @@ class RoICache:
         )
         return expanded_bbox
 
-    def _compute_moving_blocks(self, roi_regions, prev_frame, current_frame_image, current_frame_id):
-
-        gpu_prev_frame = cv2.cuda_GpuMat()
-        gpu_prev_frame.upload(prev_frame)
-
-        gpu_current_frame = cv2.cuda_GpuMat()
-        gpu_current_frame.upload(current_frame_image)
-
-        gpu_prev_gray = cv2.cuda.cvtColor(gpu_prev_frame, cv2.COLOR_BGR2GRAY)
-        gpu_curr_gray = cv2.cuda.cvtColor(gpu_current_frame, cv2.COLOR_BGR2GRAY)
-
-
-        gpu_flow = cv2.cuda.calcOpticalFlowFarneback(
-            gpu_prev_gray, gpu_curr_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0
-        )
-
-
-        flow = gpu_flow.download()
-
-        h, w = gpu_curr_gray.rows, gpu_curr_gray.cols
-        block_size = 64
-
-
-        for y in range(0, h, block_size):
-            for x in range(0, w, block_size):
-
-                y_end = min(y + block_size, h)
-                x_end = min(x + block_size, w)
-                flow_block = flow[y:y_end, x:x_end]
-                mean_flow = np.mean(flow_block, axis=(0, 1))
-
-
-                if np.linalg.norm(mean_flow) > self.residual_threshold:
-                    roi_regions.add_single_result(
-                        Region(current_frame_id, x / w, y / h, (x_end - x) / w, (y_end - y) / h, 0, 'moving_block', 1,
-                               'motion'),
-                        self.conf_threshold
-                    )
-
     def _categorize_results(self, results):
         categorized_results = {
             'high_conf_target': Results(),
@@ -321,7 +381,7 @@ class RoICache:
             else:
                 results=[]
             if fid not in self.memory_cache:
-                current_frame_image = cv2.imread(os.path.join(high_images_path, f"{fid:08d}.jpg"))
+                current_frame_image = self._read_image(os.path.join(high_images_path, f"{fid:08d}.jpg"))
                 self.add_results(fid, results, current_frame_image)
             else:
                 self.add_results(fid, results, self.memory_cache[fid]['image'])
@@ -361,63 +421,69 @@ class RoICache:
         warped_img = cv2.remap(img, flow_map, None, cv2.INTER_LINEAR)
         return warped_img
 
-    def highlight_large_errors(self, img, residual, threshold, block_size, region_size, current_frame_id, expand_pixels=5):
+    def highlight_large_errors(self, img, residual, threshold, block_size, region_size, current_frame_id, expand_pixels=5,
+                               visualize=False):
+        # Block means of the residual from one summed-area table. A region is
+        # kept if any of its blocks exceeds threshold and its first such block
+        # is marked in the mask; highlighted_img is None unless visualize
         if len(residual.shape) == 3:
-            h, w, _ = residual.shape
+            h, w, channels = residual.shape
+            residual_sum = residual.sum(axis=2, dtype=np.float64)
         else:
             h, w = residual.shape
+            channels = 1
+            residual_sum = residual.astype(np.float64)
+        table = cv2.integral(residual_sum, sdepth=cv2.CV_64F)
+
+        # Block origins per region along each axis: (regions, blocks per region)
+        offsets = np.arange(0, region_size, block_size)
+        block_y = np.arange(0, h, region_size)[:, None] + offsets[None, :]
+        block_x = np.arange(0, w, region_size)[:, None] + offsets[None, :]
+        y0 = np.minimum(block_y, h)
+        x0 = np.minimum(block_x, w)
+        y1 = np.minimum(block_y + block_size, h)
+        x1 = np.minimum(block_x + block_size, w)
+
+        # (y regions, x regions, y blocks, x blocks)
+        y0_, y1_ = y0[:, None, :, None], y1[:, None, :, None]
+        x0_, x1_ = x0[None, :, None, :], x1[None, :, None, :]
+        sums = table[y1_, x1_] - table[y0_, x1_] - table[y1_, x0_] + table[y0_, x0_]
+        area = (y1_ - y0_) * (x1_ - x0_) * channels
+        large_error = np.divide(sums, area, out=np.zeros(sums.shape), where=area > 0) > threshold
+        large_error = large_error.reshape(large_error.shape[0], large_error.shape[1], -1)
+        first_block = large_error.argmax(axis=2)
 
         mask = np.zeros_like(img)
-        highlighted_img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        highlighted_img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if visualize else None
         regions = []
-
-
-        for y in range(0, h, region_size):
-            for x in range(0, w, region_size):
-                region_has_large_error = False
-
-
-                for by in range(y, min(y + region_size, h), block_size):
-                    for bx in range(x, min(x + region_size, w), block_size):
-                        block_h = min(block_size, h - by)
-                        block_w = min(block_size, w - bx)
-
-                        block = residual[by:by + block_h, bx:bx + block_w]
-                        mean_error = np.mean(block)
-
-
-                        if mean_error > threshold:
-                            region_has_large_error = True
-                            mask[by:by + block_h, bx:bx + block_w] = 255
-                            overlay = highlighted_img[by:by + block_h, bx:bx + block_w]
-                            highlighted_img[by:by + block_h, bx:bx + block_w] = cv2.addWeighted(overlay, 0.5,
-                                                                                                np.full_like(overlay,
-                                                                                                             [0, 0,
-                                                                                                              255]),
-                                                                                                0.5, 0)
-
-                            break
-                    if region_has_large_error:
-                        break
-
-
-                if region_has_large_error:
-
-                    expanded_x = max(0, x - expand_pixels)
-                    expanded_y = max(0, y - expand_pixels)
-                    expanded_w = min(region_size + 2 * expand_pixels, w - expanded_x)
-                    expanded_h = min(region_size + 2 * expand_pixels, h - expanded_y)
-
-
-                    regions.append(Region(
-                        current_frame_id,
-                        expanded_x / w,
-                        expanded_y / h,
-                        expanded_w / w,
-                        expanded_h / h,
-                        1,
-                        1
-                    ))
+        blocks_per_row = offsets.size
+        for region_y, region_x in np.argwhere(large_error.any(axis=2)):
+            block_index = first_block[region_y, region_x]
+            by = y0[region_y, block_index // blocks_per_row]
+            bx = x0[region_x, block_index % blocks_per_row]
+            by_end = y1[region_y, block_index // blocks_per_row]
+            bx_end = x1[region_x, block_index % blocks_per_row]
+            mask[by:by_end, bx:bx_end] = 255
+            if visualize:
+                overlay = highlighted_img[by:by_end, bx:bx_end]
+                highlighted_img[by:by_end, bx:bx_end] = cv2.addWeighted(
+                    overlay, 0.5, np.full_like(overlay, [0, 0, 255]), 0.5, 0)
+
+            expanded_x = max(0, region_x * region_size - expand_pixels)
+            expanded_y = max(0, region_y * region_size - expand_pixels)
+            expanded_w = min(region_size + 2 * expand_pixels, w - expanded_x)
+            expanded_h = min(region_size + 2 * expand_pixels, h - expanded_y)
+
+            regions.append(Region(
+                current_frame_id,
+                expanded_x / w,
+                expanded_y / h,
+                expanded_w / w,
+                expanded_h / h,
+                1,
+                1,
+                1
+            ))
 
         return highlighted_img, mask, regions
 
@@ -463,7 +529,10 @@ class RoICache:
 
 
 
-        flow = self.compute_optical_flow_farneback(prev_prev_img, prev_img)
+        # The last two cached frames are the same for every frame of a batch
+        flow = self._full_resolution_flow(
+            self._frame_flow(prev_prev_frame_id, prev_prev_img, prev_frame_id, prev_img),
+            prev_img.shape)
 
 
 
@@ -498,35 +567,6 @@ class RoICache:
         return results
 
 
-    def find_zero_motion_blocks_gpu(self, motion_vectors, block_size=16, zero_threshold=0.5):
-        """
-        GPU-optimized version of finding zero-motion blocks.
-        """
-        h, w, _ = motion_vectors.shape
-        h_blocks = h // block_size
-        w_blocks = w // block_size
-
-        gpu_motion_vectors = cv2.cuda_GpuMat()
-        gpu_motion_vectors.upload(motion_vectors)
-
-        gpu_block_vectors = gpu_motion_vectors.reshape(h_blocks, block_size, w_blocks, block_size, 2)
-
-
-        gpu_block_means = cv2.cuda.reduce(gpu_block_vectors, axis=(1, 3), op=cv2.REDUCE_AVG)
-
-        gpu_magnitude = cv2.cuda.magnitude(gpu_block_means[..., 0], gpu_block_means[..., 1])
-
-        gpu_zero_motion_mask = gpu_magnitude < zero_threshold
-
-        zero_motion_mask = gpu_zero_motion_mask.download()
-
-
-        zero_motion_blocks = np.argwhere(zero_motion_mask)
-
-        zero_motion_blocks = [(x * block_size, y * block_size) for y, x in zero_motion_blocks]
-
-        return zero_motion_blocks
-
     def find_zero_motion_blocks_optimized(self,motion_vectors, block_size=16, zero_threshold=0.5):
         h, w, _ = motion_vectors.shape
         h_blocks = h // block_size
@@ -575,15 +615,25 @@ class RoICache:
                 background_blocks.append(blocks[i][0])
 
         return background_blocks
-    def extract_motion_vectors(self,image1, image2):
-        gray1 = cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-        flow = cv2.calcOpticalFlowFarneback(gray1, gray2, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    def extract_motion_vectors(self,image1, image2, image1_key=None, image2_key=None):
+        flow = self._full_resolution_flow(
+            self._analysis_flow(image1_key, image1, image2_key, image2), image2.shape)
         motion_vectors = np.dstack((flow[..., 0], flow[..., 1]))
         return motion_vectors
 
     def convert_results_to_df(self,results):
 
+        if isinstance(results, ColumnarResults):
+            x, y = results.column("x"), results.column("y")
+            return pd.DataFrame({
+                'xmin': x,
+                'ymin': y,
+                'xmax': x + results.column("w"),
+                'ymax': y + results.column("h"),
+                'conf': results.column("conf"),
+                'label': [results.labels[i] for i in results.column("label")]
+            })
+
         data = []
         for region in results.regions:
             xmin = region.x
@@ -615,106 +665,13 @@ class RoICache:
 
         return df
 
-    def find_background_blocks_ransac_gpu(self, motion_vectors):
-        """
-        Use RANSAC to detect background blocks from motion vectors on GPU.
-        """
-
-        gpu_motion_vectors = cv2.cuda_GpuMat()
-        gpu_motion_vectors.upload(motion_vectors)
-
-
-        height, width, _ = gpu_motion_vectors.shape
-        motion_vectors_reshaped = gpu_motion_vectors.reshape((-1, 2))
-
-
-
-
-        ransac_thresh = 1.0
-        max_iters = 1000
-
-        inliers = []
-        for _ in range(max_iters):
-
-            sample_idx = np.random.choice(len(motion_vectors_reshaped), 2, replace=False)
-            sample_points = motion_vectors_reshaped[sample_idx]
-
-
-            translation = np.mean(sample_points, axis=0)
-
-            residuals = np.linalg.norm(motion_vectors_reshaped - translation, axis=1)
-
-
-            inlier_mask = residuals < ransac_thresh
-
-
-            inliers = motion_vectors_reshaped[inlier_mask]
-
-
-        background_blocks = self._get_block_positions_from_motion_vectors(inliers, height, width)
-
-        return background_blocks
-
-    def _get_block_positions_from_motion_vectors(self, inliers, height, width, block_size=16):
-        """
-        Converts the inlier motion vectors into corresponding block positions in the image.
-        """
-        background_blocks = []
-        for mv in inliers:
-
-            x, y = mv
-            block_x = int(x * width)
-            block_y = int(y * height)
-
-
-            background_blocks.append((block_x, block_y))
-
-        return background_blocks
-
-
-
-    def find_zero_motion_blocks_gpu(self, motion_vectors, block_size=16, zero_threshold=0.5):
-        """
-        GPU-optimized version of finding zero-motion blocks.
-        """
-        h, w, _ = motion_vectors.shape
-        h_blocks = h // block_size
-        w_blocks = w // block_size
-
-
-        gpu_motion_vectors = cv2.cuda_GpuMat()
-        gpu_motion_vectors.upload(motion_vectors)
-
-
-        gpu_block_vectors = gpu_motion_vectors.reshape(h_blocks, block_size, w_blocks, block_size, 2)
-
-
-        gpu_block_means = cv2.cuda.reduce(gpu_block_vectors, axis=(1, 3), op=cv2.REDUCE_AVG)
-
-
-        gpu_magnitude = cv2.cuda.magnitude(gpu_block_means[..., 0], gpu_block_means[..., 1])
-
-
-        gpu_zero_motion_mask = gpu_magnitude < zero_threshold
-
-
-        zero_motion_mask = gpu_zero_motion_mask.download()
-
-
-        zero_motion_blocks = np.argwhere(zero_motion_mask)
-
-
-        zero_motion_blocks = [(x * block_size, y * block_size) for y, x in zero_motion_blocks]
-
-        return zero_motion_blocks
-
     def process_image_triplet(self, image1_path, image2_path, image3_path, results_df, output_path=None):
 
 
 
-        image1 = cv2.imread(image1_path)
-        image2 = cv2.imread(image2_path)
-        image3 = cv2.imread(image3_path)
+        image1 = self._read_image(image1_path)
+        image2 = self._read_image(image2_path)
+        image3 = self._read_image(image3_path)
 
         if image1 is None or image2 is None or image3 is None:
 
@@ -738,7 +695,7 @@ class RoICache:
 
 
 
-        motion_vectors = self.extract_motion_vectors(image1, image2)
+        motion_vectors = self.extract_motion_vectors(image1, image2, image1_path, image2_path)
 
 
         h, w, _ = motion_vectors.shape
@@ -787,7 +744,7 @@ class RoICache:
                              large_block_height=64, n=5,padding=1):
 
 
-        if len(results_df.regions) == 0:
+        if len(results_df) == 0:
             base_req_regions_res = [Region(0, 0, 0, 1, 1, 1.0, 2, 1)]
             return base_req_regions_res, []
 
@@ -811,7 +768,7 @@ class RoICache:
                 return [], [], [], None, None
 
 
-            img = cv2.imread(image1_path)
+            img = self._read_image(image1_path)
             if img is None:
                 return [], [], [], None, None
 
@@ -1,14 +1,24 @@
 from frontend.roi_cache import RoICache
 from frontend.client import Client
+from streamduet_utils import FrameStore
 class RoIClient(Client):
-    def __init__(self, config, client_id, server_handle=None):
-        super().__init__(config, client_id, server_handle)
+    def __init__(self, hname, config, client_id, server_handle=None):
+        super().__init__(hname, config, client_id, server_handle)
+        # A batch keeps its full and resized frames plus the two triplet
+        # frames after it live while the next batch is prefetched, and the
+        # resized frames of the previous batch are still the most recent
+        self.frame_store = FrameStore(config.get('frame_store_capacity')
+                                      or 4 * config['batch_size'] + 4)
         self.roi_cache = RoICache(
             config['RoI_time_window'],
             config['RoI_cache_conf_threshold'],
             config['relevant_classes'],
             config['RoI_cache_residual_threshold'],
-            config['low_resolution']
+            config['low_resolution'],
+            self.frame_store,
+            config.get('motion_backend', 'auto'),
+            config.get('motion_threads'),
+            config.get('motion_analysis_scale', 1.0)
         )
 
     def add_results_to_cache(self, video_name, frame_id, results, frame_image):
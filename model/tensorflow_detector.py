@@ -100,17 +100,25 @@ class TensorFlowDetector:
                 output_dict['detection_scores'][0])
         return output_dict
 
-    def infer(self, image_np):
-        imgae_crops = image_np
-
-
-        output_dict = self.run_inference_for_single_image(
-            imgae_crops, self.d_graph)
+    def run_inference_for_batch(self, images):
+        # Detection outputs are batched by the graph, the RPN proposals are
+        # gathered inside its per-image NMS loop and are not fetched here
+        with self.d_graph.as_default():
+            graph = tf.compat.v1.get_default_graph()
+            tensor_dict = {}
+            for key in ['num_detections', 'detection_boxes',
+                        'detection_scores', 'detection_classes']:
+                tensor_dict[key] = graph.get_tensor_by_name(key + ':0')
+            image_tensor = graph.get_tensor_by_name('image_tensor:0')
 
+            output_dict = self.session.run(
+                tensor_dict, feed_dict={image_tensor: np.stack(images)})
+        return output_dict
 
+    def _parse_detections(self, boxes, scores, classes):
         results = []
-        for i in range(len(output_dict['detection_boxes'])):
-            object_class = output_dict['detection_classes'][i]
+        for i in range(len(boxes)):
+            object_class = classes[i]
             relevant_class = False
             for k in TensorFlowDetector.classes.keys():
                 if object_class in TensorFlowDetector.classes[k]:
@@ -120,10 +128,23 @@ class TensorFlowDetector:
             if not relevant_class:
                 continue
 
-            ymin, xmin, ymax, xmax = output_dict['detection_boxes'][i]
-            confidence = output_dict['detection_scores'][i]
+            ymin, xmin, ymax, xmax = boxes[i]
+            confidence = scores[i]
             box_tuple = (xmin, ymin, xmax - xmin, ymax - ymin)
             results.append((object_class, confidence, box_tuple))
+        return results
+
+    def infer(self, image_np):
+        imgae_crops = image_np
+
+
+        output_dict = self.run_inference_for_single_image(
+            imgae_crops, self.d_graph)
+
+
+        results = self._parse_detections(output_dict['detection_boxes'],
+                                         output_dict['detection_scores'],
+                                         output_dict['detection_classes'])
 
 
         results_rpn = []
@@ -137,4 +158,23 @@ class TensorFlowDetector:
                 continue
             results_rpn.append(("object", conf, (x, y, w, h)))
 
-        return results, results_rpn
\ No newline at end of file
+        return results, results_rpn
+
+    def infer_batch(self, images, with_rpn=True):
+        # RPN proposals are only reachable one image at a time
+        if with_rpn:
+            return [self.infer(image) for image in images]
+
+        outputs = [None] * len(images)
+        shapes = {}
+        for idx, image in enumerate(images):
+            shapes.setdefault(image.shape, []).append(idx)
+        for idxs in shapes.values():
+            output_dict = self.run_inference_for_batch([images[i] for i in idxs])
+            for row, idx in enumerate(idxs):
+                results = self._parse_detections(
+                    output_dict['detection_boxes'][row],
+                    output_dict['detection_scores'][row],
+                    output_dict['detection_classes'][row].astype(np.uint8))
+                outputs[idx] = (results, [])
+        return outputs
@@ -39,11 +39,7 @@ class YOLOv5Detector:
                 return class_name
         return "object"
 
-    def infer(self, image):
-
-        results = self.model(image)
-        detection_results = results.xywh[0].cpu().numpy()
-
+    def _parse_detections(self, detection_results):
         detections = []
         results_rpn = []
         for x, y, w, h, conf, label in detection_results:
@@ -59,6 +55,17 @@ class YOLOv5Detector:
 
         return detections, results_rpn
 
+    def infer(self, image):
+
+        results = self.model(image)
+        return self._parse_detections(results.xywh[0].cpu().numpy())
+
+    def infer_batch(self, images, with_rpn=True):
+        # The hub model letterboxes a list of images into a single forward
+        # pass; RPN regions come from the same detections so with_rpn is free
+        results = self.model(list(images))
+        return [self._parse_detections(xywh.cpu().numpy()) for xywh in results.xywh]
+
     def draw_and_save(self, image, results, output_path, title):
 
         if isinstance(image, torch.Tensor):
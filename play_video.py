@@ -4,11 +4,24 @@ import sys
 import os
 from munch import munchify
 import yaml
-from sd_utils import read_results_dict, evaluate, write_stats
+from sd_utils import (read_results_dict, evaluate, evaluate_grid,
+                      evaluation_grid_columns, write_stats)
 from workspace.instance_strategy import StrategyFactory
 
 
 
+def parse_thresholds(thresholds):
+    # Threshold grids are comma separated strings in the configuration so
+    # that the parameter sweep does not iterate over them
+    if not thresholds:
+        return []
+    if isinstance(thresholds, (int, float)):
+        return [float(thresholds)]
+    if isinstance(thresholds, str):
+        thresholds = thresholds.split(",")
+    return [float(t) for t in thresholds if str(t).strip()]
+
+
 def main(args):
     logging.basicConfig(
         format="%(name)s -- %(levelname)s -- %(lineno)d -- %(message)s",
@@ -28,20 +41,35 @@ def main(args):
     low, high = bw
     f1 = 0
     stats = (0, 0, 0)
+    extra_columns = None
     number_of_frames = len([x for x in os.listdir(args.high_images_path) if "jpg" in x])
     if args.ground_truth:
-        ground_truth_dict = read_results_dict(args.ground_truth)
+        ground_truth_dict = read_results_dict(args.ground_truth, args.get("results_cache_dir"))
         logger.info("Reading ground truth results complete")
         tp, fp, fn, _, _, _, f1 = evaluate(number_of_frames - 1, results.regions_dict, ground_truth_dict,
                                            args.low_threshold, 0.5, 0.4, 0.4)
         stats = (tp, fp, fn)
         logger.info(
             f"Got an f1 score of {f1} for this experiment {mode} with tp {stats[0]} fp {stats[1]} fn {stats[2]} with total bandwidth {sum(bw)}")
+        iou_thresholds = parse_thresholds(args.get("eval_iou_thresholds"))
+        conf_thresholds = parse_thresholds(args.get("eval_conf_thresholds"))
+        if iou_thresholds and conf_thresholds:
+            grid, _, aps, mean_ap = evaluate_grid(
+                number_of_frames - 1, results.regions_dict, ground_truth_dict,
+                args.low_threshold, conf_thresholds, 0.4, 0.4, iou_thresholds)
+            extra_columns = evaluation_grid_columns(grid, aps, mean_ap)
+            logger.info(f"Got a mAP of {extra_columns['mAP']} over IoU thresholds {iou_thresholds}")
     else:
         logger.info("No groundtruth given skipping evaluation")
 
     # Write evaluation results to file
     write_stats(args.outfile, f"{args.video_name}", config, f1, stats, bw, number_of_frames, mode,lt)
+    if extra_columns:
+        # Grid columns go to a file of their own so the columns of the
+        # stats file do not depend on whether a grid was evaluated
+        root, ext = os.path.splitext(args.outfile)
+        write_stats(f"{root}_grid{ext}", f"{args.video_name}", config, f1, stats, bw,
+                    number_of_frames, mode, lt, extra_columns)
 
 
 if __name__ == "__main__":
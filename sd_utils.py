@@ -1,12 +1,17 @@
 import re
 import os
 import csv
+import json
+import hashlib
+import tempfile
 import shutil
 import subprocess
+import threading
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2 as cv
-import networkx
-from networkx.algorithms.components.connected import connected_components
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 import time
 def remove_before_first_underscore(s):
@@ -184,8 +189,26 @@ class Results:
         return max_conf_result
 
     def combine_results(self, additional_results, threshold=0.5):
-        for result_to_add in additional_results.regions:
-            self.add_single_result(result_to_add, threshold)
+        if threshold == 1:
+            for result_to_add in additional_results.regions:
+                self.append(result_to_add)
+            return
+        incoming = additional_results.regions
+        targets = {}
+        for fid, frame_incoming in _group_by_fid(incoming).items():
+            existing = self.regions_dict.get(fid, [])
+            targets[fid] = (existing + [], iter(_plan_frame_merge(
+                _region_boxes(existing), [r.conf for r in existing],
+                [r.label for r in existing], [r.origin for r in existing],
+                frame_incoming, threshold)))
+        for result_to_add in incoming:
+            slots, plan = targets[result_to_add.fid]
+            target = next(plan)
+            if target < 0:
+                self.append(result_to_add)
+                slots.append(result_to_add)
+            else:
+                _replace_dup(slots[target], result_to_add)
 
     def add_single_result(self, region_to_add, threshold=0.5):
         if threshold == 1:
@@ -200,41 +223,19 @@ class Results:
                 self.regions_dict[region_to_add.fid] = []
             self.regions_dict[region_to_add.fid].append(region_to_add)
         else:
-            final_object = None
-            if dup_region.origin == region_to_add.origin:
-                final_object = max([region_to_add, dup_region],
-                                   key=lambda r: r.conf)
-            elif ("low" in dup_region.origin and
-                  "high" in region_to_add.origin):
-                final_object = region_to_add
-            elif ("high" in dup_region.origin and
-                  "low" in region_to_add.origin):
-                final_object = dup_region
-            dup_region.x = final_object.x
-            dup_region.y = final_object.y
-            dup_region.w = final_object.w
-            dup_region.h = final_object.h
-            dup_region.conf = final_object.conf
-            dup_region.origin = final_object.origin
-            dup_region.feature=None
+            _replace_dup(dup_region, region_to_add)
 
     def suppress(self, threshold=0.5):
-        new_regions_list = []
-        while len(self.regions) > 0:
-            max_conf_obj = max(self.regions, key=lambda e: e.conf)
-            new_regions_list.append(max_conf_obj)
-            self.remove(max_conf_obj)
-            objs_to_remove = []
-            for r in self.regions:
-                if r.fid != max_conf_obj.fid:
-                    continue
-                if calc_iou(r, max_conf_obj) > threshold:
-                    objs_to_remove.append(r)
-            for r in objs_to_remove:
-                self.remove(r)
-        new_regions_list.sort(key=lambda e: e.fid)
-        for r in new_regions_list:
-            self.append(r)
+        regions = self.regions
+        keep = nms_indices(np.array([r.fid for r in regions], dtype=np.int64),
+                           _region_boxes(regions),
+                           np.array([r.conf for r in regions], dtype=np.float64),
+                           threshold)
+        self.regions = []
+        for fid in self.regions_dict:
+            self.regions_dict[fid] = []
+        for i in keep:
+            self.append(regions[i])
 
     def append(self, region_to_add):
         self.regions.append(region_to_add)
@@ -283,38 +284,534 @@ class Results:
             csv_writer.writerow(row)
         results_files.close()
 
+    def write_results_binary(self, fname):
+        write_results_binary(fname, *binary_records(self.regions))
+
     def write(self, fname):
-        if re.match(r"\w+[.]csv\Z", fname):
+        if is_binary_results_file(fname):
+            self.write_results_binary(fname)
+        elif re.match(r"\w+[.]csv\Z", fname):
             self.write_results_csv(fname)
         else:
             self.write_results_txt(fname)
 
 
-def to_graph(l):
-    G = networkx.Graph()
-    for part in l:
+# Single precision is what the detectors produce, so boxes and confidences
+# lose nothing in the in-memory columns; binary results files keep doubles
+# (_BINARY_DTYPE) so cached results read back exactly as parsed from text
+RESULTS_DTYPE = np.dtype([("fid", np.int32), ("x", np.float32),
+                          ("y", np.float32), ("w", np.float32),
+                          ("h", np.float32), ("conf", np.float32),
+                          ("label", np.int16), ("resolution", np.float32),
+                          ("origin", np.int16)])
 
-        G.add_nodes_from(part)
 
-        G.add_edges_from(to_edges(part))
-    return G
+def _column_property(name):
+    def getter(self):
+        return self._results._get(name, self._idx)
 
+    def setter(self, value):
+        self._results._set(name, self._idx, value)
 
-def to_edges(l):
+    return property(getter, setter)
 
-    it = iter(l)
-    last = next(it)
 
-    for current in it:
-        yield last, current
-        last = current
+class RegionView(Region):
+    # A Region backed by one row of a ColumnarResults. Row indices shift
+    # when rows are removed or reordered, so views taken before remove(),
+    # suppress() or fill_gaps() must not be used afterwards.
+    fid = _column_property("fid")
+    x = _column_property("x")
+    y = _column_property("y")
+    w = _column_property("w")
+    h = _column_property("h")
+    conf = _column_property("conf")
+    label = _column_property("label")
+    resolution = _column_property("resolution")
+    origin = _column_property("origin")
 
+    def __init__(self, results, idx):
+        self._results = results
+        self._idx = idx
+        self.feature = None
 
-def filter_bbox_group(bb1, bb2, iou_threshold):
-    if calc_iou(bb1, bb2) > iou_threshold and bb1.label == bb2.label:
-        return True
-    else:
-        return False
+
+class _FrameRegionsView:
+    # Read-only stand-in for Results.regions_dict that builds the region
+    # list of a frame only when it is looked up.
+    def __init__(self, results):
+        self._results = results
+
+    def __contains__(self, fid):
+        return len(self._results.frame_rows(fid)) > 0
+
+    def __getitem__(self, fid):
+        rows = self._results.frame_rows(fid)
+        if len(rows) == 0:
+            raise KeyError(fid)
+        return [RegionView(self._results, int(i)) for i in rows]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._results._frame_index())
+
+    def keys(self):
+        return [int(fid) for fid in self._results.frame_ids()]
+
+    def items(self):
+        return [(fid, self[fid]) for fid in self.keys()]
+
+    def values(self):
+        return [self[fid] for fid in self.keys()]
+
+    def get(self, fid, default=None):
+        if fid in self:
+            return self[fid]
+        return default
+
+
+class ColumnarResults:
+    # Results variant that stores detections as NumPy columns instead of
+    # one Region object per detection. Labels and origins are interned into
+    # per-container tables and stored as integer ids.
+    def __init__(self, capacity=1024):
+        self._columns = {name: np.empty(capacity, dtype=RESULTS_DTYPE[name])
+                         for name in RESULTS_DTYPE.names}
+        self._size = 0
+        self.labels = []
+        self.origins = []
+        self._label_ids = {}
+        self._origin_ids = {}
+        # fid -> rows of the frame (an int64 array.array, so an index entry
+        # costs 8 bytes) in insertion order, frames in order of
+        # first appearance. Kept up to date by append/extend and rebuilt
+        # after rows are removed, reordered or moved to another frame.
+        self._index = {}
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_results(cls, results):
+        columnar = cls(max(len(results), 1))
+        for region in results.regions:
+            columnar.append(region)
+        return columnar
+
+    def to_results(self):
+        results = Results()
+        for region in self.regions:
+            results.append(region.copy())
+        return results
+
+    @property
+    def nbytes(self):
+        return sum(col[:self._size].nbytes for col in self._columns.values())
+
+    @property
+    def regions(self):
+        return [RegionView(self, i) for i in range(self._size)]
+
+    @property
+    def regions_dict(self):
+        return _FrameRegionsView(self)
+
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def to_records(self):
+        records = np.empty(self._size, dtype=RESULTS_DTYPE)
+        for name in RESULTS_DTYPE.names:
+            records[name] = self.column(name)
+        return records
+
+    def _intern(self, table, ids, value):
+        if value not in ids:
+            ids[value] = len(table)
+            table.append(value)
+        return ids[value]
+
+    def _get(self, name, idx):
+        value = self._columns[name][idx]
+        if name == "label":
+            return self.labels[value]
+        if name == "origin":
+            return self.origins[value]
+        if name == "fid":
+            return int(value)
+        return float(value)
+
+    def _set(self, name, idx, value):
+        if name == "label":
+            value = self._intern(self.labels, self._label_ids, value)
+        elif name == "origin":
+            value = self._intern(self.origins, self._origin_ids, value)
+        elif name == "fid":
+            self._index = None
+        self._columns[name][idx] = value
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._columns["fid"])
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        for name, col in self._columns.items():
+            grown = np.empty(capacity, dtype=col.dtype)
+            grown[:self._size] = col[:self._size]
+            self._columns[name] = grown
+
+    def _frame_index(self):
+        if self._index is None:
+            fids = self.column("fid")
+            order = np.argsort(fids, kind="stable")
+            unique_fids, starts = np.unique(fids[order], return_index=True)
+            groups = np.split(order, starts[1:])
+            appearance = np.argsort(order[starts], kind="stable")
+            self._index = {int(unique_fids[i]): array("q", groups[i].tolist())
+                           for i in appearance}
+        return self._index
+
+    def _index_rows(self, start, end):
+        if self._index is None:
+            return
+        for row, fid in enumerate(self._columns["fid"][start:end].tolist(),
+                                  start):
+            if fid in self._index:
+                self._index[fid].append(row)
+            else:
+                self._index[fid] = array("q", [row])
+
+    def frame_ids(self):
+        return np.array(list(self._frame_index()), dtype=np.int64)
+
+    def frame_rows(self, fid):
+        return np.array(self._frame_index().get(fid, ()), dtype=np.intp)
+
+    def append(self, region_to_add):
+        self._reserve(1)
+        idx = self._size
+        cols = self._columns
+        cols["fid"][idx] = region_to_add.fid
+        cols["x"][idx] = region_to_add.x
+        cols["y"][idx] = region_to_add.y
+        cols["w"][idx] = region_to_add.w
+        cols["h"][idx] = region_to_add.h
+        cols["conf"][idx] = region_to_add.conf
+        cols["resolution"][idx] = region_to_add.resolution
+        cols["label"][idx] = self._intern(
+            self.labels, self._label_ids, region_to_add.label)
+        cols["origin"][idx] = self._intern(
+            self.origins, self._origin_ids, region_to_add.origin)
+        self._size += 1
+        self._index_rows(idx, idx + 1)
+
+    def extend(self, other):
+        if not isinstance(other, ColumnarResults):
+            for region in other.regions:
+                self.append(region)
+            return
+        count = len(other)
+        if count == 0:
+            return
+        self._reserve(count)
+        start, end = self._size, self._size + count
+        label_map = np.array([self._intern(self.labels, self._label_ids, l)
+                              for l in other.labels] or [0], dtype=np.int16)
+        origin_map = np.array([self._intern(self.origins, self._origin_ids, o)
+                               for o in other.origins] or [0], dtype=np.int16)
+        for name in RESULTS_DTYPE.names:
+            values = other.column(name)
+            if name == "label":
+                values = label_map[values]
+            elif name == "origin":
+                values = origin_map[values]
+            self._columns[name][start:end] = values
+        self._size = end
+        self._index_rows(start, end)
+
+    def results_high_len(self, threshold):
+        return int(np.count_nonzero(self.column("conf") > threshold))
+
+    def is_dup(self, result_to_add, threshold=0.5):
+        rows = self.frame_rows(result_to_add.fid)
+        if len(rows) == 0:
+            return None
+        x = self._columns["x"][rows]
+        y = self._columns["y"][rows]
+        w = self._columns["w"][rows]
+        h = self._columns["h"][rows]
+        inter_w = np.maximum(0, np.minimum(x + w, result_to_add.x + result_to_add.w)
+                             - np.maximum(x, result_to_add.x))
+        inter_h = np.maximum(0, np.minimum(y + h, result_to_add.y + result_to_add.h)
+                             - np.maximum(y, result_to_add.y))
+        inter = inter_w * inter_h
+        union = (np.maximum(0, w) * np.maximum(0, h)
+                 + calc_area(result_to_add) - inter)
+        iou = np.divide(inter, union, out=np.zeros_like(inter),
+                        where=union != 0)
+        same = iou > threshold
+        if result_to_add.label != "-1":
+            labels = self._columns["label"][rows]
+            wildcard = self._label_ids.get("-1", -1)
+            own = self._label_ids.get(result_to_add.label, -2)
+            same &= (labels == own) | (labels == wildcard)
+        if not same.any():
+            return None
+        candidates = rows[same]
+        best = candidates[np.argmax(self._columns["conf"][candidates])]
+        return RegionView(self, int(best))
+
+    def add_single_result(self, region_to_add, threshold=0.5):
+        if threshold == 1:
+            self.append(region_to_add)
+            return
+        dup_region = self.is_dup(region_to_add, threshold)
+        if (not dup_region or
+                ("tracking" in region_to_add.origin and
+                 "tracking" in dup_region.origin)):
+            self.append(region_to_add)
+        else:
+            _replace_dup(dup_region, region_to_add)
+
+    def combine_results(self, additional_results, threshold=0.5):
+        if threshold == 1:
+            self.extend(additional_results)
+            return
+        incoming = additional_results.regions
+        cols = self._columns
+        targets = {}
+        for fid, frame_incoming in _group_by_fid(incoming).items():
+            rows = self.frame_rows(fid)
+            boxes = np.stack([cols["x"][rows], cols["y"][rows],
+                              cols["w"][rows], cols["h"][rows]], axis=1)
+            targets[fid] = (list(rows), iter(_plan_frame_merge(
+                boxes, cols["conf"][rows],
+                [self.labels[i] for i in cols["label"][rows]],
+                [self.origins[i] for i in cols["origin"][rows]],
+                frame_incoming, threshold)))
+        for result_to_add in incoming:
+            slots, plan = targets[result_to_add.fid]
+            target = next(plan)
+            if target < 0:
+                slots.append(self._size)
+                self.append(result_to_add)
+            else:
+                _replace_dup(RegionView(self, int(slots[target])),
+                             result_to_add)
+
+    def _take(self, rows):
+        for name, col in self._columns.items():
+            taken = col[rows]
+            self._columns[name] = np.empty(max(len(taken), 1), dtype=col.dtype)
+            self._columns[name][:len(taken)] = taken
+        self._size = len(rows)
+        self._index = None
+
+    def remove(self, region_to_remove):
+        keep = np.ones(self._size, dtype=bool)
+        keep[region_to_remove._idx] = False
+        self._take(np.flatnonzero(keep))
+
+    def suppress(self, threshold=0.5):
+        boxes = np.stack([self.column("x"), self.column("y"),
+                          self.column("w"), self.column("h")], axis=1)
+        self._take(nms_indices(self.column("fid"), boxes,
+                               self.column("conf"), threshold))
+
+    def fill_gaps(self, number_of_frames):
+        if self._size == 0:
+            return
+        max_resolution = float(self.column("resolution").max())
+        missing = np.setdiff1d(np.arange(number_of_frames), self.column("fid"))
+        for fid in missing:
+            self.append(Region(int(fid), 0, 0, 0, 0, 0.1, "no obj",
+                               max_resolution))
+        self._take(np.argsort(self.column("fid"), kind="stable"))
+
+    def write_results_txt(self, fname):
+        cols = {name: self.column(name).tolist() for name in RESULTS_DTYPE.names}
+        with open(fname, "w") as results_file:
+            for i in range(self._size):
+                results_file.write(
+                    f"{cols['fid'][i]},{cols['x'][i]},{cols['y'][i]},"
+                    f"{cols['w'][i]},{cols['h'][i]},"
+                    f"{self.labels[cols['label'][i]]},{cols['conf'][i]},"
+                    f"{cols['resolution'][i]},"
+                    f"{self.origins[cols['origin'][i]]}\n")
+
+    def write_results_csv(self, fname):
+        with open(fname, "w") as results_files:
+            csv_writer = csv.writer(results_files)
+            for region in self.regions:
+                csv_writer.writerow([region.fid, region.x, region.y,
+                                     region.w, region.h,
+                                     region.label, region.conf,
+                                     region.resolution, region.origin])
+
+    def write_results_binary(self, fname):
+        write_results_binary(fname, self.to_records(), self.labels,
+                             self.origins)
+
+    def write(self, fname):
+        if is_binary_results_file(fname):
+            self.write_results_binary(fname)
+        elif re.match(r"\w+[.]csv\Z", fname):
+            self.write_results_csv(fname)
+        else:
+            self.write_results_txt(fname)
+
+
+def _replace_dup(dup_region, region_to_add):
+    final_object = None
+    if dup_region.origin == region_to_add.origin:
+        final_object = max([region_to_add, dup_region],
+                           key=lambda r: r.conf)
+    elif ("low" in dup_region.origin and
+          "high" in region_to_add.origin):
+        final_object = region_to_add
+    elif ("high" in dup_region.origin and
+          "low" in region_to_add.origin):
+        final_object = dup_region
+    dup_region.x = final_object.x
+    dup_region.y = final_object.y
+    dup_region.w = final_object.w
+    dup_region.h = final_object.h
+    dup_region.conf = final_object.conf
+    dup_region.origin = final_object.origin
+    dup_region.feature = None
+
+
+def _group_by_fid(regions):
+    grouped = {}
+    for region in regions:
+        if region.fid not in grouped:
+            grouped[region.fid] = []
+        grouped[region.fid].append(region)
+    return grouped
+
+
+def _region_boxes(regions):
+    return np.array([(r.x, r.y, r.w, r.h) for r in regions],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def box_iou_matrix(boxes, others):
+    # IoU between every (x, y, w, h) row of boxes and of others, computed
+    # with the same arithmetic as calc_iou.
+    x1, y1, w1, h1 = (boxes[:, i, None] for i in range(4))
+    x2, y2, w2, h2 = (others[None, :, i] for i in range(4))
+    inter_w = np.maximum(0, np.minimum(x1 + w1, x2 + w2) - np.maximum(x1, x2))
+    inter_h = np.maximum(0, np.minimum(y1 + h1, y2 + h2) - np.maximum(y1, y2))
+    inter = inter_w * inter_h
+    union = (np.maximum(0, w1) * np.maximum(0, h1)
+             + np.maximum(0, w2) * np.maximum(0, h2) - inter)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union != 0)
+
+
+_NMS_BLOCK = 1024
+
+
+def nms_indices(fids, boxes, confs, threshold):
+    # Greedy NMS with the semantics of Results.suppress: boxes only
+    # suppress boxes of the same frame, candidates are visited by
+    # decreasing confidence (ties keep their original order) and a box is
+    # dropped when its IoU with a kept box exceeds threshold. Returns the
+    # kept indices ordered by frame, then by decreasing confidence.
+    order = np.lexsort((np.arange(len(fids)), -confs, fids))
+    sorted_fids = fids[order]
+    bounds = np.flatnonzero(np.diff(sorted_fids)) + 1
+    keep = []
+    for group in np.split(order, bounds):
+        if len(group) == 1:
+            keep.append(group)
+            continue
+        group_boxes = boxes[group]
+        alive = np.ones(len(group), dtype=bool)
+        # Suppression is resolved a block of ranked boxes at a time against
+        # every surviving box ranked below the block start. Only rows that
+        # overlap something can suppress, so only those are visited.
+        for start in range(0, len(group), _NMS_BLOCK):
+            stop = min(start + _NMS_BLOCK, len(group))
+            cols = start + np.flatnonzero(alive[start:])
+            overlaps = box_iou_matrix(group_boxes[start:stop],
+                                      group_boxes[cols]) > threshold
+            overlaps &= cols[None, :] > np.arange(start, stop)[:, None]
+            for i in np.flatnonzero(overlaps.any(axis=1)):
+                if alive[start + i]:
+                    alive[cols[overlaps[i]]] = False
+        keep.append(group[alive])
+    if not keep:
+        return order
+    return np.concatenate(keep)
+
+
+def _plan_frame_merge(boxes, confs, labels, origins, incoming, threshold):
+    # Replays add_single_result for the regions of one frame without
+    # touching any Region: returns, for every incoming region, -1 if it is
+    # appended or the slot it is merged into. Slots are the existing
+    # regions followed by the incoming regions appended so far. The IoU of
+    # all incoming regions against the existing ones is a single matrix;
+    # only the columns of slots created or moved during the replay are
+    # recomputed.
+    n_existing, n_incoming = len(boxes), len(incoming)
+    capacity = n_existing + n_incoming
+    in_boxes = _region_boxes(incoming)
+    slot_boxes = np.empty((capacity, 4))
+    slot_boxes[:n_existing] = boxes
+    slot_confs = np.empty(capacity)
+    slot_confs[:n_existing] = confs
+    slot_origins = list(origins)
+
+    label_ids = {"-1": 0}
+    slot_labels = np.empty(capacity, dtype=np.int64)
+    for i, label in enumerate(labels):
+        slot_labels[i] = label_ids.setdefault(label, len(label_ids))
+    in_labels = [label_ids.setdefault(r.label, len(label_ids))
+                 for r in incoming]
+
+    ious = np.zeros((n_incoming, capacity))
+    if n_existing:
+        ious[:, :n_existing] = box_iou_matrix(in_boxes, slot_boxes[:n_existing])
+
+    def refresh(k, slot):
+        if k + 1 < n_incoming:
+            ious[k + 1:, slot] = box_iou_matrix(
+                in_boxes[k + 1:], slot_boxes[slot:slot + 1])[:, 0]
+
+    targets = []
+    n_slots = n_existing
+    for k, region in enumerate(incoming):
+        same = ious[k, :n_slots] > threshold
+        if in_labels[k] != 0:
+            same &= ((slot_labels[:n_slots] == in_labels[k]) |
+                     (slot_labels[:n_slots] == 0))
+        candidates = np.flatnonzero(same)
+        dup = -1
+        if len(candidates):
+            dup = int(candidates[np.argmax(slot_confs[candidates])])
+        if (dup < 0 or ("tracking" in region.origin and
+                        "tracking" in slot_origins[dup])):
+            targets.append(-1)
+            slot_boxes[n_slots] = in_boxes[k]
+            slot_confs[n_slots] = region.conf
+            slot_labels[n_slots] = in_labels[k]
+            slot_origins.append(region.origin)
+            refresh(k, n_slots)
+            n_slots += 1
+            continue
+        targets.append(dup)
+        dup_origin = slot_origins[dup]
+        if ((dup_origin == region.origin and region.conf >= slot_confs[dup]) or
+                (dup_origin != region.origin and "low" in dup_origin and
+                 "high" in region.origin)):
+            slot_boxes[dup] = in_boxes[k]
+            slot_confs[dup] = region.conf
+            slot_origins[dup] = region.origin
+            refresh(k, dup)
+    return targets
 
 
 def overlap(bb1, bb2):
@@ -330,60 +827,228 @@ def overlap(bb1, bb2):
         return True
 
 
-def pairwise_overlap_indexing_list(single_result_frame, iou_threshold):
-    pointwise = [[i] for i in range(len(single_result_frame))]
-    pairwise = [[i, j] for i, x in enumerate(single_result_frame)
-                for j, y in enumerate(single_result_frame)
-                if i != j if filter_bbox_group(x, y, iou_threshold)]
-    return pointwise + pairwise
-
-
-def simple_merge(single_result_frame, index_to_merge):
-
-    bbox_large = []
-    for i in index_to_merge:
-        i2np = np.array([j for j in i])
-        left = min(np.array(single_result_frame)[i2np], key=lambda x: x.x)
-        top = min(np.array(single_result_frame)[i2np], key=lambda x: x.y)
-        right = max(
-            np.array(single_result_frame)[i2np], key=lambda x: x.x + x.w)
-        bottom = max(
-            np.array(single_result_frame)[i2np], key=lambda x: x.y + x.h)
-
-        fid, x, y, w, h, conf, label, resolution, origin = (
-            left.fid, left.x, top.y, right.x + right.w - left.x,
-            bottom.y + bottom.h - top.y, left.conf, left.label,
-            left.resolution, left.origin)
-        single_merged_region = Region(fid, x, y, w, h, conf,
-                                      label, resolution, origin)
-        bbox_large.append(single_merged_region)
-    return bbox_large
+def connected_labels(n, src, dst):
+    # Union-find over the edges (src, dst) by min-label propagation with
+    # pointer jumping; every node ends up labelled with the smallest node
+    # index of its connected component.
+    labels = np.arange(n)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, src, labels[dst])
+        np.minimum.at(updated, dst, labels[src])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def merge_frame_boxes(regions, iou_threshold):
+    # Merges every connected group of same-label boxes whose IoU exceeds
+    # iou_threshold into their bounding box. Groups are returned largest
+    # first; the left-most box of a group provides fid, conf, label,
+    # resolution and origin.
+    n = len(regions)
+    boxes = _region_boxes(regions)
+    label_ids = {}
+    labels = np.array([label_ids.setdefault(r.label, len(label_ids))
+                       for r in regions])
+    linked = box_iou_matrix(boxes, boxes) > iou_threshold
+    linked &= labels[:, None] == labels[None, :]
+    src, dst = np.nonzero(np.triu(linked, k=1))
+    groups = connected_labels(n, src, dst)
+
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    top = np.full(n, np.inf)
+    right = np.full(n, -np.inf)
+    bottom = np.full(n, -np.inf)
+    np.minimum.at(top, groups, y1)
+    np.maximum.at(right, groups, x2)
+    np.maximum.at(bottom, groups, y2)
+    by_left = np.lexsort((np.arange(n), x1, groups))
+    first = np.ones(n, dtype=bool)
+    first[1:] = groups[by_left][1:] != groups[by_left][:-1]
+    left_of = dict(zip(groups[by_left][first].tolist(),
+                       by_left[first].tolist()))
+
+    roots = np.unique(groups)
+    sizes = np.bincount(groups, minlength=n)[roots]
+    merged_regions = []
+    for root in roots[np.lexsort((roots, -sizes))].tolist():
+        left = regions[left_of[root]]
+        merged_regions.append(Region(
+            left.fid, left.x, top[root], right[root] - left.x,
+            bottom[root] - top[root], left.conf, left.label,
+            left.resolution, left.origin))
+    return merged_regions
 
 
 def merge_boxes_in_results(results_dict, min_conf_threshold, iou_threshold):
     final_results = Results()
 
-
-    for _, regions in results_dict.items():
-        to_remove = []
-        for r in regions:
-            if r.conf < min_conf_threshold:
-                to_remove.append(r)
-        for r in to_remove:
-            regions.remove(r)
-
     for fid, regions in results_dict.items():
-        overlap_pairwise_list = pairwise_overlap_indexing_list(
-            regions, iou_threshold)
-        overlap_graph = to_graph(overlap_pairwise_list)
-        grouped_bbox_idx = [c for c in sorted(
-            connected_components(overlap_graph), key=len, reverse=True)]
-        merged_regions = simple_merge(regions, grouped_bbox_idx)
-        for r in merged_regions:
+        regions = [r for r in regions if r.conf >= min_conf_threshold]
+        if len(regions) == 0:
+            continue
+        for r in merge_frame_boxes(regions, iou_threshold):
             final_results.append(r)
     return final_results
 
 
+# Binary results file: magic, little-endian uint64 length of a JSON header
+# holding the row count and the label/origin tables, then the packed rows.
+BINARY_RESULTS_EXT = ".sdr"
+_BINARY_MAGIC = b"SDRES001"
+_BINARY_DTYPE = np.dtype([("fid", "<i4"), ("x", "<f8"), ("y", "<f8"),
+                          ("w", "<f8"), ("h", "<f8"), ("conf", "<f8"),
+                          ("label", "<i2"), ("resolution", "<f8"),
+                          ("origin", "<i2")])
+
+
+def is_binary_results_file(fname):
+    return str(fname).endswith(BINARY_RESULTS_EXT)
+
+
+def binary_records(regions):
+    # Binary results rows and label/origin tables straight from Region
+    # objects, so values keep double precision
+    labels, origins = {}, {}
+    rows = [(r.fid, r.x, r.y, r.w, r.h, r.conf,
+             labels.setdefault(r.label, len(labels)), r.resolution,
+             origins.setdefault(r.origin, len(origins))) for r in regions]
+    return np.array(rows, dtype=_BINARY_DTYPE), list(labels), list(origins)
+
+
+def write_results_binary(fname, records, labels, origins):
+    header = json.dumps({"count": len(records), "labels": list(labels),
+                         "origins": list(origins)}).encode()
+    with open(fname, "wb") as results_file:
+        results_file.write(_BINARY_MAGIC)
+        results_file.write(np.array(len(header), dtype="<u8").tobytes())
+        results_file.write(header)
+        results_file.write(np.asarray(records, dtype=_BINARY_DTYPE).tobytes())
+
+
+class BinaryResultsDict(Mapping):
+    # Read-only fid -> [Region] mapping over a binary results file. Rows are
+    # memory-mapped and a frame's regions are built (and memoized) only when
+    # the frame is looked up. Like read_results_txt_dict, "no obj" rows keep
+    # their frame as a key but contribute no regions.
+    def __init__(self, fname):
+        with open(fname, "rb") as results_file:
+            if results_file.read(len(_BINARY_MAGIC)) != _BINARY_MAGIC:
+                raise ValueError(f"{fname} is not a binary results file")
+            header_len = int(np.frombuffer(results_file.read(8), dtype="<u8")[0])
+            header = json.loads(results_file.read(header_len))
+        self.labels = header["labels"]
+        self.origins = header["origins"]
+        if header["count"] == 0:
+            self.records = np.empty(0, dtype=_BINARY_DTYPE)
+        else:
+            self.records = np.memmap(fname, dtype=_BINARY_DTYPE, mode="r",
+                                     offset=len(_BINARY_MAGIC) + 8 + header_len,
+                                     shape=(header["count"],))
+        self._index = None
+        self._cache = {}
+
+    def _frame_index(self):
+        if self._index is None:
+            fids = np.asarray(self.records["fid"])
+            order = np.argsort(fids, kind="stable")
+            unique_fids, starts = np.unique(fids[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            appearance = np.argsort(order[starts], kind="stable")
+            self._index = (unique_fids, starts, ends, order, appearance)
+        return self._index
+
+    def frame_slice(self, fid):
+        # Raw rows of a frame, "no obj" rows included
+        unique_fids, starts, ends, order, _ = self._frame_index()
+        pos = np.searchsorted(unique_fids, fid)
+        if pos >= len(unique_fids) or unique_fids[pos] != fid:
+            return self.records[:0]
+        return self.records[order[starts[pos]:ends[pos]]]
+
+    def __contains__(self, fid):
+        unique_fids = self._frame_index()[0]
+        pos = np.searchsorted(unique_fids, fid)
+        return bool(pos < len(unique_fids) and unique_fids[pos] == fid)
+
+    def __getitem__(self, fid):
+        if fid in self._cache:
+            return self._cache[fid]
+        if fid not in self:
+            raise KeyError(fid)
+        regions = []
+        for row in self.frame_slice(fid).tolist():
+            label = self.labels[row[6]]
+            if label == "no obj":
+                continue
+            regions.append(Region(row[0], row[1], row[2], row[3], row[4],
+                                  row[5], label, row[7], self.origins[row[8]]))
+        self._cache[fid] = regions
+        return regions
+
+    def __iter__(self):
+        unique_fids, _, _, _, appearance = self._frame_index()
+        return iter(unique_fids[appearance].tolist())
+
+    def __len__(self):
+        return len(self._frame_index()[0])
+
+
+def read_results_binary_dict(fname):
+    return BinaryResultsDict(fname)
+
+
+# Compact wire format for the region lists returned by the /low and /high
+# queries: magic, uint32 header length, JSON header with the label table and
+# the row count of each named section, then int32 (fid, label) and float32
+# (x, y, w, h, conf) arrays over the rows of all sections in header order
+REGIONS_MIMETYPE = "application/x-sd-regions"
+_REGIONS_MAGIC = b"SDREG001"
+
+
+def pack_region_lists(sections):
+    # sections maps a name to rows of [fid, x, y, w, h, conf, label]
+    labels = {}
+    ids, boxes = [], []
+    for rows in sections.values():
+        for fid, x, y, w, h, conf, label in rows:
+            ids.append((fid, labels.setdefault(label, len(labels))))
+            boxes.append((x, y, w, h, conf))
+    header = json.dumps({"labels": list(labels),
+                         "sections": {name: len(rows) for name, rows in sections.items()}}).encode()
+    return b"".join([_REGIONS_MAGIC,
+                     np.array(len(header), dtype="<u4").tobytes(), header,
+                     np.array(ids, dtype="<i4").reshape(-1, 2).tobytes(),
+                     np.array(boxes, dtype="<f4").reshape(-1, 5).tobytes()])
+
+
+def unpack_region_lists(data):
+    if data[:len(_REGIONS_MAGIC)] != _REGIONS_MAGIC:
+        raise ValueError("Not a packed region list")
+    offset = len(_REGIONS_MAGIC)
+    header_len = int(np.frombuffer(data, dtype="<u4", count=1, offset=offset)[0])
+    offset += 4
+    header = json.loads(data[offset:offset + header_len])
+    offset += header_len
+    count = sum(header["sections"].values())
+    ids = np.frombuffer(data, dtype="<i4", count=2 * count, offset=offset).reshape(-1, 2)
+    offset += ids.nbytes
+    boxes = np.frombuffer(data, dtype="<f4", count=5 * count, offset=offset).reshape(-1, 5)
+    labels = header["labels"]
+
+    sections = {}
+    start = 0
+    for name, n in header["sections"].items():
+        sections[name] = [[fid, *box, labels[label]]
+                          for (fid, label), box in zip(ids[start:start + n].tolist(),
+                                                       boxes[start:start + n].tolist())]
+        start += n
+    return sections
+
+
 def read_results_csv_dict(fname):
 
     results_dict = {}
@@ -443,14 +1108,83 @@ def read_results_txt_dict(fname):
     return results_dict
 
 
-def read_results_dict(fname):
+def _parse_results_dict(fname):
     # TODO: Need to implement a CSV function
-    if re.match(r"\w+[.]csv\Z", fname):
+    if is_binary_results_file(fname):
+        return read_results_binary_dict(fname)
+    elif re.match(r"\w+[.]csv\Z", fname):
         return read_results_csv_dict(fname)
     else:
         return read_results_txt_dict(fname)
 
 
+def _atomic_write(path, write_fn):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _results_file_digest(fname, cache_dir):
+    # Content hash of a results file, remembered per path together with the
+    # file's mtime and size so unchanged files are not re-hashed.
+    stat = os.stat(fname)
+    path_key = hashlib.sha1(os.path.abspath(fname).encode()).hexdigest()
+    meta_path = os.path.join(cache_dir, f"{path_key}.json")
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+            return meta["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha1()
+    with open(fname, "rb") as results_file:
+        for chunk in iter(lambda: results_file.read(1 << 20), b""):
+            digest.update(chunk)
+    meta = {"path": os.path.abspath(fname), "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size, "digest": digest.hexdigest()}
+
+    def write_meta(path):
+        with open(path, "w") as meta_file:
+            json.dump(meta, meta_file)
+    _atomic_write(meta_path, write_meta)
+    return meta["digest"]
+
+
+def _write_results_dict_binary(fname, results_dict):
+    # Frames without regions are kept as a single "no obj" row so they come
+    # back as empty keys, like they do from the text reader
+    rows = []
+    for fid, regions in results_dict.items():
+        if len(regions) == 0:
+            rows.append(Region(fid, 0, 0, 0, 0, 0.1, "no obj", 1.0))
+        rows.extend(regions)
+    write_results_binary(fname, *binary_records(rows))
+
+
+def read_results_dict(fname, cache_dir=None):
+    # With a cache_dir, text/CSV results are parsed once and stored as a
+    # binary results file keyed by the content hash of the source, so every
+    # process reading the same file afterwards only memory-maps it.
+    if cache_dir is None or is_binary_results_file(fname):
+        return _parse_results_dict(fname)
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = os.path.join(
+        cache_dir, _results_file_digest(fname, cache_dir) + BINARY_RESULTS_EXT)
+    if os.path.exists(cached_path):
+        return read_results_binary_dict(cached_path)
+    results_dict = _parse_results_dict(fname)
+    _atomic_write(cached_path,
+                  lambda path: _write_results_dict_binary(path, results_dict))
+    return results_dict
+
+
 def calc_intersection_area(a, b):
     to = max(a.y, b.y)
     le = max(a.x, b.x)
@@ -480,77 +1214,59 @@ def calc_iou(a, b):
 
     return intersection_area / union_area
 
-def get_interval_area(width, all_yes):
-    area = 0
-    for y1, y2 in all_yes:
-        area += (y2 - y1) * width
-    return area
-
-
-def insert_range_y(all_yes, y1, y2):
-    ranges_length = len(all_yes)
-    idx = 0
-    while idx < ranges_length:
-        if not (y1 > all_yes[idx][1] or all_yes[idx][0] > y2):
-            # Overlapping
-            y1 = min(y1, all_yes[idx][0])
-            y2 = max(y2, all_yes[idx][1])
-            del all_yes[idx]
-            ranges_length = len(all_yes)
-        else:
-            idx += 1
-
-    all_yes.append((y1, y2))
-
+class FrameCoverage:
+    # Union of the boxes of one frame on a coordinate-compressed grid: the
+    # distinct box edges split the frame into cells and a 2D prefix sum of
+    # +1/-1 corner marks tells which cells lie under at least one box.
+    def __init__(self, regions):
+        boxes = _region_boxes(regions)
+        x1, y1 = boxes[:, 0], boxes[:, 1]
+        x2 = x1 + np.maximum(0, boxes[:, 2])
+        y2 = y1 + np.maximum(0, boxes[:, 3])
+        self.xs = np.unique(np.concatenate([x1, x2]))
+        self.ys = np.unique(np.concatenate([y1, y2]))
+        xi1, xi2 = np.searchsorted(self.xs, x1), np.searchsorted(self.xs, x2)
+        yi1, yi2 = np.searchsorted(self.ys, y1), np.searchsorted(self.ys, y2)
+        marks = np.zeros((len(self.ys) + 1, len(self.xs) + 1), dtype=np.int64)
+        np.add.at(marks, (yi1, xi1), 1)
+        np.add.at(marks, (yi1, xi2), -1)
+        np.add.at(marks, (yi2, xi1), -1)
+        np.add.at(marks, (yi2, xi2), 1)
+        depth = marks.cumsum(axis=0).cumsum(axis=1)
+        self.covered = (depth[:len(self.ys) - 1, :len(self.xs) - 1] > 0
+                        if len(self.xs) > 1 and len(self.ys) > 1
+                        else np.zeros((0, 0), dtype=bool))
+        self.area = float(np.diff(self.ys) @ self.covered @ np.diff(self.xs)) \
+            if self.covered.size else 0.0
+
+    def covered_area(self, region):
+        if not self.covered.size:
+            return 0.0
+        x2 = region.x + max(0, region.w)
+        y2 = region.y + max(0, region.h)
+        dx = np.clip(np.minimum(self.xs[1:], x2)
+                     - np.maximum(self.xs[:-1], region.x), 0, None)
+        dy = np.clip(np.minimum(self.ys[1:], y2)
+                     - np.maximum(self.ys[:-1], region.y), 0, None)
+        return float(dy @ self.covered @ dx)
 
-def get_y_ranges(regions, j, x1, x2):
-    all_yes = []
-    while j < len(regions):
-        if (x1 < (regions[j].x + regions[j].w) and
-                x2 > regions[j].x):
-            y1 = regions[j].y
-            y2 = regions[j].y + regions[j].h
-            insert_range_y(all_yes, y1, y2)
-        j += 1
-    return all_yes
+    def extra_area(self, region):
+        # Area the region would add to the union of the frame's boxes.
+        return calc_area(region) - self.covered_area(region)
 
 
 def compute_area_of_frame(regions):
-
-    regions.sort(key=lambda r: r.x + r.w)
-
-    all_xes = []
-    for r in regions:
-        all_xes.append(r.x)
-        all_xes.append(r.x + r.w)
-    all_xes.sort()
-
-    area = 0
-    j = 0
-    for i in range(len(all_xes) - 1):
-        x1 = all_xes[i]
-        x2 = all_xes[i + 1]
-
-        if x1 < x2:
-
-            while (regions[j].x + regions[j].w) < x1:
-                j += 1
-            all_yes = get_y_ranges(regions, j, x1, x2)
-            area += get_interval_area(x2 - x1, all_yes)
-
-    return area
+    if len(regions) == 0:
+        return 0
+    return FrameCoverage(regions).area
 
 
 def compute_area_of_regions(results):
     if len(results.regions) == 0:
         return 0
 
-    min_frame = min([r.fid for r in results.regions])
-    max_frame = max([r.fid for r in results.regions])
-
     total_area = 0
-    for fid in range(min_frame, max_frame + 1):
-        regions_for_frame = [r for r in results.regions if r.fid == fid]
+    for regions_for_frame in _group_by_fid(results.regions).values():
         total_area += compute_area_of_frame(regions_for_frame)
 
     return total_area
@@ -574,6 +1290,7 @@ def compress_and_get_size(images_path, start_id, end_id, qp,
                                               "-vf", scale,
                                               "-frames:v",
                                               str(number_of_frames),
+                                              "-movflags", "+faststart",
                                               encoded_vid_path],
                                              stdout=subprocess.PIPE,
                                              stderr=subprocess.PIPE,
@@ -591,6 +1308,7 @@ def compress_and_get_size(images_path, start_id, end_id, qp,
                                               "-vf", scale,
                                               "-frames:v",
                                               str(number_of_frames),
+                                              "-movflags", "+faststart",
                                               encoded_vid_path],
                                              stdout=subprocess.PIPE,
                                              stderr=subprocess.PIPE,
@@ -602,6 +1320,7 @@ def compress_and_get_size(images_path, start_id, end_id, qp,
                                           "-loglevel", "error",
                                           "-vcodec", "libx264",
                                           "-pix_fmt", "yuv420p", "-crf", "23",
+                                          "-movflags", "+faststart",
                                           encoded_vid_path],
                                          stdout=subprocess.PIPE,
                                          stderr=subprocess.PIPE,
@@ -620,12 +1339,15 @@ def compress_and_get_size(images_path, start_id, end_id, qp,
     return size
 
 
-def extract_images_from_video(images_path, req_regions):
+def extract_images_from_video(images_path, req_regions, image_extension=None):
     if not os.path.isdir(images_path):
         return
-    image_extension=get_image_extension(images_path)
+    # Encoded batches no longer leave their input frames next to temp.mp4,
+    # so fall back to the jpg frames the pipeline reads everywhere else
+    image_extension = (image_extension or get_image_extension(images_path)
+                       or "jpg")
     for fname in os.listdir(images_path):
-        if "image_extension" not in fname:
+        if not fname.endswith(f".{image_extension}"):
             continue
         else:
             os.remove(os.path.join(images_path, fname))
@@ -658,19 +1380,155 @@ def extract_images_from_video(images_path, req_regions):
     for fid, fname in fids_mapping:
         os.rename(os.path.join(f"{fname}_temp"),
                   os.path.join(images_path, f"{str(fid).zfill(8)}.{image_extension}"))
-def cache_images(images_direc, image_extension, region_list):
+class DecodingError(RuntimeError):
+    # An encoded batch ffmpeg could not decode, e.g. a corrupt upload
+    pass
+
+
+class EncodingError(RuntimeError):
+    # A batch ffmpeg could not encode; raised in the codec pool workers, so
+    # it reaches the caller through the batch's future
+    pass
+
+
+def decode_video_frames(encoded_video, req_regions):
+    # Decodes an encoded batch (a path, the encoded bytes or a file-like
+    # upload, which is streamed through decode_video_stream) straight into
+    # BGR arrays, mapped to the sorted fids of req_regions the same way
+    # extract_images_from_video renames the frames it dumps. ffmpeg cannot
+    # seek its stdin, so videos given as bytes must be faststart.
+    if isinstance(encoded_video, (bytes, bytearray)):
+        source, stdin_data = "pipe:0", bytes(encoded_video)
+    else:
+        source, stdin_data = encoded_video, None
+    if hasattr(encoded_video, "read"):
+        return decode_video_stream(iter(lambda: encoded_video.read(1 << 16), b""),
+                                   req_regions)
+    probe_result = subprocess.run(["ffprobe", "-v", "error",
+                                   "-select_streams", "v:0",
+                                   "-show_entries", "stream=width,height",
+                                   "-of", "csv=p=0", source],
+                                  input=stdin_data,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+    decoding_result = subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                                      "-i", source, "-vsync", "0",
+                                      "-f", "rawvideo", "-pix_fmt", "bgr24",
+                                      "pipe:1"],
+                                     input=stdin_data,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+    if probe_result.returncode != 0 or decoding_result.returncode != 0:
+        raise DecodingError(
+            "Decoding failed: "
+            + probe_result.stderr.decode(errors="replace")
+            + decoding_result.stderr.decode(errors="replace"))
+
+    width, height = [int(e) for e in
+                     probe_result.stdout.decode().strip().split(",")[:2]]
+    frames = np.frombuffer(decoding_result.stdout, dtype=np.uint8)
+    # Copied so callers get writable frames, like cv.imread gives them
+    frames = frames.reshape(-1, height, width, 3).copy()
+    fids = sorted(set([r.fid for r in req_regions.regions]))
+    return {fid: frame for fid, frame in zip(fids, frames)}
+
+
+def decode_video_stream(chunks, req_regions):
+    # Decodes an encoded batch while it is still arriving: chunks are fed to
+    # ffmpeg from a thread and frames are read back as they are decoded.
+    # Frames come out as BMP images so each one carries its own size.
+    decoder = subprocess.Popen(["ffmpeg", "-loglevel", "error",
+                                "-i", "pipe:0", "-vsync", "0",
+                                "-f", "image2pipe", "-vcodec", "bmp", "pipe:1"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in chunks:
+                decoder.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            decoder.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    frames = []
+    while True:
+        file_header = decoder.stdout.read(14)
+        if len(file_header) < 14:
+            break
+        file_size = int.from_bytes(file_header[2:6], "little")
+        image = file_header + decoder.stdout.read(file_size - 14)
+        frames.append(cv.imdecode(np.frombuffer(image, dtype=np.uint8),
+                                  cv.IMREAD_COLOR))
+    feeder.join()
+    stderr = decoder.stderr.read()
+    if decoder.wait() != 0:
+        raise DecodingError("Decoding failed: " + stderr.decode(errors="replace"))
+
+    fids = sorted(set([r.fid for r in req_regions.regions]))
+    return {fid: frame for fid, frame in zip(fids, frames)}
+
+
+def merge_frames(high_frames, low_frames, req_regions):
+    # In-memory merge_images: each low frame is upscaled to the size of its
+    # high frame and the requested regions are pasted in from the high frame
+    images = {}
+    for fid, high_image in high_frames.items():
+        height, width = high_image.shape[:2]
+        enlarged_image = cv.resize(low_frames[fid], (width, height), fx=0, fy=0,
+                                   interpolation=cv.INTER_CUBIC)
+        for r in req_regions.regions_dict.get(fid, []):
+            x0 = int(r.x * width)
+            y0 = int(r.y * height)
+            x1 = int((r.w * width) + x0 - 1)
+            y1 = int((r.h * height) + y0 - 1)
+            enlarged_image[y0:y1, x0:x1, :] = high_image[y0:y1, x0:x1, :]
+        images[fid] = enlarged_image
+    return images
+
+
+def crop_regions(frames, req_regions):
+    # Pixel crops of the requested regions as (fid, crop, (x, y, w, h)), the
+    # box being the crop's extent in normalized frame coordinates
+    crops = []
+    for fid in sorted(frames):
+        image = frames[fid]
+        height, width = image.shape[:2]
+        for r in req_regions.regions_dict.get(fid, []):
+            x0 = min(max(int(r.x * width), 0), width)
+            y0 = min(max(int(r.y * height), 0), height)
+            x1 = min(x0 + int(r.w * width), width)
+            y1 = min(y0 + int(r.h * height), height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            crops.append((fid, image[y0:y1, x0:x1],
+                          (x0 / width, y0 / height,
+                           (x1 - x0) / width, (y1 - y0) / height)))
+    return crops
+
+
+def cache_images(images_direc, image_extension, region_list, frame_store=None):
     image_cache = {}
     for region in region_list:
         if region.fid not in image_cache:
             image_path = os.path.join(images_direc, f"{str(region.fid).zfill(8)}.{image_extension}")
-            image_cache[region.fid] = cv.imread(image_path)
+            if frame_store is not None:
+                image_cache[region.fid] = frame_store.read(image_path)
+            else:
+                image_cache[region.fid] = cv.imread(image_path)
     return image_cache
 
 
-def crop_images(results, vid_name, images_direc, image_extension, resolution=None):
-
-    image_cache = cache_images(images_direc, image_extension, results.regions)
+def crop_frames(results, images_direc, image_extension, resolution=None,
+                frame_store=None):
+    # Cropped (and optionally resized) frames in fid order, kept in memory
+    image_cache = cache_images(images_direc, image_extension, results.regions,
+                               frame_store)
     cropped_images = {}
+    full_frame_fids = set()
 
     for region in results.regions:
         cached_image = (region.fid, image_cache[region.fid])
@@ -678,6 +1536,7 @@ def crop_images(results, vid_name, images_direc, image_extension, resolution=Non
 
         if region.x == 0 and region.y == 0 and region.w == 1 and region.h == 1:
             cropped_images[region.fid] = cached_image[1]
+            full_frame_fids.add(region.fid)
             continue
 
         width = cached_image[1].shape[1]
@@ -694,16 +1553,26 @@ def crop_images(results, vid_name, images_direc, image_extension, resolution=Non
         cropped_image = cropped_images[region.fid]
         cropped_image[y0:y1, x0:x1, :] = cached_image[1][y0:y1, x0:x1, :]
 
-
-    os.makedirs(vid_name, exist_ok=True)
-    frames_count = len(cropped_images)
-    frames = sorted(cropped_images.items(), key=lambda e: e[0])
-    for idx, (_, frame) in enumerate(frames):
+    frames = []
+    for fid, frame in sorted(cropped_images.items(), key=lambda e: e[0]):
+        if resolution and frame_store is not None and fid in full_frame_fids:
+            # Uncropped frames reuse the store's resized variant
+            frames.append(frame_store.read_frame(images_direc, fid, image_extension,
+                                                 resolution))
+            continue
         if resolution:
             w = int(frame.shape[1] * resolution)
             h = int(frame.shape[0] * resolution)
             frame = cv.resize(frame, (w, h), fx=0, fy=0, interpolation=cv.INTER_CUBIC)
+        frames.append(frame)
+    return frames
+
 
+def crop_images(results, vid_name, images_direc, image_extension, resolution=None):
+    frames = crop_frames(results, images_direc, image_extension, resolution)
+
+    os.makedirs(vid_name, exist_ok=True)
+    for idx, frame in enumerate(frames):
         if image_extension == "png":
             cv.imwrite(os.path.join(vid_name, f"{str(idx).zfill(8)}.{image_extension}"), frame,
                        [cv.IMWRITE_PNG_COMPRESSION, 0])
@@ -711,8 +1580,102 @@ def crop_images(results, vid_name, images_direc, image_extension, resolution=Non
             cv.imwrite(os.path.join(vid_name, f"{str(idx).zfill(8)}.{image_extension}"), frame,
                        [cv.IMWRITE_JPEG_QUALITY, 100])
 
-    return frames_count
+    return len(frames)
+
+
+def encode_frames(frames, encoded_vid_path, qp, enforce_iframes=False):
+    # Pipes raw BGR frames into ffmpeg over stdin, so only the encoded video
+    # is written. Same encoder settings as compress_and_get_size with
+    # resolution=1. Returns the encoded size and bytes. Without a path the
+    # video goes to a private temporary file that is removed afterwards.
+    if len(frames) == 0:
+        return 0, b""
+    if encoded_vid_path is None:
+        fd, temp_path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        try:
+            return encode_frames(frames, temp_path, qp, enforce_iframes)
+        finally:
+            os.remove(temp_path)
+    height, width = frames[0].shape[:2]
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "bgr24",
+               "-s", f"{width}x{height}", "-i", "-"]
+    if enforce_iframes:
+        command += ["-vcodec", "libx264", "-g", "15", "-keyint_min", "15"]
+        if qp:
+            command += ["-qp", f"{qp}"]
+        command += ["-pix_fmt", "yuv420p",
+                    "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+                    "-frames:v", str(len(frames))]
+    else:
+        command += ["-vcodec", "libx264", "-pix_fmt", "yuv420p", "-crf", "23"]
+    # moov atom up front so the video can be decoded from a pipe
+    command += ["-movflags", "+faststart", encoded_vid_path]
+
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for frame in frames:
+            encoder.stdin.write(np.ascontiguousarray(frame).tobytes())
+    except BrokenPipeError:
+        pass
+    _, stderr = encoder.communicate()
+    if encoder.returncode != 0:
+        raise EncodingError("Encoding failed: " + stderr.decode(errors="replace"))
+
+    with open(encoded_vid_path, "rb") as encoded_file:
+        encoded = encoded_file.read()
+    return len(encoded), encoded
+
+
+def encode_regions(results, images_direc, resolution, qp, enforce_iframes,
+                   encoded_vid_path=None, frame_store=None):
+    # Crops and encodes the regions of a batch; returns (size, encoded bytes)
+    image_extension = get_image_extension(images_direc)
+    frames = crop_frames(results, images_direc, image_extension, resolution,
+                         frame_store)
+    return encode_frames(frames, encoded_vid_path, qp, enforce_iframes)
+
+
+def transcode_regions(results, images_direc, resolution, qp, enforce_iframes,
+                      frame_store=None):
+    # Encodes the regions of a batch and decodes them back into the frames
+    # the server would see; returns (size, frames by fid)
+    size, encoded = encode_regions(results, images_direc, resolution, qp,
+                                   enforce_iframes, frame_store=frame_store)
+    return size, decode_video_frames(encoded, results)
+
+
+class CodecPool:
+    # Long-lived worker threads for encode and decode jobs. The heavy work
+    # runs in the ffmpeg processes, so threads are enough for batches to be
+    # encoded or decoded while the caller keeps running detection. Used as a
+    # context manager, the workers are shut down even if the caller fails.
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def encode_regions(self, results, images_direc, resolution, qp,
+                       enforce_iframes, encoded_vid_path=None, frame_store=None):
+        return self._executor.submit(encode_regions, results, images_direc,
+                                     resolution, qp, enforce_iframes,
+                                     encoded_vid_path, frame_store)
+
+    def transcode_regions(self, results, images_direc, resolution, qp,
+                          enforce_iframes, frame_store=None):
+        return self._executor.submit(transcode_regions, results, images_direc,
+                                     resolution, qp, enforce_iframes,
+                                     frame_store)
 
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
 
 
 def merge_images(cropped_images_direc, low_images_direc, req_regions):
@@ -754,16 +1717,14 @@ def merge_images(cropped_images_direc, low_images_direc, req_regions):
 
 
 def compute_regions_size(results, vid_name, images_direc, resolution, qp,
-                         enforce_iframes, estimate_banwidth=True):
+                         enforce_iframes, estimate_banwidth=True, frame_store=None):
     if estimate_banwidth:
 
         vid_name = f"{vid_name}-cropped"
-        image_extension=get_image_extension(images_direc)
-
-
-        frames_count = crop_images(results, vid_name, images_direc, image_extension, resolution)
-
-        size = compress_and_get_size(vid_name, 0, frames_count, qp=qp, enforce_iframes=enforce_iframes, resolution=1)
+        os.makedirs(vid_name, exist_ok=True)
+        size, _ = encode_regions(results, images_direc, resolution, qp,
+                                 enforce_iframes, os.path.join(vid_name, "temp.mp4"),
+                                 frame_store)
 
         pixel_size = compute_area_of_regions(results)
         return size, pixel_size
@@ -843,77 +1804,216 @@ def iou(b1, b2):
         return overlap/(w1*h1+w2*h2-overlap)
 
 
-def evaluate(max_fid, map_dd, map_gt, gt_confid_thresh, mpeg_confid_thresh,
-             max_area_thresh_gt, max_area_thresh_mpeg, iou_thresh=0.3):
-    tp_list = []
-    fp_list = []
-    fn_list = []
-    count_list = []
-    for fid in range(max_fid+1):
-        if fid not in map_dd:
-            print(f"Warning: fid {fid} not found in map_dd")
-            bboxes_dd = []
-        else:
-            bboxes_dd = map_dd[fid]
-
-        if fid not in map_gt:
-            print(f"Warning: fid {fid} not found in map_gt")
-            bboxes_gt = []
-        else:
-            bboxes_gt = map_gt[fid]
-
-        bboxes_dd = filter_results(
-            bboxes_dd, gt_flag=False, gt_confid_thresh=gt_confid_thresh,
-            mpeg_confid_thresh=mpeg_confid_thresh,
-            max_area_thresh_gt=max_area_thresh_gt,
-            max_area_thresh_mpeg=max_area_thresh_mpeg)
-        bboxes_gt = filter_results(
-            bboxes_gt, gt_flag=True, gt_confid_thresh=gt_confid_thresh,
-            mpeg_confid_thresh=mpeg_confid_thresh,
-            max_area_thresh_gt=max_area_thresh_gt,
-            max_area_thresh_mpeg=max_area_thresh_mpeg)
-        tp = 0
-        fp = 0
-        fn = 0
-        count = 0
-        for b_dd in bboxes_dd:
-            found = False
-            for b_gt in bboxes_gt:
-                if iou(b_dd, b_gt) >= iou_thresh:
-                    found = True
-                    break
-            if found:
-                tp += 1
-            else:
-                fp += 1
-        for b_gt in bboxes_gt:
-            found = False
-            for b_dd in bboxes_dd:
-                if iou(b_dd, b_gt) >= iou_thresh:
-                    found = True
-                    break
-            if not found:
-                fn += 1
-            else:
-                count += 1
-        tp_list.append(tp)
-        fp_list.append(fp)
-        fn_list.append(fn)
-        count_list.append(count)
-    tp = sum(tp_list)
-    fp = sum(fp_list)
-    fn = sum(fn_list)
-    count = sum(count_list)
-
+def _results_map_columns(results_map):
+    # fid, box, conf and label columns of every region in a fid -> regions
+    # mapping, read straight from the arrays for columnar containers
+    if isinstance(results_map, BinaryResultsDict):
+        records = results_map.records
+        labels = np.array(results_map.labels, dtype=object)[records["label"]]
+        boxes = np.stack([records["x"], records["y"],
+                          records["w"], records["h"]], axis=1)
+        return records["fid"], boxes, np.asarray(records["conf"]), labels
+    if isinstance(results_map, _FrameRegionsView):
+        results = results_map._results
+        labels = np.array(results.labels, dtype=object)[results.column("label")]
+        boxes = np.stack([results.column("x"), results.column("y"),
+                          results.column("w"), results.column("h")], axis=1)
+        return results.column("fid"), boxes, results.column("conf"), labels
+    regions = [r for frame_regions in results_map.values()
+               for r in frame_regions]
+    return (np.array([r.fid for r in regions], dtype=np.int64),
+            _region_boxes(regions),
+            np.array([r.conf for r in regions], dtype=np.float64),
+            np.array([r.label for r in regions], dtype=object))
+
+
+def _evaluation_boxes(results_map, max_fid, confid_thresh, max_area_thresh):
+    # Vectorized filter_results over a whole mapping; returns the kept
+    # fids, boxes and confs of frames 0..max_fid sorted by fid
+    relevant_classes = ["vehicle"]
+    fids, boxes, confs, labels = _results_map_columns(results_map)
+    keep = ((confs >= confid_thresh)
+            & (boxes[:, 2] * boxes[:, 3] <= max_area_thresh)
+            & np.isin(labels, relevant_classes)
+            & (fids >= 0) & (fids <= max_fid))
+    order = np.flatnonzero(keep)
+    order = order[np.argsort(fids[order], kind="stable")]
+    return fids[order], boxes[order], confs[order]
+
+
+def _box_pairs(dd, gt):
+    # Every detection paired with every GT box of its frame in one flat
+    # batch instead of a loop over frames; returns the pair indices and IoUs
+    fids_dd, boxes_dd, _ = dd
+    fids_gt, boxes_gt, _ = gt
+    gt_start = np.searchsorted(fids_gt, fids_dd, side="left")
+    gt_count = np.searchsorted(fids_gt, fids_dd, side="right") - gt_start
+    pair_dd = np.repeat(np.arange(len(fids_dd)), gt_count)
+    offsets = np.arange(len(pair_dd)) - np.repeat(np.cumsum(gt_count) - gt_count,
+                                                  gt_count)
+    pair_gt = np.repeat(gt_start, gt_count) + offsets
+
+    x1, y1, w1, h1 = boxes_dd[pair_dd].T
+    x2, y2, w2, h2 = boxes_gt[pair_gt].T
+    inter_w = np.maximum(0, np.minimum(x1 + w1, x2 + w2) - np.maximum(x1, x2))
+    inter_h = np.maximum(0, np.minimum(y1 + h1, y2 + h2) - np.maximum(y1, y2))
+    inter = inter_w * inter_h
+    union = (np.maximum(0, w1) * np.maximum(0, h1)
+             + np.maximum(0, w2) * np.maximum(0, h2) - inter)
+    ious = np.divide(inter, union, out=np.zeros_like(inter), where=union != 0)
+    return pair_dd, pair_gt, ious
+
+
+def _greedy_matched(confs_dd, pair_dd, pair_gt, ious):
+    # Greedy assignment over candidate pairs: detections in decreasing
+    # confidence each take the best-overlapping GT box of their frame that
+    # is still free. Returns a per-detection matched mask.
+    order = np.lexsort((pair_gt, -ious, pair_dd, -confs_dd[pair_dd]))
+    matched = np.zeros(len(confs_dd), dtype=bool)
+    used_gt = set()
+    for i, j in zip(pair_dd[order].tolist(), pair_gt[order].tolist()):
+        if not matched[i] and j not in used_gt:
+            matched[i] = True
+            used_gt.add(j)
+    return matched
+
+
+def _match_boxes(dd, gt, iou_thresh, one_to_one):
+    # Returns (tp, fp, fn, count)
+    pair_dd, pair_gt, ious = _box_pairs(dd, gt)
+    keep = ious >= iou_thresh
+    pair_dd, pair_gt, ious = pair_dd[keep], pair_gt[keep], ious[keep]
+    n_dd, n_gt = len(dd[0]), len(gt[0])
+    if not one_to_one:
+        tp = len(np.unique(pair_dd))
+        count = len(np.unique(pair_gt))
+        return tp, n_dd - tp, n_gt - count, count
+    tp = int(np.count_nonzero(_greedy_matched(dd[2], pair_dd, pair_gt, ious)))
+    return tp, n_dd - tp, n_gt - tp, tp
+
+
+def _average_precision(confs, matched, n_gt):
+    # All-point interpolated area under the precision/recall curve
+    if n_gt == 0 or len(confs) == 0:
+        return 0.0, np.zeros(0), np.zeros(0)
+    order = np.argsort(-confs, kind="stable")
+    tp = np.cumsum(matched[order])
+    precision = tp / np.arange(1, len(order) + 1)
+    recall = tp / n_gt
+    envelope = np.maximum.accumulate(precision[::-1])[::-1]
+    ap = float(np.sum(np.diff(recall, prepend=0.0) * envelope))
+    return ap, precision, recall
+
+
+def _evaluation_scores(tp, fp, fn):
     precision = round(tp / (tp + fp), 3) if (tp + fp) != 0 else 0
     recall = round(tp / (tp + fn), 3) if (tp + fn) != 0 else 0
     f1 = round(2.0 * tp / (2.0 * tp + fp + fn), 3) if (2.0 * tp + fp + fn) != 0 else 0
+    return precision, recall, f1
 
-    return (tp, fp, fn, count, precision, recall, f1)
 
+def _evaluate_against(max_fid, map_dd, map_gt, gt, mpeg_confid_thresh,
+                      max_area_thresh_mpeg, iou_thresh, one_to_one):
+    dd_fids = set(map_dd.keys())
+    gt_fids = set(map_gt.keys())
+    for fid in range(max_fid+1):
+        if fid not in dd_fids:
+            print(f"Warning: fid {fid} not found in map_dd")
+        if fid not in gt_fids:
+            print(f"Warning: fid {fid} not found in map_gt")
+    dd = _evaluation_boxes(map_dd, max_fid, mpeg_confid_thresh,
+                           max_area_thresh_mpeg)
+    tp, fp, fn, count = _match_boxes(dd, gt, iou_thresh, one_to_one)
+    return (tp, fp, fn, count) + _evaluation_scores(tp, fp, fn)
 
 
-def write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt):
+def evaluate(max_fid, map_dd, map_gt, gt_confid_thresh, mpeg_confid_thresh,
+             max_area_thresh_gt, max_area_thresh_mpeg, iou_thresh=0.3,
+             one_to_one=False):
+    # Without one_to_one a detection is a TP if it overlaps any GT box and a
+    # GT box is found if any detection overlaps it; with one_to_one every GT
+    # box can be matched by at most one detection.
+    gt = _evaluation_boxes(map_gt, max_fid, gt_confid_thresh,
+                           max_area_thresh_gt)
+    return _evaluate_against(max_fid, map_dd, map_gt, gt,
+                             mpeg_confid_thresh, max_area_thresh_mpeg,
+                             iou_thresh, one_to_one)
+
+
+def evaluate_many(max_fid, maps_dd, map_gt, gt_confid_thresh,
+                  mpeg_confid_thresh, max_area_thresh_gt,
+                  max_area_thresh_mpeg, iou_thresh=0.3, one_to_one=False):
+    # evaluate() for several result mappings (a dict of name -> mapping)
+    # against one ground truth, which is filtered and sorted only once
+    gt = _evaluation_boxes(map_gt, max_fid, gt_confid_thresh,
+                           max_area_thresh_gt)
+    return {name: _evaluate_against(max_fid, map_dd, map_gt, gt,
+                                    mpeg_confid_thresh, max_area_thresh_mpeg,
+                                    iou_thresh, one_to_one)
+            for name, map_dd in maps_dd.items()}
+
+
+def evaluate_grid(max_fid, map_dd, map_gt, gt_confid_thresh,
+                  mpeg_confid_threshs, max_area_thresh_gt,
+                  max_area_thresh_mpeg, iou_threshs, one_to_one=False):
+    # evaluate() over every (iou_thresh, mpeg_confid_thresh) combination.
+    # Detections are filtered at the lowest confidence and their IoUs with
+    # the ground truth computed once; each grid cell only re-masks them.
+    # Also returns the PR curve and AP per IoU threshold (greedy one-to-one
+    # matching, as usual for AP) and their mean.
+    gt = _evaluation_boxes(map_gt, max_fid, gt_confid_thresh,
+                           max_area_thresh_gt)
+    dd = _evaluation_boxes(map_dd, max_fid, min(mpeg_confid_threshs),
+                           max_area_thresh_mpeg)
+    confs_dd = dd[2]
+    n_gt = len(gt[0])
+    all_pairs = _box_pairs(dd, gt)
+
+    grid = {}
+    pr_curves = {}
+    aps = {}
+    for iou_thresh in iou_threshs:
+        keep = all_pairs[2] >= iou_thresh
+        pair_dd, pair_gt, ious = (e[keep] for e in all_pairs)
+        # Greedy matching walks detections by confidence, so the matches at
+        # any higher confidence threshold are a prefix of these
+        matched = _greedy_matched(confs_dd, pair_dd, pair_gt, ious)
+        ap, precision, recall = _average_precision(confs_dd, matched, n_gt)
+        aps[iou_thresh] = ap
+        pr_curves[iou_thresh] = (precision, recall)
+        for confid_thresh in mpeg_confid_threshs:
+            n_dd = int(np.count_nonzero(confs_dd >= confid_thresh))
+            if one_to_one:
+                tp = int(np.count_nonzero(matched & (confs_dd >= confid_thresh)))
+                count = tp
+            else:
+                above = confs_dd[pair_dd] >= confid_thresh
+                tp = len(np.unique(pair_dd[above]))
+                count = len(np.unique(pair_gt[above]))
+            fp, fn = n_dd - tp, n_gt - count
+            grid[(iou_thresh, confid_thresh)] = (
+                (tp, fp, fn, count) + _evaluation_scores(tp, fp, fn))
+    mean_ap = float(np.mean(list(aps.values()))) if aps else 0.0
+    return grid, pr_curves, aps, mean_ap
+
+
+def evaluation_grid_columns(grid, aps, mean_ap):
+    # Flattens evaluate_grid() output into extra write_stats columns
+    columns = {}
+    for (iou_thresh, confid_thresh), (tp, fp, fn, _, _, _, f1) in grid.items():
+        suffix = f"@iou{iou_thresh}-conf{confid_thresh}"
+        columns[f"TP{suffix}"] = tp
+        columns[f"FP{suffix}"] = fp
+        columns[f"FN{suffix}"] = fn
+        columns[f"F1{suffix}"] = f1
+    for iou_thresh, ap in aps.items():
+        columns[f"AP@iou{iou_thresh}"] = round(ap, 3)
+    columns["mAP"] = round(mean_ap, 3)
+    return columns
+
+
+def write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt,
+                    extra_columns=None):
     header = ("video-name,low-resolution,high-resolution,low_qp,high_qp,"
               "batch-size,low-threshold,high-threshold,"
               "tracker-length,TP,FP,FN,F1,"
@@ -928,6 +2028,9 @@ def write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode,
              f"{frames_count},{mode},"
              f"{lt['transmission']},{lt['inference_reuse']},"
              f"{lt['roi_prediction']},{lt['inference_sharing']},{lt['total_time']}")
+    if extra_columns:
+        header += "," + ",".join(extra_columns.keys())
+        stats += "," + ",".join(str(v) for v in extra_columns.values())
 
     if not os.path.isfile(fname):
         str_to_write = f"{header}\n{stats}\n"
@@ -937,7 +2040,8 @@ def write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode,
     with open(fname, "a") as f:
         f.write(str_to_write)
 
-def write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt):
+def write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt,
+                    extra_columns=None):
     header = ("video-name,low-resolution,high-resolution,low-qp,high-qp,"
               "batch-size,low-threshold,high-threshold,"
               "tracker-length,TP,FP,FN,F1,"
@@ -952,6 +2056,9 @@ def write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode,
              f"{frames_count},{mode},"
              f"{lt['transmission']},{lt['inference_reuse']},"
              f"{lt['roi_prediction']},{lt['inference_sharing']},{lt['total_time']}").split(",")
+    if extra_columns:
+        header += list(extra_columns.keys())
+        stats += list(extra_columns.values())
 
     with open(fname, "a") as results_files:
         csv_writer = csv.writer(results_files)
@@ -960,12 +2067,15 @@ def write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode,
             csv_writer.writerow(header)
         csv_writer.writerow(stats)
 
-def write_stats(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt):
+def write_stats(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt,
+                extra_columns=None):
 
     if re.match(r"\w+[.]csv\Z", fname):
-        write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt)
+        write_stats_csv(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt,
+                        extra_columns)
     else:
-        write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt)
+        write_stats_txt(fname, vid_name, config, f1, stats, bw, frames_count, mode, lt,
+                        extra_columns)
 
 def visualize_regions(results, images_direc,
                       low_conf=0.0, high_conf=1.0,
@@ -1,4 +1,6 @@
 import os
+import threading
+from collections import OrderedDict
 
 import cv2
 
@@ -24,6 +26,66 @@ def get_image_extension(raw_images_path):
 
 
 
+
+class FrameStore:
+    # Bounded LRU store of decoded frames shared by every phase that reads
+    # the raw images, so each frame is read and decoded once. Resized
+    # variants are kept under their own (path, resolution) key. Returned
+    # frames are shared and must not be modified in place.
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _lookup(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._frames.move_to_end(key)
+            return frame
+
+    def _store(self, key, frame):
+        with self._lock:
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.capacity:
+                self._frames.popitem(last=False)
+
+    def read(self, path, resolution=None):
+        key = (path, resolution)
+        frame = self._lookup(key)
+        if frame is not None:
+            return frame
+        if resolution:
+            full_frame = self.read(path)
+            if full_frame is None:
+                return None
+            w = int(full_frame.shape[1] * resolution)
+            h = int(full_frame.shape[0] * resolution)
+            frame = cv2.resize(full_frame, (w, h), fx=0, fy=0, interpolation=cv2.INTER_CUBIC)
+        else:
+            frame = cv2.imread(path)
+            if frame is None:
+                return None
+        self._store(key, frame)
+        return frame
+
+    def read_frame(self, images_direc, fid, image_extension="jpg", resolution=None):
+        return self.read(os.path.join(images_direc, f"{str(fid).zfill(8)}.{image_extension}"),
+                         resolution)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "frames": len(self._frames)}
+
+
 def draw_bboxes_on_image(results, image, output_path):
 
     image_copy = image.copy()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sd_utils import Results, Region  # noqa: E402
+
+
+def random_results(seed=0, n_frames=6, per_frame=12,
+                   labels=("car", "person", "-1"),
+                   origins=("low-res", "high-res"), empty_frames=(),
+                   on_grid=True):
+    # By default coordinates on a 1/64 grid and float32 confidences, so every
+    # container and file format holds exactly the same values; on_grid=False
+    # draws full double precision values instead. Frames in empty_frames get
+    # the "no obj" row the results files use for frames without boxes.
+    rng = np.random.default_rng(seed)
+    results = Results()
+    for fid in range(n_frames):
+        if fid in empty_frames:
+            results.append(Region(fid, 0, 0, 0, 0, 0.1, "no obj", 1.0))
+            continue
+        for _ in range(per_frame):
+            if on_grid:
+                x, y = rng.integers(0, 48, 2) / 64
+                w, h = rng.integers(1, 16, 2) / 64
+                conf = float(np.float32(rng.random()))
+            else:
+                x, y, w, h, conf = rng.random(5)
+            results.append(Region(fid, x, y, w, h, conf,
+                                  str(rng.choice(labels)), 1.0,
+                                  str(rng.choice(origins))))
+    return results
+
+
+@pytest.fixture
+def make_results():
+    return random_results
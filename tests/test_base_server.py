@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from munch import Munch
+
+pytest.importorskip("torch")
+
+from backend import base_server  # noqa: E402
+from backend.base_server import BaseServer  # noqa: E402
+
+
+class StubDetector:
+    # One vehicle whose confidence is the frame's first pixel value / 255,
+    # and one requested region away from it
+    def __init__(self):
+        self.batches = []
+
+    def infer_batch(self, images, with_rpn=True):
+        self.batches.append((len(images), with_rpn))
+        outputs = []
+        for image in images:
+            detections = [("vehicle", image[0, 0, 0] / 255, (0.1, 0.1, 0.2, 0.2))]
+            rpn = [("object", 0.5, (0.6, 0.6, 0.2, 0.2))] if with_rpn else []
+            outputs.append((detections, rpn))
+        return outputs
+
+
+def stub_decode(video, req_regions):
+    # The "video" is the pixel value of every frame of the batch
+    return {fid: np.full((32, 32, 3), video, dtype=np.uint8)
+            for fid in sorted(req_regions.regions_dict)}
+
+
+def client_config(client_id, nframes):
+    return Munch(client_id=client_id, nframes=nframes, batch_size=3,
+                 relevant_classes=["vehicle"], model_type="stub", model={},
+                 low_resolution=0.5, high_resolution=1.0,
+                 intersection_threshold=0.3, prune_score=0.1,
+                 rpn_enlarge_ratio=0.0, objfilter_iou=0.0, min_object_size=None,
+                 low_threshold=0.3, high_threshold=0.3)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(base_server, "decode_video_frames", stub_decode)
+    monkeypatch.setattr(base_server, "perform_server_cleanup", lambda client_id: None)
+    server = BaseServer(client_config("a", "5"), detector=StubDetector())
+    server.add_client(client_config("b", 10))
+    return server
+
+
+def fids(response):
+    return sorted({row[0] for row in response["results"]})
+
+
+def confs(response):
+    return {round(row[5], 3) for row in response["results"]}
+
+
+def test_clients_keep_their_own_sessions(server):
+    assert server.sessions["a"].nframes == 5
+
+    a_first = server.perform_low_query(100, "a")
+    b_first = server.perform_low_query(200, "b")
+    a_second = server.perform_low_query(100, "a")
+    b_second = server.perform_low_query(200, "b")
+
+    assert fids(a_first) == fids(b_first) == [0, 1, 2]
+    assert fids(a_second) == [3, 4]
+    assert fids(b_second) == [3, 4, 5]
+    assert confs(a_first) == confs(a_second) == {round(100 / 255, 3)}
+    assert confs(b_first) == confs(b_second) == {round(200 / 255, 3)}
+    assert server.sessions["a"].curr_fid == 5
+    assert server.sessions["b"].curr_fid == 6
+
+
+def test_high_queries_match_their_batch_by_start_fid(server):
+    server.perform_low_query(100, "a", start_fid=0)
+    server.perform_low_query(100, "a", start_fid=3)
+    server.perform_low_query(200, "b", start_fid=0)
+    assert sorted(server.sessions["a"].pending_batches) == [0, 3]
+    assert sorted(server.sessions["b"].pending_batches) == [0]
+
+    # The first batch's high query arrives after the second low query
+    first = server.perform_high_query(100, "a", start_fid=0)
+    second = server.perform_high_query(100, "a", start_fid=3)
+    other = server.perform_high_query(200, "b")
+
+    assert fids(first) == [0, 1, 2]
+    assert fids(second) == [3, 4]
+    assert fids(other) == [0, 1, 2]
+    assert confs(other) == {round(200 / 255, 3)}
+    assert server.sessions["a"].pending_batches == {}
+    assert server.sessions["b"].pending_batches == {}
@@ -0,0 +1,82 @@
+import json
+
+import requests
+from munch import Munch
+
+from frontend.client import Client
+from sd_utils import REGIONS_MIMETYPE, pack_region_lists
+
+RESULTS = [[0, 0.25, 0.5, 0.125, 0.0625, 0.75, "car"]]
+REQ_REGIONS = [[1, 0.0, 0.0, 1.0, 1.0, 0.5, "object"]]
+
+
+class StubTransport(requests.adapters.BaseAdapter):
+    # Records what the client uploads and answers like the backend would,
+    # packed if the client accepts it and JSON otherwise
+    def __init__(self, packed=True):
+        super().__init__()
+        self.packed = packed
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        body = request.body
+        if not isinstance(body, (bytes, str)):
+            body = b"".join(body)
+        self.requests.append((request, body))
+        sections = {"results": RESULTS, "req_regions": REQ_REGIONS}
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        response.url = request.url
+        if self.packed and REGIONS_MIMETYPE in request.headers.get("Accept", ""):
+            response.headers["Content-Type"] = REGIONS_MIMETYPE
+            response._content = pack_region_lists(sections)
+        else:
+            response.headers["Content-Type"] = "application/json"
+            response._content = json.dumps(sections).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def stub_client(transport):
+    client = Client("backend:5000", Munch(low_resolution=0.5, high_resolution=1.0),
+                    "cam0")
+    client.session.mount("http://", transport)
+    return client
+
+
+def write_video(tmp_path, size):
+    directory = tmp_path / "video-base-phase-cropped"
+    directory.mkdir()
+    video = bytes(range(256)) * (size // 256)
+    (directory / "temp.mp4").write_bytes(video)
+    return video
+
+
+def test_low_phase_upload_is_streamed_and_answer_unpacked(tmp_path):
+    video = write_video(tmp_path, 1 << 18)
+    transport = StubTransport()
+    client = stub_client(transport)
+
+    results, rpn = client.get_first_phase_results(str(tmp_path / "video"))
+
+    (request, body), = transport.requests
+    assert request.url == "http://backend:5000/low/cam0"
+    assert request.headers["Content-Type"] == "video/mp4"
+    assert request.headers.get("Transfer-Encoding") == "chunked"
+    assert body == video
+    assert [(r.fid, r.x, r.label, r.resolution, r.origin) for r in results.regions] == \
+        [(0, 0.25, "car", 0.5, "low-res")]
+    assert [(r.fid, r.w, r.label) for r in rpn.regions] == [(1, 1.0, "object")]
+
+
+def test_json_answers_are_still_read(tmp_path):
+    write_video(tmp_path, 1 << 10)
+    client = stub_client(StubTransport(packed=False))
+
+    results, rpn = client.get_first_phase_results(str(tmp_path / "video"))
+
+    assert [r.conf for r in results.regions] == [0.75]
+    assert len(rpn.regions) == 1
@@ -0,0 +1,94 @@
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import sd_utils
+from sd_utils import CodecPool, EncodingError, Region, Results, encode_frames
+
+
+def stub_encoder(monkeypatch, delays):
+    # Replaces the ffmpeg encode with one that sleeps for the batch's delay
+    # and returns which batch it encoded on which thread
+    def encode_regions(results, images_direc, resolution, qp, enforce_iframes,
+                       encoded_vid_path=None, frame_store=None):
+        time.sleep(delays[results])
+        return results, threading.current_thread().name
+
+    monkeypatch.setattr(sd_utils, "encode_regions", encode_regions)
+
+
+def test_batches_come_back_in_submission_order(monkeypatch):
+    delays = {0: 0.15, 1: 0.0, 2: 0.1, 3: 0.0}
+    stub_encoder(monkeypatch, delays)
+    pool = CodecPool(workers=2)
+
+    futures = [pool.encode_regions(batch, "direc", 1.0, 30, False)
+               for batch in delays]
+
+    outputs = [future.result(timeout=5) for future in futures]
+    assert [batch for batch, _ in outputs] == list(delays)
+    assert len({thread for _, thread in outputs}) == 2
+    pool.shutdown()
+
+
+def test_shutdown_waits_for_queued_batches(monkeypatch):
+    delays = {0: 0.05, 1: 0.05, 2: 0.05}
+    stub_encoder(monkeypatch, delays)
+    pool = CodecPool(workers=1)
+
+    futures = [pool.encode_regions(batch, "direc", 1.0, 30, False)
+               for batch in delays]
+    pool.shutdown()
+
+    assert all(future.done() for future in futures)
+    assert [future.result()[0] for future in futures] == list(delays)
+
+
+def test_pool_shuts_down_when_the_caller_fails(monkeypatch):
+    stub_encoder(monkeypatch, {0: 0.05})
+    monkeypatch.setattr(sd_utils, "decode_video_frames",
+                        lambda encoded, results: {results: encoded})
+    futures = []
+    try:
+        with CodecPool(workers=1) as pool:
+            futures.append(pool.transcode_regions(0, "direc", 1.0, 30, False))
+            raise RuntimeError("detection failed")
+    except RuntimeError:
+        pass
+
+    assert futures[0].done()
+    size, frames = futures[0].result()
+    assert size == 0 and list(frames) == [0]
+    with pytest.raises(RuntimeError):
+        pool.transcode_regions(0, "direc", 1.0, 30, False)
+
+
+class FailingEncoder:
+    # An ffmpeg process that rejects its input
+    returncode = 1
+
+    def __init__(self, command, **kwargs):
+        self.stdin = io.BytesIO()
+
+    def communicate(self):
+        return b"", b"Invalid frame size"
+
+
+def test_encode_failures_reach_the_caller(monkeypatch, tmp_path):
+    monkeypatch.setattr(sd_utils.subprocess, "Popen", FailingEncoder)
+    frames = [np.zeros((8, 8, 3), dtype=np.uint8)]
+    with pytest.raises(EncodingError, match="Invalid frame size"):
+        encode_frames(frames, str(tmp_path / "temp.mp4"), 30)
+
+    # A failing batch in a pool worker fails its future, not the process
+    cv2.imwrite(str(tmp_path / "00000000.jpg"), frames[0])
+    batch = Results()
+    batch.append(Region(0, 0, 0, 1, 1, 1.0, 2, 1.0))
+    with CodecPool(workers=1) as pool:
+        future = pool.encode_regions(batch, str(tmp_path), 1.0, 30, False)
+        with pytest.raises(EncodingError):
+            future.result(timeout=5)
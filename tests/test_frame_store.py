@@ -0,0 +1,61 @@
+import os
+
+import cv2
+import numpy as np
+
+from streamduet_utils import FrameStore
+
+
+def write_frames(directory, count):
+    paths = []
+    for fid in range(count):
+        path = os.path.join(str(directory), f"{fid:08d}.jpg")
+        cv2.imwrite(path, np.full((16, 24, 3), fid * 10, dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_frames_are_read_once(tmp_path):
+    paths = write_frames(tmp_path, 2)
+    store = FrameStore(capacity=4)
+
+    first = store.read(paths[0])
+    assert store.read(paths[0]) is first
+    assert store.read_frame(str(tmp_path), 0) is first
+    assert store.stats() == {"hits": 2, "misses": 1, "frames": 1}
+
+
+def test_least_recently_used_frame_is_evicted(tmp_path):
+    paths = write_frames(tmp_path, 3)
+    store = FrameStore(capacity=2)
+
+    store.read(paths[0])
+    store.read(paths[1])
+    store.read(paths[0])
+    store.read(paths[2])
+
+    assert len(store) == 2
+    misses = store.misses
+    store.read(paths[0])
+    store.read(paths[2])
+    assert store.misses == misses
+    store.read(paths[1])
+    assert store.misses == misses + 1
+
+
+def test_resized_frames_are_kept_under_their_own_key(tmp_path):
+    paths = write_frames(tmp_path, 1)
+    store = FrameStore(capacity=4)
+
+    resized = store.read(paths[0], 0.5)
+    assert resized.shape == (8, 12, 3)
+    assert store.read(paths[0]).shape == (16, 24, 3)
+    assert store.read(paths[0], 0.5) is resized
+    # The full frame was read once, for the resize
+    assert store.stats() == {"hits": 2, "misses": 2, "frames": 2}
+
+
+def test_missing_frames_are_not_stored(tmp_path):
+    store = FrameStore(capacity=2)
+    assert store.read(os.path.join(str(tmp_path), "missing.jpg")) is None
+    assert len(store) == 0
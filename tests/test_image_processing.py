@@ -0,0 +1,78 @@
+import logging
+
+import cv2 as cv
+import numpy as np
+from munch import Munch
+
+from backend.image_processing import detect_in_batches, perform_detection
+
+
+class StubDetector:
+    # Reports the frame's pixel value as the confidence of one detection;
+    # frames of value 0 have no detections and no proposals
+    def __init__(self):
+        self.batches = []
+
+    def infer_batch(self, images, with_rpn=True):
+        values = [int(image[0, 0, 0]) for image in images]
+        self.batches.append(values)
+        outputs = []
+        for value in values:
+            if value == 0:
+                outputs.append(([], []))
+                continue
+            detections = [("vehicle", value / 255, (0.1, 0.1, 0.2, 0.2)),
+                          ("vehicle", 0.9, (0.5, 0.5, 0.01, 0.01))]
+            rpn = [("object", 0.5, (0.6, 0.6, 0.2, 0.2))] if with_rpn else []
+            outputs.append((detections, rpn))
+        return outputs
+
+
+def frame(value):
+    return np.full((16, 16, 3), value, dtype=np.uint8)
+
+
+def config(batch_size):
+    return Munch(detection_batch_size=batch_size, min_object_size=0.001)
+
+
+def test_partial_last_batch():
+    values = [10, 20, 0, 40, 50, 60, 70]
+    images = {fid: frame(value) for fid, value in enumerate(values)}
+    fnames = [f"{fid:08d}.jpg" for fid in images]
+    detector = StubDetector()
+
+    results, rpn = detect_in_batches(None, 0.5, fnames, images, detector,
+                                     config(3), logging.getLogger(__name__))
+
+    assert detector.batches == [[10, 20, 0], [40, 50, 60], [70]]
+    by_fid = {r.fid: r for r in results.regions}
+    assert sorted(by_fid) == list(range(7))
+    assert len(results.regions) == 7
+    assert by_fid[2].label == "no obj"
+    for fid, value in enumerate(values):
+        if value:
+            assert by_fid[fid].conf == value / 255
+            assert by_fid[fid].origin == "mpeg"
+            assert by_fid[fid].resolution == 0.5
+    assert sorted(r.fid for r in rpn.regions) == [0, 1, 3, 4, 5, 6]
+    assert all(r.origin == "generic" for r in rpn.regions)
+
+
+def test_perform_detection_reads_missing_frames_from_disk(tmp_path):
+    for fid in range(5):
+        cv.imwrite(str(tmp_path / f"{fid:08d}.jpg"), frame(100))
+    (tmp_path / "temp.mp4").write_bytes(b"")
+    images = {1: frame(10), 3: frame(30)}
+    detector = StubDetector()
+
+    results, rpn = perform_detection(str(tmp_path), 1.0, None, images, detector,
+                                     config(2), logging.getLogger(__name__),
+                                     with_rpn=False)
+
+    assert [len(batch) for batch in detector.batches] == [2, 2, 1]
+    values = [value for batch in detector.batches for value in batch]
+    assert values[1] == 10 and values[3] == 30
+    assert all(abs(values[i] - 100) <= 2 for i in (0, 2, 4))
+    assert sorted(r.fid for r in results.regions) == list(range(5))
+    assert len(rpn.regions) == 0
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from backend.inference_scheduler import InferenceScheduler
+
+
+class RecordingDetector:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def infer_batch(self, images, with_rpn=True):
+        self.batches.append((list(images), with_rpn))
+        if self.fail:
+            raise RuntimeError("detector failed")
+        return [(image * 10, with_rpn) for image in images]
+
+
+def submit_concurrently(scheduler, requests):
+    # requests: (client_id, images, with_rpn); returns the results by index
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def submit(i, client_id, images, with_rpn):
+        with scheduler.client(client_id):
+            barrier.wait()
+            results[i] = scheduler.infer_batch(images, with_rpn)
+
+    threads = [threading.Thread(target=submit, args=(i, *request))
+               for i, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def detector():
+    return RecordingDetector()
+
+
+def test_concurrent_queries_share_batches(detector):
+    scheduler = InferenceScheduler(detector, max_batch_size=8, max_wait=1.0)
+    try:
+        results = submit_concurrently(scheduler, [
+            ("a", [1, 2, 3, 4], False), ("b", [5, 6, 7, 8], False)])
+    finally:
+        scheduler.shutdown()
+
+    assert results == [[(10, False), (20, False), (30, False), (40, False)],
+                       [(50, False), (60, False), (70, False), (80, False)]]
+    assert [len(images) for images, _ in detector.batches] == [8]
+    metrics = scheduler.metrics()
+    assert metrics["batches"] == 1 and metrics["frames"] == 8
+    assert metrics["batch_fill"] == 1.0
+    assert metrics["queue_depth"] == {"a": 0, "b": 0}
+
+
+def test_partial_batch_runs_at_deadline(detector):
+    scheduler = InferenceScheduler(detector, max_batch_size=8, max_wait=0.05)
+    try:
+        start = time.time()
+        results = scheduler.infer_batch([1, 2, 3])
+        elapsed = time.time() - start
+    finally:
+        scheduler.shutdown()
+
+    assert results == [(10, True), (20, True), (30, True)]
+    assert [len(images) for images, _ in detector.batches] == [3]
+    assert 0.04 <= elapsed < 1.0
+
+
+def test_batches_are_capped_and_split_by_rpn(detector):
+    scheduler = InferenceScheduler(detector, max_batch_size=4, max_wait=0.2)
+    try:
+        results = submit_concurrently(scheduler, [
+            ("a", list(range(6)), True), ("b", [100, 101], False)])
+    finally:
+        scheduler.shutdown()
+
+    assert results[0] == [(i * 10, True) for i in range(6)]
+    assert results[1] == [(1000, False), (1010, False)]
+    for images, with_rpn in detector.batches:
+        assert len(images) <= 4
+        assert all((image >= 100) != with_rpn for image in images)
+    assert sum(len(images) for images, _ in detector.batches) == 8
+
+
+def test_detector_errors_reach_every_caller():
+    scheduler = InferenceScheduler(RecordingDetector(fail=True), max_wait=0.01)
+    try:
+        with pytest.raises(RuntimeError, match="detector failed"):
+            scheduler.infer_batch([1, 2])
+        # The worker keeps serving later batches
+        with pytest.raises(RuntimeError, match="detector failed"):
+            scheduler.infer_batch([3])
+    finally:
+        scheduler.shutdown()
+
+
+def test_shutdown_rejects_new_work(detector):
+    scheduler = InferenceScheduler(detector)
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.infer_batch([1])
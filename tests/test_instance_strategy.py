@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import pytest
+from munch import Munch
+
+pytest.importorskip("torch")
+
+from sd_utils import Region, Results  # noqa: E402
+from workspace import base_instance_strategy  # noqa: E402
+from workspace.instance_strategy import DDSStrategy  # noqa: E402
+
+
+class StubClient:
+    # Answers every batch with one low-res detection and one requested
+    # region; high queries take a while so later batches overtake them
+    def __init__(self):
+        self.events = []
+        self.nframes = None
+        self.closed = False
+
+    def init_server(self, nframes):
+        self.nframes = nframes
+
+    def get_first_phase_results_async(self, vid_name, start_fid):
+        self.events.append(("low", start_fid))
+
+        async def query():
+            results, rpn = Results(), Results()
+            results.append(Region(start_fid, 0.1, 0.1, 0.2, 0.2, 0.9, "vehicle", 0.5, "low-res"))
+            rpn.append(Region(start_fid, 0.6, 0.6, 0.2, 0.2, 0.5, "object", 0.5, "low-res"))
+            return results, rpn
+        return query()
+
+    def get_second_phase_results_async(self, vid_name, start_fid):
+        self.events.append(("high sent", start_fid))
+
+        async def query():
+            await asyncio.sleep(0.05)
+            self.events.append(("high done", start_fid))
+            results = Results()
+            results.append(Region(start_fid, 0.6, 0.6, 0.2, 0.2, 0.8, "vehicle", 1.0, "high-res"))
+            return results
+        return query()
+
+    async def close_async(self):
+        self.closed = True
+
+
+@pytest.fixture
+def strategy(monkeypatch):
+    monkeypatch.setattr(base_instance_strategy, "compute_regions_size",
+                        lambda *args, **kwargs: (1024, 0))
+    monkeypatch.setattr(base_instance_strategy, "cleanup", lambda *args: None)
+    config = Munch(batch_size=3, low_resolution=0.5, high_resolution=1.0,
+                   low_qp=36, high_qp=26, intersection_threshold=0.3)
+    strategy = DDSStrategy(config, logging.getLogger("test"))
+    strategy.client = StubClient()
+    return strategy
+
+
+def test_remote_batches_are_pipelined(strategy, tmp_path):
+    raw_images = tmp_path / "frames"
+    raw_images.mkdir()
+    for fid in range(7):
+        (raw_images / f"{fid:010d}.jpg").write_bytes(b"")
+
+    results, (low_size, high_size), _ = asyncio.run(strategy.analyze_video_async(
+        str(tmp_path / "video"), str(raw_images), False))
+
+    client = strategy.client
+    assert client.nframes == 7
+    assert client.closed
+    assert [e for e in client.events if e[0] == "low"] == [("low", 0), ("low", 3), ("low", 6)]
+    # The high query of the first batch is still in flight while the
+    # following batches are sent
+    assert client.events.index(("low", 6)) < client.events.index(("high done", 0))
+    assert low_size == high_size == 3 * 1024
+
+    detections = [(r.fid, r.origin) for r in results.regions if r.label == "vehicle"]
+    assert detections == [(0, "low-res"), (0, "high-res"), (3, "low-res"),
+                          (3, "high-res"), (6, "low-res"), (6, "high-res")]
+    assert sorted(results.regions_dict) == list(range(7))
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+from frontend import motion_estimation
+from frontend.motion_estimation import (DISMotion, FarnebackMotion,
+                                        SparseLKMotion, get_motion_estimator)
+
+
+@pytest.fixture
+def shifted_frames():
+    # A smooth random texture and the same texture moved 3 px right, 2 px down
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur((rng.random((120, 160)) * 255).astype(np.uint8), (7, 7), 0)
+    return texture, np.roll(np.roll(texture, 3, axis=1), 2, axis=0)
+
+
+def test_auto_backend_prefers_cuda(monkeypatch):
+    class FakeCuda(FarnebackMotion):
+        pass
+
+    monkeypatch.setitem(motion_estimation.MOTION_BACKENDS, "cuda", FakeCuda)
+    monkeypatch.setattr(motion_estimation, "cuda_available", lambda: True)
+    assert isinstance(get_motion_estimator("auto"), FakeCuda)
+    monkeypatch.setattr(motion_estimation, "cuda_available", lambda: False)
+    assert type(get_motion_estimator("auto")) is FarnebackMotion
+
+
+@pytest.mark.parametrize("backend, cls", [("farneback", FarnebackMotion),
+                                          ("dis", DISMotion),
+                                          ("lk", SparseLKMotion)])
+def test_backends_by_name(backend, cls):
+    estimator = get_motion_estimator(backend)
+    assert type(estimator) is cls
+    assert estimator.dense == (backend != "lk")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_motion_estimator("optical")
+
+
+@pytest.mark.parametrize("backend", ["farneback", "dis"])
+def test_dense_flow_follows_the_shift(backend, shifted_frames):
+    src, dst = shifted_frames
+    flow = get_motion_estimator(backend).dense_flow(src, dst)
+    assert flow.shape == src.shape + (2,)
+    inner = flow[20:-20, 20:-20]
+    assert np.median(inner[..., 0]) == pytest.approx(3, abs=0.5)
+    assert np.median(inner[..., 1]) == pytest.approx(2, abs=0.5)
+
+
+def test_box_motion_follows_the_shift(shifted_frames):
+    src, dst = shifted_frames
+    boxes = np.array([[30, 30, 70, 60], [80, 40, 130, 90]])
+    motion = get_motion_estimator("lk").box_motion(src, dst, boxes)
+    assert motion.shape == (2, 2)
+    np.testing.assert_allclose(motion, [[3, 2], [3, 2]], atol=0.5)
+    assert get_motion_estimator("lk").box_motion(src, dst, np.zeros((0, 4))).shape == (0, 2)
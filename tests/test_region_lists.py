@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from sd_utils import pack_region_lists, unpack_region_lists
+
+
+def test_region_lists_round_trip():
+    sections = {
+        "results": [[0, 0.25, 0.5, 0.125, 0.0625, 0.75, "car"],
+                    [3, 0.1, 0.2, 0.3, 0.4, 0.9, "person"]],
+        "req_regions": [[1, 0.0, 0.0, 1.0, 1.0, 0.5, "object"],
+                        [1, 0.5, 0.5, 0.25, 0.25, 0.2, "car"]],
+        "empty": [],
+    }
+    unpacked = unpack_region_lists(pack_region_lists(sections))
+
+    assert list(unpacked) == list(sections)
+    for name, rows in sections.items():
+        assert len(unpacked[name]) == len(rows)
+        for row, expected in zip(unpacked[name], rows):
+            assert row[0] == expected[0]
+            assert row[6] == expected[6]
+            # Boxes and confidences travel as float32
+            assert row[1:6] == [float(np.float32(v)) for v in expected[1:6]]
+
+
+def test_region_lists_without_rows():
+    unpacked = unpack_region_lists(pack_region_lists({"results": [], "req_region": []}))
+    assert unpacked == {"results": [], "req_region": []}
+
+
+def test_unpack_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        unpack_region_lists(b'{"results": []}')
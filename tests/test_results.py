@@ -0,0 +1,315 @@
+import numpy as np
+import pytest
+
+import sd_utils
+from sd_utils import (Results, ColumnarResults, Region, FrameCoverage,
+                      calc_iou, compute_area_of_frame,
+                      compute_area_of_regions, evaluate, evaluate_grid,
+                      evaluate_many, filter_results, iou,
+                      merge_boxes_in_results)
+
+
+def as_tuples(results):
+    return [(r.fid, r.x, r.y, r.w, r.h, r.conf, r.label, r.resolution, r.origin)
+            for r in results.regions]
+
+
+def copy_results(results):
+    copied = Results()
+    for region in results.regions:
+        copied.append(region.copy())
+    return copied
+
+
+def test_columnar_round_trip(make_results):
+    results = make_results()
+    columnar = ColumnarResults.from_results(results)
+
+    assert len(columnar) == len(results)
+    assert as_tuples(columnar) == as_tuples(results)
+    assert as_tuples(columnar.to_results()) == as_tuples(results)
+
+
+def test_columnar_regions_dict_matches_results(make_results):
+    results = make_results(n_frames=4)
+    results.append(Region(9, 0.5, 0.5, 0.25, 0.25, 0.5, "car", 1.0))
+    columnar = ColumnarResults.from_results(results)
+
+    assert list(columnar.regions_dict) == list(results.regions_dict)
+    for fid, regions in results.regions_dict.items():
+        assert ([r.x for r in columnar.regions_dict[fid]] ==
+                [r.x for r in regions])
+        assert columnar.frame_rows(fid).tolist() == [
+            i for i, r in enumerate(results.regions) if r.fid == fid]
+    assert len(columnar.frame_rows(7)) == 0
+
+
+def test_columnar_frame_index_after_fid_change(make_results):
+    columnar = ColumnarResults.from_results(make_results(n_frames=2))
+    region = columnar.regions_dict[0][0]
+    region.fid = 5
+    assert 5 in columnar.regions_dict
+    assert len(columnar.regions_dict[0]) == 11
+    assert columnar.frame_rows(5).tolist() == [0]
+
+
+def test_columnar_views_write_through(make_results):
+    columnar = ColumnarResults.from_results(make_results(n_frames=1))
+    view = columnar.regions[3]
+    view.conf = 0.25
+    view.label = "truck"
+    assert columnar.regions[3].conf == 0.25
+    assert columnar.regions[3].label == "truck"
+    assert np.count_nonzero(columnar.column("conf") == 0.25) >= 1
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 1])
+def test_combine_results_matches_add_single_result(make_results, threshold):
+    base, incoming = make_results(0), make_results(1)
+
+    expected = copy_results(base)
+    for region in copy_results(incoming).regions:
+        expected.add_single_result(region, threshold)
+
+    combined = copy_results(base)
+    combined.combine_results(copy_results(incoming), threshold)
+    columnar = ColumnarResults.from_results(base)
+    columnar.combine_results(copy_results(incoming), threshold)
+
+    assert as_tuples(combined) == as_tuples(expected)
+    assert as_tuples(columnar) == as_tuples(expected)
+
+
+def test_columnar_combine_keeps_frame_index_across_appends(make_results):
+    results = Results()
+    columnar = ColumnarResults()
+    for seed in range(8):
+        frame = make_results(seed, n_frames=3, per_frame=4)
+        results.combine_results(copy_results(frame), 0.3)
+        columnar.combine_results(copy_results(frame), 0.3)
+        assert as_tuples(columnar) == as_tuples(results)
+
+    assert list(columnar.regions_dict.keys()) == list(results.regions_dict.keys())
+    for fid in results.regions_dict:
+        assert ([r.x for r in columnar.regions_dict[fid]] ==
+                [r.x for r in results.regions_dict[fid]])
+
+
+def test_columnar_appends_extend_the_frame_index(make_results):
+    columnar = ColumnarResults.from_results(make_results(n_frames=3))
+    columnar.frame_ids()
+    index = columnar._index
+    columnar.append(Region(1, 0.5, 0.5, 0.25, 0.25, 0.5, "car", 1.0))
+    columnar.combine_results(make_results(1, n_frames=5), 1)
+
+    assert columnar._index is index
+    assert columnar.frame_ids().tolist() == [0, 1, 2, 3, 4]
+    fids = columnar.column("fid")
+    for fid in range(5):
+        assert columnar.frame_rows(fid).tolist() == np.flatnonzero(fids == fid).tolist()
+
+
+def greedy_suppress(results, threshold):
+    # The original Results.suppress: repeatedly keep the most confident box
+    # and drop the boxes of its frame that overlap it by more than threshold
+    regions = list(results.regions)
+    kept = []
+    while regions:
+        best = max(regions, key=lambda r: r.conf)
+        kept.append(best)
+        regions.remove(best)
+        regions = [r for r in regions
+                   if r.fid != best.fid or calc_iou(r, best) <= threshold]
+    kept.sort(key=lambda r: r.fid)
+    return [(r.fid, r.x, r.y, r.w, r.h, r.conf, r.label) for r in kept]
+
+
+@pytest.mark.parametrize("block", [2, 1024])
+@pytest.mark.parametrize("threshold", [0.1, 0.5])
+def test_suppress_matches_greedy_nms(monkeypatch, make_results, block, threshold):
+    monkeypatch.setattr(sd_utils, "_NMS_BLOCK", block)
+    results = make_results(3, per_frame=40)
+    expected = greedy_suppress(results, threshold)
+
+    columnar = ColumnarResults.from_results(results)
+    results.suppress(threshold)
+    columnar.suppress(threshold)
+
+    assert [t[:7] for t in as_tuples(results)] == expected
+    assert [t[:7] for t in as_tuples(columnar)] == expected
+
+
+def pairwise_merge(results_dict, min_conf_threshold, iou_threshold):
+    # The original merge_boxes_in_results: an edge for every ordered pair of
+    # same-label boxes overlapping by more than iou_threshold, connected
+    # components largest first, each merged into its bounding box with the
+    # left-most box's attributes
+    merged = []
+    for fid, regions in results_dict.items():
+        regions = [r for r in regions if r.conf >= min_conf_threshold]
+        neighbours = {i: set() for i in range(len(regions))}
+        for i, a in enumerate(regions):
+            for j, b in enumerate(regions):
+                if i != j and calc_iou(a, b) > iou_threshold and a.label == b.label:
+                    neighbours[i].add(j)
+                    neighbours[j].add(i)
+        seen, components = set(), []
+        for i in range(len(regions)):
+            if i in seen:
+                continue
+            component, stack = set(), [i]
+            while stack:
+                j = stack.pop()
+                if j not in component:
+                    component.add(j)
+                    stack.extend(neighbours[j])
+            seen |= component
+            components.append(sorted(component))
+        for component in sorted(components, key=len, reverse=True):
+            group = [regions[j] for j in component]
+            left = min(group, key=lambda r: r.x)
+            top = min(group, key=lambda r: r.y)
+            right = max(group, key=lambda r: r.x + r.w)
+            bottom = max(group, key=lambda r: r.y + r.h)
+            merged.append((left.fid, left.x, top.y, right.x + right.w - left.x,
+                           bottom.y + bottom.h - top.y, left.conf, left.label))
+    return merged
+
+
+@pytest.mark.parametrize("iou_threshold", [0, 0.1, 0.3])
+def test_merge_boxes_matches_pairwise_merge(make_results, iou_threshold):
+    results = make_results(4, per_frame=30)
+    results.append(Region(6, 0.5, 0.5, 0.25, 0.25, 0.1, "car", 1.0))
+    expected = pairwise_merge(results.regions_dict, 0.2, iou_threshold)
+
+    merged = merge_boxes_in_results(results.regions_dict, 0.2, iou_threshold)
+
+    assert [t[:7] for t in as_tuples(merged)] == expected
+
+
+def sweep_area(regions):
+    # The original compute_area_of_frame: a sweep over the sorted box edges
+    # that unions the y-ranges of the boxes spanning each x-interval
+    regions = sorted(regions, key=lambda r: r.x + r.w)
+    xs = sorted([r.x for r in regions] + [r.x + r.w for r in regions])
+    area = 0
+    for x1, x2 in zip(xs, xs[1:]):
+        if x1 >= x2:
+            continue
+        ranges = []
+        for r in regions:
+            if x1 < r.x + r.w and x2 > r.x:
+                y1, y2 = r.y, r.y + r.h
+                for other in [o for o in ranges if not (y1 > o[1] or o[0] > y2)]:
+                    y1, y2 = min(y1, other[0]), max(y2, other[1])
+                    ranges.remove(other)
+                ranges.append((y1, y2))
+        area += sum(y2 - y1 for y1, y2 in ranges) * (x2 - x1)
+    return area
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_frame_area_matches_sweep(make_results, seed):
+    results = make_results(seed, per_frame=25)
+    for regions in results.regions_dict.values():
+        assert compute_area_of_frame(regions) == pytest.approx(sweep_area(regions))
+    assert compute_area_of_regions(results) == pytest.approx(
+        sum(sweep_area(regions) for regions in results.regions_dict.values()))
+
+
+def test_extra_area_matches_sweep(make_results):
+    results = make_results(5, n_frames=1, per_frame=20)
+    frame, candidates = results.regions[:10], results.regions[10:]
+    coverage = FrameCoverage(frame)
+    for region in candidates:
+        expected = sweep_area(frame + [region]) - sweep_area(frame)
+        assert coverage.extra_area(region) == pytest.approx(expected)
+    assert compute_area_of_frame([]) == 0
+
+
+def pairwise_evaluate(max_fid, map_dd, map_gt, gt_confid_thresh,
+                      mpeg_confid_thresh, max_area_thresh_gt,
+                      max_area_thresh_mpeg, iou_thresh):
+    # The original evaluate: every detection against every GT box of its
+    # frame, one frame at a time
+    tp = fp = fn = count = 0
+    for fid in range(max_fid + 1):
+        bboxes_dd = filter_results(map_dd.get(fid, []), False, gt_confid_thresh,
+                                   mpeg_confid_thresh, max_area_thresh_gt,
+                                   max_area_thresh_mpeg)
+        bboxes_gt = filter_results(map_gt.get(fid, []), True, gt_confid_thresh,
+                                   mpeg_confid_thresh, max_area_thresh_gt,
+                                   max_area_thresh_mpeg)
+        for b_dd in bboxes_dd:
+            if any(iou(b_dd, b_gt) >= iou_thresh for b_gt in bboxes_gt):
+                tp += 1
+            else:
+                fp += 1
+        for b_gt in bboxes_gt:
+            if any(iou(b_dd, b_gt) >= iou_thresh for b_dd in bboxes_dd):
+                count += 1
+            else:
+                fn += 1
+    precision = round(tp / (tp + fp), 3) if (tp + fp) != 0 else 0
+    recall = round(tp / (tp + fn), 3) if (tp + fn) != 0 else 0
+    f1 = round(2.0 * tp / (2.0 * tp + fp + fn), 3) if (2.0 * tp + fp + fn) != 0 else 0
+    return (tp, fp, fn, count, precision, recall, f1)
+
+
+def detections_near(gt, seed):
+    # Detections that jitter about two thirds of the GT boxes, plus some
+    # spurious boxes and a frame the ground truth does not have
+    rng = np.random.default_rng(seed)
+    detections = Results()
+    for r in gt.regions:
+        if rng.random() < 0.66:
+            dx, dy, dw, dh = rng.normal(0, 0.02, 4)
+            detections.append(Region(r.fid, r.x + dx, r.y + dy,
+                                     abs(r.w + dw), abs(r.h + dh),
+                                     rng.random(), r.label, 1.0))
+    for fid in range(max(r.fid for r in gt.regions) + 1):
+        x, y, w, h = rng.random(4) / 2
+        detections.append(Region(fid, x, y, w, h, rng.random(), "vehicle", 1.0))
+    return detections
+
+
+@pytest.mark.parametrize("iou_thresh", [0.3, 0.5])
+@pytest.mark.parametrize("confid_thresh", [0.2, 0.5])
+def test_evaluate_matches_pairwise_evaluate(make_results, iou_thresh, confid_thresh):
+    gt = make_results(6, n_frames=8, per_frame=10, labels=("vehicle", "person"),
+                      on_grid=False)
+    dd = detections_near(gt, 7)
+    map_gt, map_dd = gt.regions_dict, dd.regions_dict
+    del map_gt[3]
+    args = (9, map_dd, map_gt, 0.3, confid_thresh, 0.5, 0.3)
+
+    expected = pairwise_evaluate(*args, iou_thresh)
+    assert expected[0] > 0 and expected[1] > 0 and expected[2] > 0
+    assert evaluate(*args, iou_thresh) == expected
+
+    many = evaluate_many(9, {"dd": map_dd, "gt": map_gt}, map_gt, 0.3,
+                         confid_thresh, 0.5, 0.3, iou_thresh)
+    assert many["dd"] == expected
+    assert many["gt"] == pairwise_evaluate(9, map_gt, map_gt, 0.3, confid_thresh,
+                                           0.5, 0.3, iou_thresh)
+
+
+def test_evaluate_grid_matches_pairwise_evaluate(make_results):
+    gt = make_results(8, n_frames=8, per_frame=10, labels=("vehicle", "person"),
+                      on_grid=False)
+    map_gt, map_dd = gt.regions_dict, detections_near(gt, 9).regions_dict
+    iou_threshs, confid_threshs = [0.3, 0.5, 0.7], [0.2, 0.5, 0.8]
+
+    grid, pr_curves, aps, mean_ap = evaluate_grid(
+        7, map_dd, map_gt, 0.3, confid_threshs, 0.5, 0.3, iou_threshs)
+
+    assert sorted(grid) == sorted((i, c) for i in iou_threshs for c in confid_threshs)
+    for (iou_thresh, confid_thresh), cell in grid.items():
+        assert cell == pairwise_evaluate(7, map_dd, map_gt, 0.3, confid_thresh,
+                                         0.5, 0.3, iou_thresh)
+    assert sorted(aps) == iou_threshs
+    assert aps[0.3] >= aps[0.5] >= aps[0.7]
+    assert mean_ap == pytest.approx(np.mean(list(aps.values())))
+
+    _, _, aps, _ = evaluate_grid(7, map_gt, map_gt, 0.3, [0.3], 0.5, 0.5, [0.5])
+    assert aps[0.5] == pytest.approx(1)
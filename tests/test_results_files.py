@@ -0,0 +1,61 @@
+import os
+
+from sd_utils import Results, read_results_dict
+
+
+def as_dict(results_dict):
+    return {fid: [(r.fid, r.x, r.y, r.w, r.h, r.conf, r.label, r.resolution,
+                   r.origin) for r in regions]
+            for fid, regions in results_dict.items()}
+
+
+def test_binary_results_round_trip(tmp_path, make_results):
+    results = make_results(n_frames=5, per_frame=6, empty_frames=(2,),
+                           on_grid=False)
+    results.write(str(tmp_path / "results.txt"))
+    results.write(str(tmp_path / "results.sdr"))
+
+    text = read_results_dict(str(tmp_path / "results.txt"))
+    binary = read_results_dict(str(tmp_path / "results.sdr"))
+
+    assert list(binary) == list(text)
+    assert binary[2] == []
+    assert 7 not in binary
+    assert as_dict(binary) == as_dict(text)
+
+
+def test_empty_binary_results(tmp_path):
+    Results().write(str(tmp_path / "empty.sdr"))
+    assert len(read_results_dict(str(tmp_path / "empty.sdr"))) == 0
+
+
+def cached_files(cache_dir):
+    return sorted(f for f in os.listdir(cache_dir) if f.endswith(".sdr"))
+
+
+def test_results_cache_is_keyed_by_content(tmp_path, make_results):
+    cache_dir = str(tmp_path / "cache")
+    source = str(tmp_path / "results.txt")
+    make_results(empty_frames=(2,), on_grid=False).write(source)
+
+    parsed = read_results_dict(source, cache_dir)
+    cached = read_results_dict(source, cache_dir)
+    assert isinstance(parsed, dict)
+    assert not isinstance(cached, dict)
+    assert as_dict(cached) == as_dict(parsed)
+    assert len(cached_files(cache_dir)) == 1
+
+    # The same content under another path reuses the cached file
+    copy = str(tmp_path / "copy.txt")
+    with open(source) as src, open(copy, "w") as dst:
+        dst.write(src.read())
+    assert as_dict(read_results_dict(copy, cache_dir)) == as_dict(parsed)
+    assert len(cached_files(cache_dir)) == 1
+
+    # Changed content is parsed again
+    make_results(seed=1, on_grid=False).write(source)
+    os.utime(source, ns=(0, 0))
+    changed = read_results_dict(source, cache_dir)
+    assert as_dict(changed) == as_dict(read_results_dict(source))
+    assert as_dict(changed) != as_dict(parsed)
+    assert len(cached_files(cache_dir)) == 2
@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+import pytest
+
+from frontend.roi_cache import RoICache
+from sd_utils import Region, Results
+
+
+def make_cache(time_window=2, **kwargs):
+    return RoICache(time_window, 0.5, ["vehicle"], 30, 0.3, **kwargs)
+
+
+@pytest.fixture
+def frames():
+    # A smooth random texture moving 3 px right and 2 px down per frame
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur((rng.random((120, 160)) * 255).astype(np.uint8), (7, 7), 0)
+    texture = cv2.cvtColor(texture, cv2.COLOR_GRAY2BGR)
+    return [np.roll(np.roll(texture, 3 * i, axis=1), 2 * i, axis=0) for i in range(6)]
+
+
+def test_flow_is_computed_once_per_frame_pair(frames):
+    cache = make_cache()
+    flow = cache._frame_flow(0, frames[0], 1, frames[1])
+    assert cache._frame_flow(0, frames[0], 1, frames[1]) is flow
+    assert cache.flow_stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    inner = flow[20:-20, 20:-20]
+    assert np.median(inner[..., 0]) == pytest.approx(3, abs=0.5)
+    assert np.median(inner[..., 1]) == pytest.approx(2, abs=0.5)
+
+
+def test_least_recently_used_flow_is_evicted(frames):
+    cache = make_cache(time_window=2)
+    pairs = [(0, 1), (1, 2), (2, 3), (3, 4)]
+    for src, dst in pairs:
+        cache._frame_flow(src, frames[src], dst, frames[dst])
+    assert cache.flow_stats()["size"] == cache.flow_cache_size == 4
+
+    cache._frame_flow(0, frames[0], 1, frames[1])
+    cache._frame_flow(4, frames[4], 5, frames[5])
+    assert cache.flow_stats() == {"hits": 1, "misses": 5, "size": 4}
+    # (1, 2) was the least recently used pair
+    cache._frame_flow(1, frames[1], 2, frames[2])
+    assert cache.flow_misses == 6
+
+
+def test_frames_without_fid_are_not_cached(frames):
+    cache = make_cache()
+    cache._frame_flow(None, frames[0], 1, frames[1])
+    cache._frame_flow(0, frames[0], None, frames[1])
+    assert cache.flow_stats() == {"hits": 0, "misses": 2, "size": 0}
+
+
+def test_box_means_match_the_pixel_means():
+    rng = np.random.default_rng(1)
+    prev_gray = rng.integers(0, 256, (60, 80), dtype=np.uint8)
+    current_gray = rng.integers(0, 256, (60, 80), dtype=np.uint8)
+    flow = rng.normal(0, 2, (60, 80, 2)).astype(np.float32)
+    cache = make_cache()
+    tables = cache._box_tables(0, prev_gray, 1, current_gray, flow)
+    assert cache._box_tables(0, prev_gray, 1, current_gray, flow) is tables
+
+    residual = cv2.absdiff(current_gray, prev_gray).astype(np.float64)
+    channels = np.dstack([residual, flow[..., 0], flow[..., 1],
+                          residual * flow[..., 0], residual * flow[..., 1]])
+    boxes = np.array([[0, 0, 80, 60], [10, 5, 30, 40], [70, 50, 95, 70],
+                      [-5, -5, 3, 4], [20, 20, 20, 30], [40, 30, 35, 45]])
+    means = cache._box_means(tables, boxes)
+
+    for box, mean in zip(boxes, means):
+        x0, y0 = np.clip(box[:2], 0, None)
+        pixels = channels[y0:box[3], x0:box[2]].reshape(-1, 5)
+        expected = pixels.mean(axis=0) if len(pixels) else np.zeros(5)
+        np.testing.assert_allclose(mean, expected, rtol=1e-4, atol=1e-3)
+
+
+def test_downscaled_frames_are_cached_per_frame(frames):
+    cache = make_cache(time_window=1, analysis_scale=0.5)
+    gray = cache._analysis_gray(0, frames[0])
+    assert gray.shape == (60, 80)
+    assert cache._analysis_gray(0, frames[0]) is gray
+    assert cache._analysis_gray(None, frames[0]) is not gray
+
+    for fid in range(1, 6):
+        cache._analysis_gray(fid, frames[fid])
+    assert len(cache.gray_cache) == cache.gray_cache_size == 6
+    cache._analysis_gray(6, frames[0])
+    assert (0, (120, 160)) not in cache.gray_cache
+
+
+@pytest.mark.parametrize("backend", ["farneback", "lk"])
+def test_boxes_propagate_alike_at_the_analysis_scale(frames, backend):
+    results = Results()
+    results.append(Region(0, 0.25, 0.25, 0.25, 0.3, 0.9, "vehicle", 1.0))
+    results.append(Region(0, 0.5, 0.4, 0.3, 0.3, 0.9, "vehicle", 1.0))
+
+    predicted = {}
+    for scale in (1.0, 0.5):
+        cache = make_cache(motion_backend=backend, analysis_scale=scale)
+        predicted[scale] = cache.predict_bounding_boxes(
+            frames[0], frames[1], results, 1, threshold=255, expand_pixels=0,
+            prev_frame_id=0)
+
+    for full, scaled, region in zip(predicted[1.0].regions, predicted[0.5].regions,
+                                    results.regions):
+        assert full.x * 160 == pytest.approx(region.x * 160 + 3, abs=1)
+        assert full.y * 120 == pytest.approx(region.y * 120 + 2, abs=1)
+        assert scaled.x * 160 == pytest.approx(full.x * 160, abs=1)
+        assert scaled.y * 120 == pytest.approx(full.y * 120, abs=1)
+
+
+def blockwise_highlight(residual, threshold, block_size, region_size, expand_pixels):
+    # The original highlight_large_errors loop: per region, scan its blocks
+    # and mark the first one whose mean residual exceeds threshold
+    h, w = residual.shape[:2]
+    mask = np.zeros((h, w), dtype=np.uint8)
+    regions = []
+    for y in range(0, h, region_size):
+        for x in range(0, w, region_size):
+            blocks = [(by, bx) for by in range(y, min(y + region_size, h), block_size)
+                      for bx in range(x, min(x + region_size, w), block_size)]
+            for by, bx in blocks:
+                block = residual[by:by + block_size, bx:bx + block_size]
+                if np.mean(block) > threshold:
+                    mask[by:by + block_size, bx:bx + block_size] = 255
+                    expanded_x = max(0, x - expand_pixels)
+                    expanded_y = max(0, y - expand_pixels)
+                    regions.append((expanded_x / w, expanded_y / h,
+                                    min(region_size + 2 * expand_pixels, w - expanded_x) / w,
+                                    min(region_size + 2 * expand_pixels, h - expanded_y) / h))
+                    break
+    return mask, regions
+
+
+@pytest.mark.parametrize("shape, block_size, region_size", [
+    ((96, 128), 16, 32), ((101, 157), 16, 32), ((100, 150), 16, 40),
+    ((90, 70, 3), 10, 25), ((64, 64), 16, 16)])
+def test_highlight_matches_the_blockwise_loop(shape, block_size, region_size):
+    rng = np.random.default_rng(sum(shape))
+    residual = (rng.random(shape) ** 6 * 255).astype(np.uint8)
+    img = (rng.random(shape[:2]) * 255).astype(np.uint8)
+    expected_mask, expected_regions = blockwise_highlight(residual, 38, block_size,
+                                                          region_size, 7)
+    assert expected_regions
+
+    highlighted, mask, regions = make_cache().highlight_large_errors(
+        img, residual, 38, block_size, region_size, 3, expand_pixels=7)
+
+    assert highlighted is None
+    np.testing.assert_array_equal(mask, expected_mask)
+    assert [(r.fid, r.x, r.y, r.w, r.h) for r in regions] == \
+        [(3,) + region for region in expected_regions]
@@ -3,9 +3,11 @@ import logging
 import os
 import json
 import shutil
+import asyncio
+import functools
 from backend.server import Server
 from frontend.client_factory import ClientFactory
-from sd_utils import Results, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, read_results_dict
+from sd_utils import Results, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, CodecPool, read_results_dict
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 import time
 class InstanceStrategy(ABC):
@@ -26,66 +28,88 @@ class InstanceStrategy(ABC):
         return self.client.get_second_phase_results(vid_name)
 
     def analyze_video(self, vid_name, raw_images, enforce_iframes):
+        return asyncio.run(self.analyze_video_async(vid_name, raw_images, enforce_iframes))
+
+    async def analyze_video_async(self, vid_name, raw_images, enforce_iframes):
+        # The high query of a batch stays in flight while the following
+        # batches are encoded and sent; results are combined in batch order
+        loop = asyncio.get_running_loop()
         final_results = Results()
         all_required_regions = Results()
         low_phase_size = 0
         high_phase_size = 0
-        nframes = sum(map(lambda e: "jpg" in e, os.listdir(raw_images)))
-
+        nframes = get_images_length(raw_images)
         self.client.init_server(nframes)
 
+
+        lt = {}
+        batch_queries = []
+
         for i in range(0, nframes, self.config.batch_size):
             start_frame = i
             end_frame = min(nframes, i + self.config.batch_size)
             self.logger.info(f"Processing frames {start_frame} to {end_frame}")
 
 
+
             req_regions = Results()
             for fid in range(start_frame, end_frame):
                 req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.config.low_resolution))
-            batch_video_size, _ = compute_regions_size(
+
+            batch_video_size, _ = await loop.run_in_executor(None, functools.partial(
+                compute_regions_size,
                 req_regions, f"{vid_name}-base-phase", raw_images,
-                self.config.low_resolution, self.config.low_qp,
-                enforce_iframes, True)
+                self.config.low_resolution, self.config.low_qp, enforce_iframes, True))
+
             low_phase_size += batch_video_size
-            self.logger.info(f"{batch_video_size / 1024}KB sent in base phase."
+            self.logger.info(f"{batch_video_size / 1024}KB sent in base phase. "
                              f"Using QP {self.config.low_qp} and "
                              f"Resolution {self.config.low_resolution}.")
-            results, rpn_regions = self.get_first_phase_results(vid_name)
-            final_results.combine_results(
-                results, self.config.intersection_threshold)
-            all_required_regions.combine_results(
-                rpn_regions, self.config.intersection_threshold)
 
 
+
+
+            results, rpn_regions = await self.client.get_first_phase_results_async(vid_name, start_frame)
+            all_required_regions.combine_results(rpn_regions, self.config.intersection_threshold)
+
+
+            high_query = None
             if len(rpn_regions) > 0:
-                batch_video_size, _ = compute_regions_size(
+                batch_video_size, _ = await loop.run_in_executor(None, functools.partial(
+                    compute_regions_size,
                     rpn_regions, vid_name, raw_images,
-                    self.config.high_resolution, self.config.high_qp,
-                    enforce_iframes, True)
+                    self.config.high_resolution, self.config.high_qp, enforce_iframes, True))
+
                 high_phase_size += batch_video_size
-                self.logger.info(f"{batch_video_size / 1024}KB sent in second "
-                                 f"phase. Using QP {self.config.high_qp} and "
+                self.logger.info(f"{batch_video_size / 1024}KB sent in second phase. "
+                                 f"Using QP {self.config.high_qp} and "
                                  f"Resolution {self.config.high_resolution}.")
-                results = self.get_second_phase_results(vid_name)
-                final_results.combine_results(
-                    results, self.config.intersection_threshold)
 
 
-            cleanup(vid_name, self.config.debug_mode, start_frame, end_frame)
+                high_query = asyncio.ensure_future(
+                    self.client.get_second_phase_results_async(vid_name, start_frame))
+            batch_queries.append((results, high_query))
+
+
+            cleanup(vid_name, False, start_frame, end_frame)
+
+        for results, high_query in batch_queries:
+            final_results.combine_results(results, self.config.intersection_threshold)
+            if high_query is not None:
+                final_results.combine_results(await high_query, self.config.intersection_threshold)
+        await self.client.close_async()
+
 
         self.logger.info(f"Merging results")
-        final_results = merge_boxes_in_results(
-            final_results.regions_dict, 0.3, 0.3)
+        final_results = merge_boxes_in_results(final_results.regions_dict, 0.3, 0.3)
         self.logger.info(f"Writing results for {vid_name}")
         final_results.fill_gaps(nframes)
+        final_results.combine_results(all_required_regions, self.config.intersection_threshold)
+        final_results.write(f"{vid_name}")
 
-        final_results.combine_results(
-            all_required_regions, self.config.intersection_threshold)
 
-        final_results.write(f"{vid_name}")
 
-        return final_results, (low_phase_size, high_phase_size)
+        return final_results, (low_phase_size, high_phase_size), lt
 
     def analyze_video_mpeg(self, video_name, raw_images_path, enforce_iframes):
         number_of_frames = len([f for f in os.listdir(raw_images_path) if ".jpg" in f])
@@ -102,39 +126,44 @@ class InstanceStrategy(ABC):
         }
         start_time = time.time()
 
-        for i in range(0, number_of_frames, self.config.batch_size):
-            start_frame = i
-            end_frame = min(number_of_frames, i + self.config.batch_size)
+        # The base phase encode and decode of the next batch run in the codec
+        # pool while the current batch is being detected
+        with CodecPool(self.config.get("codec_workers", 2)) as codec_pool:
+            def submit_batch(start_frame, end_frame):
+                req_regions = Results()
+                for fid in range(start_frame, end_frame):
+                    req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.config.low_resolution))
+                return codec_pool.transcode_regions(
+                    req_regions, raw_images_path, self.config.low_resolution,
+                    self.config.low_qp, enforce_iframes)
 
+            batches = [(i, min(number_of_frames, i + self.config.batch_size))
+                       for i in range(0, number_of_frames, self.config.batch_size)]
+            pending = submit_batch(*batches[0]) if batches else None
+            for idx, (start_frame, end_frame) in enumerate(batches):
+                transcoded_batch = pending
+                if idx + 1 < len(batches):
+                    pending = submit_batch(*batches[idx + 1])
 
+                batch_fnames = sorted([f"{str(fid).zfill(8)}.jpg" for fid in range(start_frame, end_frame)])
 
-            batch_fnames = sorted([f"{str(idx).zfill(8)}.jpg" for idx in range(start_frame, end_frame)])
+                batch_video_size, batch_frames = transcoded_batch.result()
 
-            req_regions = Results()
-            for fid in range(start_frame, end_frame):
-                req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.config.low_resolution))
 
-            batch_video_size, _ = compute_regions_size(
-                req_regions, f"{video_name}-base-phase", raw_images_path,
-                self.config.low_resolution, self.config.low_qp, enforce_iframes, True)
 
+                self.logger.info(f"{batch_video_size / 1024}KB sent in base phase using {self.config.low_qp}QP")
 
+                results, rpn_results = self.server.perform_detection(
+                    f"{video_name}-base-phase-cropped", self.config.low_resolution, batch_fnames,
+                    batch_frames)
 
-            self.logger.info(f"{batch_video_size / 1024}KB sent in base phase using {self.config.low_qp}QP")
+                self.logger.info(
+                    f"Detection {len(results)} regions for batch {start_frame} to {end_frame} with a total size of {batch_video_size / 1024}KB")
 
-            extract_images_from_video(f"{video_name}-base-phase-cropped", req_regions)
-            results, rpn_results = self.server.perform_detection(
-                f"{video_name}-base-phase-cropped", self.config.low_resolution, batch_fnames)
-
-            self.logger.info(
-                f"Detection {len(results)} regions for batch {start_frame} to {end_frame} with a total size of {batch_video_size / 1024}KB")
-
-            final_results.combine_results(results, self.config.intersection_threshold)
-            final_rpn_results.combine_results(rpn_results, self.config.intersection_threshold)
+                final_results.combine_results(results, self.config.intersection_threshold)
+                final_rpn_results.combine_results(rpn_results, self.config.intersection_threshold)
 
-            # Remove encoded video manually
-            shutil.rmtree(f"{video_name}-base-phase-cropped")
-            total_size += batch_video_size
+                total_size += batch_video_size
 
         final_results = merge_boxes_in_results(final_results.regions_dict, 0.3, 0.3)
         final_results.fill_gaps(number_of_frames)
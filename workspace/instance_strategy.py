@@ -5,7 +5,7 @@ import json
 import shutil
 from backend.server import Server
 from frontend.client_factory import ClientFactory
-from sd_utils import Results, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, read_results_dict
+from sd_utils import Results, ColumnarResults, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, read_results_dict
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 from workspace.base_instance_strategy import InstanceStrategy
 from workspace.streamduet_RoI_strategy import StreamDuetRoIStrategy
@@ -50,14 +50,14 @@ class DDSStrategy(InstanceStrategy):
 
     def analyze_video_emulate(self, video_name, high_images_path,
                               enforce_iframes, low_results_path=None, debug_mode=False):
-        final_results = Results()
-        low_phase_results = Results()
-        high_phase_results = Results()
+        final_results = ColumnarResults()
+        low_phase_results = ColumnarResults()
+        high_phase_results = ColumnarResults()
         number_of_frames = get_images_length(high_images_path)
 
         low_results_dict = None
         if low_results_path:
-            low_results_dict = read_results_dict(low_results_path)
+            low_results_dict = read_results_dict(low_results_path, self.config.get("results_cache_dir"))
 
         total_size = [0, 0]
         total_regions_count = 0
@@ -125,15 +125,11 @@ class DDSStrategy(InstanceStrategy):
 
         final_results.fill_gaps(number_of_frames)
 
-
-        final_results.write(f"{video_name}")
-
         self.logger.info(f"Writing results for {video_name}")
         self.logger.info(
             f"{len(final_results)} objects detected and {total_size[1]} total size of regions sent in high resolution")
 
-        rdict = read_results_dict(f"{video_name}")
-        final_results = merge_boxes_in_results(rdict, 0.3, 0.3)
+        final_results = merge_boxes_in_results(final_results.regions_dict, 0.3, 0.3)
 
         final_results.fill_gaps(number_of_frames)
         final_results.write(f"{video_name}")
@@ -142,75 +138,6 @@ class DDSStrategy(InstanceStrategy):
         return final_results, total_size, lt
 
 
-    def analyze_video(self, vid_name, raw_images, config, enforce_iframes):
-        final_results = Results()
-        all_required_regions = Results()
-        low_phase_size = 0
-        high_phase_size = 0
-        nframes = list_frames(raw_images)
-        self.client.init_server(nframes)
-
-
-        lt = {}
-
-        for i in range(0, nframes, self.config.batch_size):
-            start_frame = i
-            end_frame = min(nframes, i + self.config.batch_size)
-            self.logger.info(f"Processing frames {start_frame} to {end_frame}")
-
-
-
-            req_regions = Results()
-            for fid in range(start_frame, end_frame):
-                req_regions.append(Region(fid, 0, 0, 1, 1, 1.0, 2, self.config.low_resolution))
-
-            batch_video_size, _ = compute_regions_size(
-                req_regions, f"{vid_name}-base-phase", raw_images,
-                self.config.low_resolution, self.config.low_qp, enforce_iframes, True)
-
-            low_phase_size += batch_video_size
-            self.logger.info(f"{batch_video_size / 1024}KB sent in base phase. "
-                             f"Using QP {self.config.low_qp} and "
-                             f"Resolution {self.config.low_resolution}.")
-
-
-
-
-            results, rpn_regions = self.get_first_phase_results(vid_name)
-            final_results.combine_results(results, self.config.intersection_threshold)
-            all_required_regions.combine_results(rpn_regions, self.config.intersection_threshold)
-
-
-            if len(rpn_regions) > 0:
-                batch_video_size, _ = compute_regions_size(
-                    rpn_regions, vid_name, raw_images,
-                    self.config.high_resolution, self.config.high_qp, enforce_iframes, True)
-
-                high_phase_size += batch_video_size
-                self.logger.info(f"{batch_video_size / 1024}KB sent in second phase. "
-                                 f"Using QP {self.config.high_qp} and "
-                                 f"Resolution {self.config.high_resolution}.")
-
-
-                results = self.get_second_phase_results(vid_name)
-                final_results.combine_results(results, self.config.intersection_threshold)
-
-
-            cleanup(vid_name, False, start_frame, end_frame)
-
-
-        self.logger.info(f"Merging results")
-        final_results = merge_boxes_in_results(final_results.regions_dict, 0.3, 0.3)
-        self.logger.info(f"Writing results for {vid_name}")
-        final_results.fill_gaps(nframes)
-        final_results.combine_results(all_required_regions, self.config.intersection_threshold)
-        final_results.write(f"{vid_name}")
-
-
-
-        return final_results, (low_phase_size, high_phase_size), lt
-
-
 
 class StrategyFactory:
     @staticmethod
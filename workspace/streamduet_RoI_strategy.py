@@ -6,9 +6,10 @@ import shutil
 import cv2
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor
 from backend.server import Server
 from frontend.client_factory import ClientFactory
-from sd_utils import Results, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, read_results_dict
+from sd_utils import Results, ColumnarResults, Region, compute_regions_size, merge_boxes_in_results, cleanup, extract_images_from_video, read_results_dict
 from streamduet_utils import list_frames,get_images_length,get_image_extension
 from workspace.base_instance_strategy import InstanceStrategy
 from backend.roi_cache_server import RoICacheServer
@@ -42,113 +43,159 @@ class StreamDuetRoIStrategy(InstanceStrategy):
             frame_path = os.path.join(self.config.high_images_path, f"{fid:08d}.jpg")
             total_size += os.path.getsize(frame_path)
         return total_size
+    def prefetch_frames(self, high_images_path, start_fid, end_fid):
+        # Frames of a batch plus the two after it read by the RoI triplets
+        for fid in range(start_fid, min(end_fid + 2, get_images_length(high_images_path))):
+            self.client.frame_store.read(os.path.join(high_images_path, f"{fid:08d}.jpg"))
+
     def analyze_video_emulate(self, video_name, high_images_path,
                               enforce_iframes, low_results_path=None, debug_mode=False):
-        final_results = Results()
-        low_phase_results = Results()
-        high_phase_results = Results()
+        final_results = ColumnarResults()
+        low_phase_results = ColumnarResults()
+        high_phase_results = ColumnarResults()
         number_of_frames = get_images_length(high_images_path)
 
         low_results_dict = None
         if low_results_path:
-            low_results_dict = read_results_dict(low_results_path)
+            low_results_dict = read_results_dict(low_results_path, self.config.get("results_cache_dir"))
 
         total_size = [0, 0]
         total_regions_count = 0
+        lt = {
+            'transmission': 0,
+            'roi_prediction': 0,
+            'inference_reuse': 0,
+            'inference_sharing': 0,
+            'total_time': 0
+        }
+        start_time = time.time()
+
+        # Batch N+1 can only be predicted once batch N is in the RoI cache,
+        # so frame loading is the only stage overlapped: the next batch's
+        # frames are read into the frame store, which RoIClient sizes to
+        # hold both batches, while the current batch runs
+        batches = [(i, min(number_of_frames, i + self.config.batch_size))
+                   for i in range(0, number_of_frames, self.config.batch_size)]
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            prefetch = prefetcher.submit(self.prefetch_frames, high_images_path, *batches[0]) if batches else None
+
+            for idx, (start_fid, end_fid) in enumerate(batches):
+                batch_start = time.time()
+                self.logger.info(f"Processing batch from {start_fid} to {end_fid}")
+                prefetch.result()
+                if idx + 1 < len(batches):
+                    prefetch = prefetcher.submit(self.prefetch_frames, high_images_path, *batches[idx + 1])
+
+                stage_start = time.time()
+                for fid in range(start_fid, end_fid):
+                    current_frame_image = self.client.frame_store.read(os.path.join(high_images_path, f"{fid:08d}.jpg"))
+                    frame_base_req_regions, frame_final_results = self.client.roi_cache.process_frame(fid,
+                                                                                                      current_frame_image)
+                    final_results.combine_results(frame_final_results, self.config.intersection_threshold)
 
-        for i in range(0, number_of_frames, self.config.batch_size):
-            start_fid = i
-            end_fid = min(number_of_frames, i + self.config.batch_size)
-            self.logger.info(f"Processing batch from {start_fid} to {end_fid}")
-
-            n = 5
-            selected_fids = np.linspace(start_fid, end_fid - 1, n, dtype=int)
-
-            base_req_regions_res = Results()
-            for fid in range(start_fid, end_fid):
-                current_frame_image = cv2.imread(os.path.join(high_images_path, f"{fid:08d}.jpg"))
-                frame_base_req_regions, frame_final_results = self.client.roi_cache.process_frame(fid,
-                                                                                                  current_frame_image)
-                final_results.combine_results(frame_final_results, self.config.intersection_threshold)
-
-
-            low_images_path = f"{video_name}-base-phase-cropped"
 
+                low_images_path = f"{video_name}-base-phase-cropped"
 
 
-            base_req_regions_res = Results()
-            base_roi_regions, _ = self.client.roi_cache.base_req_regions_res(
-                high_images_path, start_fid, end_fid, final_results, large_block_width=32,
-                large_block_height=32, n=5)
-            current_bandwidth = 0
-            if hasattr(self, 'network_monitor'):
 
-                current_bandwidth = self.get_current_bandwidth()
-                block_size = self.get_block_size(start_fid, end_fid)
-                self.config.low_qp,self.config.high_qp, self.config.low_resolution = self.adjust_encoding_parameters(current_bandwidth, block_size)
+                base_req_regions_res = Results()
+                base_roi_regions, _ = self.client.roi_cache.base_req_regions_res(
+                    high_images_path, start_fid, end_fid, final_results, large_block_width=32,
+                    large_block_height=32, n=5)
+                current_bandwidth = 0
+                if hasattr(self, 'network_monitor'):
 
-            for reg in base_roi_regions:
-                x, y, w, h = reg.x, reg.y, reg.w, reg.h
-                for fid in range(start_fid, end_fid):
-                    base_req_regions_res.append(Region(fid, x, y, w, h, 1.0, 2, self.config.low_resolution))
+                    current_bandwidth = self.get_current_bandwidth()
+                    block_size = self.get_block_size(start_fid, end_fid)
+                    self.config.low_qp,self.config.high_qp, self.config.low_resolution = self.adjust_encoding_parameters(current_bandwidth, block_size)
 
+                for reg in base_roi_regions:
+                    x, y, w, h = reg.x, reg.y, reg.w, reg.h
+                    for fid in range(start_fid, end_fid):
+                        base_req_regions_res.append(Region(fid, x, y, w, h, 1.0, 2, self.config.low_resolution))
+                roi_prediction_time = time.time() - stage_start
 
 
 
-            encoded_batch_video_size, batch_pixel_size = compute_regions_size(
-                base_req_regions_res, f"{video_name}-base-phase", high_images_path,
-                self.config.low_resolution, self.config.low_qp, enforce_iframes, True)
+                stage_start = time.time()
+                encoded_batch_video_size, batch_pixel_size = compute_regions_size(
+                    base_req_regions_res, f"{video_name}-base-phase", high_images_path,
+                    self.config.low_resolution, self.config.low_qp, enforce_iframes, True,
+                    self.client.frame_store)
+                transmission_time = time.time() - stage_start
 
 
-            self.logger.info(f"Sent {encoded_batch_video_size / 1024} in base phase")
-            total_size[0] += encoded_batch_video_size
+                self.logger.info(f"Sent {encoded_batch_video_size / 1024} in base phase")
+                total_size[0] += encoded_batch_video_size
 
-            r1, req_regions = self.server.simulate_low_query(
-                start_fid, end_fid, low_images_path, low_results_dict, video_name, False,
-                self.config.rpn_enlarge_ratio)
-            total_regions_count += len(req_regions)
+                stage_start = time.time()
+                r1, req_regions = self.server.simulate_low_query(
+                    start_fid, end_fid, low_images_path, low_results_dict, video_name, False,
+                    self.config.rpn_enlarge_ratio)
+                total_regions_count += len(req_regions)
 
-            low_phase_results.combine_results(r1, self.config.intersection_threshold)
-            final_results.combine_results(r1, self.config.intersection_threshold)
+                low_phase_results.combine_results(r1, self.config.intersection_threshold)
+                final_results.combine_results(r1, self.config.intersection_threshold)
+                inference_reuse_time = time.time() - stage_start
 
-            if len(req_regions) > 0:
-                regions_size, _ = compute_regions_size(
-                    req_regions, video_name, high_images_path,
-                    self.config.high_resolution, self.config.high_qp,
-                    enforce_iframes, True)
-                self.logger.info(
-                    f"Sent {len(req_regions)} regions which have {regions_size / 1024}KB in second phase using {self.config.high_qp}")
-                total_size[1] += regions_size
+                inference_sharing_time = 0
+                if len(req_regions) > 0:
+                    stage_start = time.time()
+                    regions_size, _ = compute_regions_size(
+                        req_regions, video_name, high_images_path,
+                        self.config.high_resolution, self.config.high_qp,
+                        enforce_iframes, True, self.client.frame_store)
+                    self.logger.info(
+                        f"Sent {len(req_regions)} regions which have {regions_size / 1024}KB in second phase using {self.config.high_qp}")
+                    total_size[1] += regions_size
+                    transmission_time += time.time() - stage_start
 
 
-                inference_sharing_start = time.time()
+                    inference_sharing_start = time.time()
 
-                r2 = self.server.simulate_high_query(video_name, low_images_path, req_regions)
-                self.logger.info(f"Got {len(r2)} results in second phase of batch")
+                    r2 = self.server.simulate_high_query(video_name, low_images_path, req_regions)
+                    self.logger.info(f"Got {len(r2)} results in second phase of batch")
 
-                high_phase_results.combine_results(r2, self.config.intersection_threshold)
-                final_results.combine_results(r2, self.config.intersection_threshold)
+                    high_phase_results.combine_results(r2, self.config.intersection_threshold)
+                    final_results.combine_results(r2, self.config.intersection_threshold)
 
 
-                lt['inference_sharing'] = time.time() - inference_sharing_start
+                    inference_sharing_time = time.time() - inference_sharing_start
 
 
-            self.client.roi_cache.update_cache(start_fid, end_fid, final_results, high_images_path)
-            cleanup(video_name, debug_mode, start_fid, end_fid)
+                stage_start = time.time()
+                self.client.roi_cache.update_cache(start_fid, end_fid, final_results, high_images_path)
+                cleanup(video_name, debug_mode, start_fid, end_fid)
+                roi_prediction_time += time.time() - stage_start
 
+                batch_latency = time.time() - batch_start
+                lt['transmission'] += transmission_time
+                lt['roi_prediction'] += roi_prediction_time
+                lt['inference_reuse'] += inference_reuse_time
+                lt['inference_sharing'] += inference_sharing_time
+                self.logger.info(
+                    f"Batch {start_fid}-{end_fid} took {batch_latency:.3f}s "
+                    f"({(end_fid - start_fid) / batch_latency:.1f} frames/s): "
+                    f"roi prediction {roi_prediction_time:.3f}s, encoding {transmission_time:.3f}s, "
+                    f"low query {inference_reuse_time:.3f}s, high query {inference_sharing_time:.3f}s")
+
+        lt['total_time'] = time.time() - start_time
+        if lt['total_time'] > 0:
+            self.logger.info(f"Processed {number_of_frames} frames at "
+                             f"{number_of_frames / lt['total_time']:.1f} frames/s")
+        frame_stats = self.client.frame_store.stats()
+        self.logger.info(f"Frame store served {frame_stats['hits']} hits and {frame_stats['misses']} misses")
+        flow_stats = self.client.roi_cache.flow_stats()
+        self.logger.info(f"Flow cache served {flow_stats['hits']} hits and {flow_stats['misses']} misses")
 
         final_results.fill_gaps(number_of_frames)
-        final_results.write(f"{video_name}")
-
-        rdict = read_results_dict(f"{video_name}")
-        final_results = merge_boxes_in_results(rdict, 0.3, 0.3)
+        final_results = merge_boxes_in_results(final_results.regions_dict, 0.3, 0.3)
 
         final_results.fill_gaps(number_of_frames)
         final_results.write(f"{video_name}")
 
 
 
-        lt={}
         return final_results, total_size, lt
 
     def adjust_encoding_parameters(self, current_bandwidth, block_size):